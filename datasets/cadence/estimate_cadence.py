@@ -0,0 +1,112 @@
+import os
+import re
+import sys
+import numpy as np
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "software"))
+from session_loader import SessionLoader
+from PhasePairer import PhasePairer, DEGREES_PER_COUNT
+from CadenceEstimator import CadenceEstimator
+from Resampler import Resampler
+from phase_calculation_functions import fold_phase_difference
+
+# resampling rate of the differential phase (Hz), largest gap between reads (ms) and
+# length of the DFT window (s), as RESAMPLE_RATE / RESAMPLE_MAX_GAP / CADENCE_WINDOW
+# of the live GUI
+rate = 20
+max_gap = 1000
+window = 20.0
+min_freq = 0.1
+max_freq = 5.0
+
+cwd = os.getcwd()
+mat_dir = os.path.join(cwd, "..", "cdf", "data")
+# sessions are decoded once into NumPy sidecars and served from them afterwards
+session_loader = SessionLoader(os.path.join(cwd, ".session_cache"))
+
+def expected_frequency(file_path):
+    """
+    Stimulus rate encoded in a session name, "o" standing for the decimal point:
+    "2hz" -> 2.0, "1o2hz" -> 1.2, "o5hz" -> 0.5
+    """
+    match = re.search(r"_(\d*)(?:o(\d+))?hz", os.path.basename(file_path))
+    return float((match.group(1) or "0") + "." + (match.group(2) or "0"))
+
+def differential_phase(file_1, file_2):
+    """
+    Pairs the reads of the two tags of a session per channel (PhasePairer), returns the
+    read times (ms) and the absolute folded differential phase (degrees)
+    """
+    rfs = [session_loader.load(file_path)[0] for file_path in (file_1, file_2)]
+    times = np.concatenate([rf['timestamps'] for rf in rfs]).astype(np.float64)
+    channels = np.concatenate([rf['channels'] for rf in rfs]).astype(np.int64)
+    # back to 12-bit counts, the unwrapping of the stored phases is undone by the fold
+    counts = np.concatenate([rf['raw_phases'] % 360 for rf in rfs]) / DEGREES_PER_COUNT
+    tags = np.repeat([0, 1], [len(rf['timestamps']) for rf in rfs])
+
+    order = np.argsort(times, kind='stable')
+    estimates = PhasePairer().update(tags[order], channels[order], times[order], counts[order])
+    paired = ~np.isnan(estimates)
+    return (times[order][paired], np.abs(fold_phase_difference(estimates[paired])))
+
+def estimate_cadence(times, diff_phase):
+    """
+    Streams the reads one second at a time through the resampler and the sliding DFT, as
+    the live GUI does, returns the times (s) and (frequency, amplitude) estimates once the
+    window is full
+    """
+    resampler = Resampler(rate, "linear", max_gap)
+    estimator = CadenceEstimator(rate, window, min_freq, max_freq)
+    estimate_times, estimates = [], []
+    bounds = np.searchsorted(times, np.arange(times[0], times[-1] + 1000, 1000))
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        # the gaps (nan) restart the DFT window
+        grid, samples, _ = resampler.update(times[start:stop], diff_phase[start:stop])
+        estimator.update(samples)
+        if estimator.ready and len(grid):
+            estimate_times.append((grid[-1] - times[0]) / 1000)
+            estimates.append(estimator.estimate())
+    return (np.array(estimate_times), np.array(estimates).reshape(-1, 2))
+
+def main():
+    files = sorted(f for f in os.listdir(mat_dir) if f.endswith(".mat") and "_diff" not in f)
+
+    expected, measured = [], []
+    plt.figure()
+    for f in files:
+        file_1 = os.path.join(mat_dir, f)
+        file_2 = os.path.join(mat_dir, f.replace(".mat", "_diff.mat"))
+        if not os.path.exists(file_2):
+            continue
+        estimate_times, estimates = estimate_cadence(*differential_phase(file_1, file_2))
+        if not len(estimates):
+            print(f"{f}: shorter than the {window} s window")
+            continue
+        frequency = np.median(estimates[:, 0])
+        print(f"{f}: expected {expected_frequency(f):.2f} Hz, estimated {frequency:.2f} Hz "
+              f"(amplitude {np.median(estimates[:, 1]):.1f} deg)")
+        expected.append(expected_frequency(f))
+        measured.append(frequency)
+        plt.plot(estimate_times, estimates[:, 0], alpha=0.3)
+
+    plt.title("Live cadence estimates")
+    plt.xlabel("Time (s)")
+    plt.ylabel("Dominant frequency (Hz)")
+    plt.grid(True)
+
+    plt.figure()
+    plt.scatter(expected, measured)
+    plt.plot([0, max_freq], [0, max_freq], 'r--', label="y = x")
+    plt.title("Cadence of the step exercises")
+    plt.xlabel("Stimulus rate (Hz)")
+    plt.ylabel("Estimated frequency (Hz)")
+    plt.grid(True)
+    plt.legend()
+    plt.savefig('cadence.png')
+
+    plt.show()
+
+if __name__ == "__main__":
+    main()
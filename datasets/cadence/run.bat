@@ -0,0 +1,3 @@
+set PYTHON_DIR=%~dp0python_embed
+
+%PYTHON_DIR%\python.exe estimate_cadence.py
\ No newline at end of file
@@ -0,0 +1,3 @@
+source py-zeta/bin/activate
+
+python estimate_cadence.py
\ No newline at end of file
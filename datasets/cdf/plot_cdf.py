@@ -1,16 +1,25 @@
 import numpy as np
-import scipy
 import os
+import sys
 from fastdtw import fastdtw
 import matplotlib.pyplot as plt
 from collections import defaultdict
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from dtw_cache import DTWCache, apply_warp_path
+from session_loader import SessionLoader
+from quantile_sketch import QuantileSketch
+
 # select the type of CDF that has to be plotted here
 # typ = "dmrt"
 typ = "phase"
 
 cwd = os.getcwd()
 mat_dir = os.path.join(cwd,"data")
+# warp paths are cached across runs, keyed by file content and DTW parameters
+dtw_cache = DTWCache(os.path.join(cwd, ".dtw_cache"))
+# sessions are decoded once into NumPy sidecars and served from them afterwards
+session_loader = SessionLoader(os.path.join(cwd, ".session_cache"))
 
 def pair_files(files):
     # Dictionary to hold base names and their associated files
@@ -31,8 +40,9 @@ def pair_files(files):
 files = [os.path.join(mat_dir,f) for f in os.listdir(mat_dir) if os.path.isfile(os.path.join(mat_dir, f))]
 files = pair_files(files)
 
-dzt = []
-cotag = []
+# differential values are streamed per file into bounded-memory quantile sketches
+dzt = QuantileSketch(seed=0)
+cotag = QuantileSketch(seed=0)
 
 # Function to clean phases and fix phase shifts
 def clean_phases(phase_list):
@@ -58,24 +68,12 @@ def extract_phase_data(file_path):
     Extract phase data in degrees from the .mat file and
     segregate it channel wise
     """
-    data = scipy.io.loadmat(file_path)
-    if "diff" not in file_path:
-        phases = data['raw_phases'][0]
-        channels = data['channels'][0]
-    else:
-        phases = data['raw_phases_diff'][0]
-        channels = data['channels_diff'][0]
-    phase_data_by_channel = {}
-    for i, channel in enumerate(channels):
-        if channel not in phase_data_by_channel:
-            phase_data_by_channel[channel] = []
-        phase_data_by_channel[channel].append(phases[i])
-
-    return phase_data_by_channel
+    return session_loader.load(file_path)[0].channel_wise()
 
-def get_phase_diff(phases_1, phases_2, raw):
+def get_phase_diff(phases_1, phases_2, raw, warp_paths=None):
     """
     Process all .mat files in a directory, calculate DTW distances, and generate a heatmap.
+    Precomputed `warp_paths` (channel -> DTW path) are used instead of running DTW when given.
     """
     sensed_phase = []
     common_channels = set(phases_1.keys()) & set(phases_2.keys())
@@ -87,6 +85,8 @@ def get_phase_diff(phases_1, phases_2, raw):
         if raw:
             # Plot raw cleaned phases if raw_flag is True
             aligned_phase_1, aligned_phase_2 = phase_1, phase_2
+        elif warp_paths is not None:
+            aligned_phase_1, aligned_phase_2 = apply_warp_path(phase_1, phase_2, warp_paths[channel])
         else:
             aligned_phase_1, aligned_phase_2 = dynamic_time_warp(phase_1, phase_2)
 
@@ -108,9 +108,7 @@ def get_phase_diff(phases_1, phases_2, raw):
     return sensed_phase
 
 def extract_rssi(file_path):
-    data = scipy.io.loadmat(file_path)
-    rssi = data['rssis'][0]
-    return np.array(rssi)
+    return session_loader.load(file_path)[0]['rssis']
 
 def get_dmrt(rssi_1, rssi_2):
     min_length = min(len(rssi_1), len(rssi_2))
@@ -127,31 +125,28 @@ for f in files:
         if typ == "phase":
             dzt_phases_1 = extract_phase_data(f[0])
             dzt_phases_2 = extract_phase_data(f[1])
-            dzt.extend(get_phase_diff(dzt_phases_1,dzt_phases_2,raw=False))
+            dzt_warp_paths = dtw_cache.warp_paths(f, dzt_phases_1, dzt_phases_2)
+            dzt.update(get_phase_diff(dzt_phases_1,dzt_phases_2,raw=False,warp_paths=dzt_warp_paths))
 
         if typ == "dmrt":
             dzt_rssi_1 = extract_rssi(f[0])
             dzt_rssi_2 = extract_rssi(f[1])
-            dzt.extend(get_dmrt(dzt_rssi_1,dzt_rssi_2))
+            dzt.update(get_dmrt(dzt_rssi_1,dzt_rssi_2))
     else:
         if typ == "phase":
             cot_phases_1 = extract_phase_data(f[0])
             cot_phases_2 = extract_phase_data(f[1])
-            cotag.extend(get_phase_diff(cot_phases_1,cot_phases_2,raw=True))
+            cotag.update(get_phase_diff(cot_phases_1,cot_phases_2,raw=True))
 
         if typ == "dmrt":
             cot_rssi_1 = extract_rssi(f[0])
             cot_rssi_2 = extract_rssi(f[1])
-            cotag.extend(get_dmrt(cot_rssi_1,cot_rssi_2))
+            cotag.update(get_dmrt(cot_rssi_1,cot_rssi_2))
 
-def plot_cdf(array_1, array_2):
-    # Sort the arrays to calculate CDF
-    sorted_array_1 = np.sort(array_1)
-    sorted_array_2 = np.sort(array_2)
-    
-    # Calculate the CDF values for each array
-    cdf_array_1 = np.arange(1, len(sorted_array_1)+1) / len(sorted_array_1)
-    cdf_array_2 = np.arange(1, len(sorted_array_2)+1) / len(sorted_array_2)
+def plot_cdf(sketch_1, sketch_2):
+    # Get the sorted values and their CDF from the sketches
+    sorted_array_1, cdf_array_1 = sketch_1.cdf_curve()
+    sorted_array_2, cdf_array_2 = sketch_2.cdf_curve()
     
     # Plotting the CDF for both arrays
     plt.figure()
@@ -162,11 +157,8 @@ def plot_cdf(array_1, array_2):
     plt.axhline(y=0.5, color='r', linestyle='--', label="y = 0.5")
 
     # Calculate the intercepts for both arrays where CDF is approximately 0.5
-    idx_1 = np.searchsorted(cdf_array_1, 0.5)  # Find index where CDF ~ 0.5 for array 1
-    intercept_x1 = sorted_array_1[idx_1]
-    
-    idx_2 = np.searchsorted(cdf_array_2, 0.5)  # Find index where CDF ~ 0.5 for array 2
-    intercept_x2 = sorted_array_2[idx_2]
+    intercept_x1 = sketch_1.quantile(0.5)
+    intercept_x2 = sketch_2.quantile(0.5)
     
     # Plot and annotate the intercepts
     plt.scatter([intercept_x1], [0.5], color='blue')
@@ -1,11 +1,15 @@
 import os
 import re
-import json
+import sys
 import numpy as np
 from fastdtw import fastdtw
 import matplotlib.pyplot as plt
-from sklearn.metrics import confusion_matrix
-from sklearn.utils.multiclass import unique_labels
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "software"))
+from dtw_cache import DTWCache, apply_warp_path
+from session_loader import SessionLoader
+from classification_functions import threshold_edges, classify, compute_confusion_matrix, compute_percentage_matrix
 
 # Select sensor to plot confusion matrix for 
 # sensor = "photo"
@@ -41,11 +45,14 @@ def clean_phase_difference(phase_difference):
                 phase_difference[channel][i] = abs(diff_list[i] - 180)
     return phase_difference
 
-def phase_resolution(phase_data):
+def phase_resolution(phase_data, warp_paths=None):
     channel_wise_warped_phases = {}
     for i in range(1, 51):
         try:
-            warped_rf1, warped_rf2 = dtw_matching(phase_data[0][i], phase_data[1][i])
+            if warp_paths is None:
+                warped_rf1, warped_rf2 = dtw_matching(phase_data[0][i], phase_data[1][i])
+            else:
+                warped_rf1, warped_rf2 = apply_warp_path(phase_data[0][i], phase_data[1][i], warp_paths[i])
             channel_wise_warped_phases[i] = [warped_rf1, warped_rf2]
         except Exception as e:
             pass
@@ -73,38 +80,6 @@ configs = {
 
 environment = configs[sensor]['classification']
 
-def classifier(environment_phase_data):
-    categorized_data = {}
-    for env,phases in environment_phase_data.items():
-        for phase_diff in phases:
-            for category,threshold in environment.items():
-                if phase_diff < threshold:
-                    try:
-                        categorized_data[env].append(category)
-                    except:
-                        categorized_data[env] = [category]
-                    break
-
-    expected_categorization = []
-    actual_categorization = []
-
-    for env,categorized_values in categorized_data.items():
-        for category in categorized_values:
-            expected_categorization.append(env)
-            actual_categorization.append(category)
-    
-    return (expected_categorization, actual_categorization)
-
-def compute_percentage_matrix(matrix):
-    perc_matrix = []
-    for row in matrix:
-        perc_row = []
-        sum = np.sum(row)
-        for val in row:
-            perc_row.append((val / sum) * 100)
-        perc_matrix.append(perc_row)
-    return perc_matrix
-    
 def print_confusion_matrix(matrix):
     for row in matrix:
         for value in row:
@@ -113,6 +88,10 @@ def print_confusion_matrix(matrix):
 
 cwd = os.getcwd()
 data_path = os.path.join(cwd, "data")
+# warp paths are cached across runs, keyed by file content and DTW parameters
+dtw_cache = DTWCache(os.path.join(cwd, ".dtw_cache"))
+# sessions are decoded once into NumPy sidecars and served from them afterwards
+session_loader = SessionLoader(os.path.join(cwd, ".session_cache"))
 regex_strings = []
 for env in environment:
     rgx = fr".*?{env}.*?\d+?.json"
@@ -128,40 +107,43 @@ for rgx in regex_strings:
 
 classification_data = {}
 for file in data_files:
-    with open(os.path.join(data_path, file), 'r') as f:
-        data = json.load(f)
-        rf1 = data[0]
-        rf2 = data[1]
-    rf1 = {int(key): value for key, value in rf1.items()}  
-    rf2 = {int(key): value for key, value in rf2.items()}
-    data = [rf1, rf2]
+    file_path = os.path.join(data_path, file)
+    data = [rf.channel_wise() for rf in session_loader.load(file_path)]
 
     for env in environment:
         if env in file:
             try:
-                classification_data[env].append(data)
+                classification_data[env].append((file_path, data))
             except:
-                classification_data[env] = [data]
+                classification_data[env] = [(file_path, data)]
 
 environment_phase_data = {}
 for env,data in classification_data.items():
-    for read in data:
-        phase_diff = clean_phase_difference(phase_difference(phase_resolution(read)))
+    for file_path, read in data:
+        warp_paths = dtw_cache.warp_paths((file_path,), read[0], read[1])
+        phase_diff = clean_phase_difference(phase_difference(phase_resolution(read, warp_paths)))
         phase_diff = [diff for sublist in phase_diff.values() for diff in sublist]
         try:
             environment_phase_data[env].extend(phase_diff)
         except:
             environment_phase_data[env] = phase_diff
 
-(expected_categorization, actual_categorization) = classifier(environment_phase_data)
+labels, edges = threshold_edges(environment)
+expected_categorization = np.concatenate([np.full(len(phases), labels.index(env))
+                                          for env, phases in environment_phase_data.items()])
+actual_categorization = np.concatenate([classify(phases, edges)
+                                        for phases in environment_phase_data.values()])
 
-cm = confusion_matrix(expected_categorization, actual_categorization)
+cm = compute_confusion_matrix(expected_categorization, actual_categorization, len(labels))
+# order the classes alphabetically
+order = np.argsort(labels)
+cm = cm[np.ix_(order, order)]
+classes = np.array(labels)[order]
 
-perc_confusion_matrix = np.array(compute_percentage_matrix(cm))
+perc_confusion_matrix = compute_percentage_matrix(cm)
 
 # Plot confusion matrix with labels
 fig, ax = plt.subplots()
-classes = unique_labels(expected_categorization, actual_categorization)
 im = ax.imshow(cm, interpolation='nearest', cmap=plt.cm.Blues)
 ax.figure.colorbar(im, ax=ax)
 ax.set(xticks=np.arange(cm.shape[1]),
@@ -183,7 +165,6 @@ plt.savefig(f'{sensor}_cm.png', format='png', dpi=300)
 
 # Plot percentage confusion matrix with labels
 fig, ax = plt.subplots()
-classes = unique_labels(expected_categorization, actual_categorization)
 im = ax.imshow(perc_confusion_matrix, interpolation='nearest', cmap=plt.cm.Reds)
 ax.figure.colorbar(im, ax=ax)
 ax.set(xticks=np.arange(perc_confusion_matrix.shape[1]),
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import zipfile
+import hashlib
+import numpy as np
+from fastdtw import fastdtw
+
+# bump whenever the layout of a cache entry or the alignment itself changes,
+# every older entry then stops matching and is evicted by the LRU
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+HASH_BLOCK_SIZE = 1 << 20
+
+def apply_warp_path(sequence1, sequence2, warp_path):
+    """
+    Warps two sequences along a DTW path.
+
+    Parameters:
+    - sequence1 (list): The first sequence.
+    - sequence2 (list): The second sequence.
+    - warp_path (ndarray): (N, 2) array of index pairs as returned by `fastdtw`.
+
+    Returns:
+    - warped_sequence1 (ndarray): The warped sequence 1.
+    - warped_sequence2 (ndarray): The warped sequence 2.
+    """
+    warp_path = np.asarray(warp_path, dtype=np.intp).reshape(-1, 2)
+    warped_sequence1 = np.asarray(sequence1)[warp_path[:, 0]]
+    warped_sequence2 = np.asarray(sequence2)[warp_path[:, 1]]
+
+    return (warped_sequence1, warped_sequence2)
+
+class DTWCache:
+    """
+    On-disk, content-addressed cache of channel-wise DTW warp paths.
+
+    Entries are keyed by the SHA-256 of the session file(s) plus the alignment
+    parameters, so a modified file or a different radius simply maps to a new
+    key. Each entry is a `.npz` holding one (N, 2) warp path per channel; the
+    entry mtime is refreshed on every hit and the least recently used entries
+    are evicted once the cache grows past `max_bytes`.
+
+    File hashes are memoized in `hashes.json` against (size, mtime) so an
+    unchanged file is not re-read on the next run.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, radius=1):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.radius = radius
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index_path = os.path.join(self.cache_dir, "hashes.json")
+        self.hashes = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.hashes, f)
+        os.replace(tmp_path, self.index_path)
+
+    def file_hash(self, file_path):
+        """
+        Returns the SHA-256 of a file, re-reading it only if its size or
+        mtime changed since it was last hashed.
+        """
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+
+        entry = self.hashes.get(file_path)
+        if entry is not None and entry["stamp"] == stamp:
+            return entry["sha256"]
+
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+
+        self.hashes[file_path] = {"stamp": stamp, "sha256": sha256}
+        self._save_index()
+
+        return sha256
+
+    def key(self, file_paths, **params):
+        """
+        Builds the cache key of the given session file(s) and alignment parameters.
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps({"version": CACHE_VERSION, "params": params},
+                                 sort_keys=True).encode("utf-8"))
+        for file_path in file_paths:
+            digest.update(self.file_hash(file_path).encode("utf-8"))
+
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def load(self, key):
+        """
+        Returns the cached {channel: warp_path} dict of `key`, or None on a miss.
+        """
+        entry_path = self._entry_path(key)
+        if not os.path.exists(entry_path):
+            return None
+        try:
+            with np.load(entry_path) as entry:
+                warp_paths = {int(channel): entry[channel] for channel in entry.files}
+        except (OSError, ValueError, zipfile.BadZipFile):
+            # partially written or corrupted entry, recompute it
+            os.remove(entry_path)
+            return None
+
+        # refresh the entry for the LRU
+        os.utime(entry_path)
+
+        return warp_paths
+
+    def store(self, key, warp_paths):
+        """
+        Writes a {channel: warp_path} dict under `key` and evicts old entries.
+        """
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **{str(channel): path for channel, path in warp_paths.items()})
+        os.replace(tmp_path, entry_path)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in `max_bytes`.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            entry_path = os.path.join(self.cache_dir, name)
+            stat = os.stat(entry_path)
+            entries.append((stat.st_mtime_ns, stat.st_size, entry_path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            os.remove(entry_path)
+            total_size -= size
+
+    def warp_paths(self, file_paths, channel_data_1, channel_data_2):
+        """
+        Returns the DTW warp path of every channel common to both RFs.
+
+        Parameters:
+        - file_paths (tuple): The session file(s) the channel-wise data was read from.
+        - channel_data_1 (dict): Channel-wise phases of RF1.
+        - channel_data_2 (dict): Channel-wise phases of RF2.
+
+        Returns:
+        - warp_paths (dict): A dictionary of (N, 2) warp paths keyed by channel.
+
+        Description:
+        - On a hit the paths are served from disk; on a miss `fastdtw` is run on
+          every common channel and the result is stored for the next run.
+        """
+        key = self.key(file_paths, radius=self.radius)
+        warp_paths = self.load(key)
+        if warp_paths is not None:
+            self.hits += 1
+            return warp_paths
+
+        self.misses += 1
+        warp_paths = {}
+        for channel in sorted(set(channel_data_1.keys()) & set(channel_data_2.keys())):
+            _, path = fastdtw(channel_data_1[channel], channel_data_2[channel],
+                              radius=self.radius)
+            warp_paths[channel] = np.asarray(path, dtype=np.int32).reshape(-1, 2)
+        self.store(key, warp_paths)
+
+        return warp_paths
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+DEFAULT_K = 1000
+# ratio between the capacities of two consecutive levels
+CAPACITY_DECAY = 2 / 3
+
+class QuantileSketch:
+    """
+    Mergeable KLL quantile sketch.
+
+    Values are kept in levels of sorted compactors: an item at level `h`
+    stands for 2**h original values. When the sketch grows past its capacity
+    the lowest full level is sorted and every other item (random offset) is
+    promoted to the next level, so memory stays in O(k) whatever the number
+    of ingested values while the rank error stays around 1.7 / k.
+
+    Batches are ingested as whole NumPy arrays, sketches built on different
+    workers can be merged, and a sketch can be saved to / loaded from `.npz`.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.zeros(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * CAPACITY_DECAY ** depth)), 2)
+
+    def _compress(self):
+        while sum(len(level) for level in self.levels) > \
+                sum(self._capacity(h) for h in range(len(self.levels))):
+            for h, level in enumerate(self.levels):
+                if len(level) < self._capacity(h):
+                    continue
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0))
+                level = np.sort(level)
+                # an odd item out stays at its level
+                leftover = level[len(level) - len(level) % 2:]
+                promoted = level[self.rng.integers(2):len(level) - len(leftover):2]
+                self.levels[h] = leftover
+                self.levels[h + 1] = np.concatenate((self.levels[h + 1], promoted))
+                break
+
+    def update(self, values):
+        """
+        Ingests an array of values.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compress()
+
+    def merge(self, other):
+        """
+        Merges another sketch into this one.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate((self.levels[h], level))
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+        return self
+
+    def cdf_curve(self):
+        """
+        Returns the retained values sorted and their estimated CDF, ready to be plotted.
+        """
+        if not self.n:
+            return (np.zeros(0), np.zeros(0))
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2 ** h, dtype=np.float64)
+                                  for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cumulative_weights = np.cumsum(weights[order])
+
+        return (values[order], cumulative_weights / cumulative_weights[-1])
+
+    def quantile(self, q):
+        """
+        Returns the smallest value whose estimated CDF is at least `q` (scalar or array).
+        """
+        if not self.n:
+            return np.full(np.shape(q), np.nan)
+        values, cdf = self.cdf_curve()
+        idx = np.minimum(np.searchsorted(cdf, q), len(values) - 1)
+
+        return values[idx]
+
+    def cdf(self, x):
+        """
+        Returns the estimated fraction of values lower or equal to `x` (scalar or array).
+        """
+        if not self.n:
+            return np.zeros(np.shape(x))
+        values, cdf = self.cdf_curve()
+        idx = np.searchsorted(values, x, side='right')
+
+        return np.where(idx > 0, cdf[np.maximum(idx - 1, 0)], 0.0)
+
+    def save(self, file_path):
+        """
+        Stores the sketch as a `.npz` file.
+        """
+        levels = {"level_%d" % h: level for h, level in enumerate(self.levels)}
+        np.savez(file_path, k=self.k, n=self.n, min=self.min, max=self.max,
+                 n_levels=len(self.levels), **levels)
+
+    @classmethod
+    def load(cls, file_path, seed=None):
+        """
+        Loads a sketch stored with `save`.
+        """
+        with np.load(file_path) as data:
+            sketch = cls(int(data['k']), seed)
+            sketch.n = int(data['n'])
+            sketch.min = float(data['min'])
+            sketch.max = float(data['max'])
+            sketch.levels = [data["level_%d" % h] for h in range(int(data['n_levels']))]
+
+        return sketch
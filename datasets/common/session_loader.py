@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import zipfile
+import hashlib
+import numpy as np
+import scipy.io
+
+# bump whenever the sidecar layout changes, older sidecars are then rebuilt
+SIDECAR_VERSION = 1
+MAT_FIELDS = ['timestamps', 'channels', 'diffs', 'rssis', 'raw_phases']
+
+class RFData:
+    """
+    Decoded data of a single RF of a session.
+
+    The phases are stored grouped by channel in one contiguous array:
+    the phases of `channels[i]` are `phases[offsets[i]:offsets[i+1]]`, in the
+    order they were read. Sessions stored as raw `.mat` files also keep their
+    per-read fields (timestamps, channels, rssis, ...) in `fields`.
+    """
+
+    def __init__(self, channels, offsets, phases, fields=None):
+        self.channels = channels
+        self.offsets = offsets
+        self.phases = phases
+        self.fields = fields if fields is not None else {}
+
+    def channel_wise(self):
+        """
+        Returns the phases as a {channel: ndarray} dictionary. The arrays are
+        views into `phases`, no data is copied.
+        """
+        return {int(channel): self.phases[self.offsets[i]:self.offsets[i + 1]]
+                for i, channel in enumerate(self.channels)}
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    @classmethod
+    def from_reads(cls, channels, phases, fields=None):
+        """
+        Groups per-read phases by channel, keeping the read order within a channel.
+        """
+        channels = np.asarray(channels)
+        order = np.argsort(channels, kind='stable')
+        unique_channels, counts = np.unique(channels[order], return_counts=True)
+        offsets = np.zeros(len(unique_channels) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        return cls(unique_channels.astype(np.uint8), offsets,
+                   np.asarray(phases, dtype=np.float64)[order], fields)
+
+    @classmethod
+    def from_channel_wise(cls, channel_wise_data):
+        """
+        Packs a {channel: [phases]} dictionary as read from a channel-wise JSON.
+        """
+        channels = sorted(channel_wise_data.keys(), key=int)
+        chunks = [channel_wise_data[channel] for channel in channels]
+        offsets = np.zeros(len(channels) + 1, dtype=np.int64)
+        np.cumsum([len(chunk) for chunk in chunks], out=offsets[1:])
+        phases = np.concatenate(chunks).astype(np.float64) if chunks else np.zeros(0)
+
+        return cls(np.array([int(channel) for channel in channels], dtype=np.uint8), offsets, phases)
+
+class SessionLoader:
+    """
+    Loads `.mat`, compact `.rfs` and channel-wise `.json` sessions through a NumPy
+    sidecar cache.
+
+    The first load of a file parses it and writes a compact `.npz` sidecar
+    (per-channel phases plus offsets, and the raw per-read fields when
+    available) to `cache_dir`. Later loads are served from the sidecar as long
+    as the size and mtime of the source file are unchanged.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _sidecar_path(self, file_path):
+        name = hashlib.sha1(file_path.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, name + ".npz")
+
+    def load(self, file_path):
+        """
+        Loads a session file.
+
+        Parameters:
+        - file_path (str): Path to a `.mat` file (one RF), a compact `.rfs` file or a
+          channel-wise `.json` file (both RFs).
+
+        Returns:
+        - rfs (list): A list with one `RFData` per RF stored in the file.
+        """
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        stamp = np.array([SIDECAR_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+        sidecar_path = self._sidecar_path(file_path)
+        rfs = self._read_sidecar(sidecar_path, stamp)
+        if rfs is None:
+            if file_path.endswith(".mat"):
+                rfs = self._parse_mat(file_path)
+            elif file_path.endswith(".rfs"):
+                rfs = self._parse_compact(file_path)
+            else:
+                rfs = self._parse_channel_wise_json(file_path)
+            self._write_sidecar(sidecar_path, stamp, rfs)
+
+        return rfs
+
+    def _parse_mat(self, file_path):
+        data = scipy.io.loadmat(file_path)
+        fields = {}
+        for field in MAT_FIELDS:
+            # the second RF of a session stores some of its fields with a `_diff` suffix
+            key = field if field in data else field + "_diff"
+            if key in data:
+                fields[field] = data[key][0]
+
+        return [RFData.from_reads(fields['channels'], fields['raw_phases'], fields)]
+
+    def _parse_compact(self, file_path):
+        # the decoder lives with the collection code, add software/ to sys.path to load these
+        from session_encoding_functions import decode_session, columns_history
+
+        with open(file_path, 'rb') as f:
+            rf_columns = decode_session(f.read())
+
+        rfs = []
+        for columns in rf_columns:
+            history = columns_history(columns)
+            fields = {'timestamps': np.asarray(history.times),
+                      'channels': np.asarray(history.channels),
+                      'diffs': np.asarray(history.diffs_degrees),
+                      'rssis': np.asarray(history.rssis),
+                      'raw_phases': np.asarray(history.phases_degrees)}
+            rfs.append(RFData.from_reads(fields['channels'], fields['raw_phases'], fields))
+        return rfs
+
+    def _parse_channel_wise_json(self, file_path):
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+
+        return [RFData.from_channel_wise(rf) for rf in data]
+
+    def _read_sidecar(self, sidecar_path, stamp):
+        if not os.path.exists(sidecar_path):
+            return None
+        try:
+            with np.load(sidecar_path) as sidecar:
+                if not np.array_equal(sidecar['stamp'], stamp):
+                    return None
+                rfs = []
+                for i in range(int(sidecar['n_rfs'])):
+                    prefix = "rf%d_" % i
+                    fields = {name[len(prefix) + len("field_"):]: sidecar[name]
+                              for name in sidecar.files
+                              if name.startswith(prefix + "field_")}
+                    rfs.append(RFData(sidecar[prefix + "channels"],
+                                      sidecar[prefix + "offsets"],
+                                      sidecar[prefix + "phases"],
+                                      fields))
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+        return rfs
+
+    def _write_sidecar(self, sidecar_path, stamp, rfs):
+        arrays = {'stamp': stamp, 'n_rfs': np.array(len(rfs))}
+        for i, rf in enumerate(rfs):
+            prefix = "rf%d_" % i
+            arrays[prefix + "channels"] = rf.channels
+            arrays[prefix + "offsets"] = rf.offsets
+            arrays[prefix + "phases"] = rf.phases
+            for field, values in rf.fields.items():
+                arrays[prefix + "field_" + field] = values
+
+        tmp_path = sidecar_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, sidecar_path)
@@ -3,17 +3,36 @@
 
 import threading
 import logging as logger
+from time import monotonic
+import numpy as np
 
 from ReadSpeedCounter import ReadSpeedCounter
 from TagHistory import TagHistory
+from TagStore import TagStore
+from ReportParser import ReportParser
+from ReportBatchController import ReportBatchController
+from ReaderAutotuner import load_reader_tuning
+from PhasePairer import PhasePairer, DEGREES_PER_COUNT
+from EventBus import EventBus, RAW_READS, CHANNEL_PHASE, DIFF_PHASE, CLASSIFICATION
+from EventBus import diff_phase_payload, classification_payload
+from StreamPublisher import StreamPublisher
 
 from params import IMPINJ_HOST_IP, IMPINJ_HOST_PORT
 from params import DATA_DIR, STORE_DATA
 from params import SENSORS, SENSOR_DEF
 from params import DEFAULT_ANTENNA_LIST
-
-from rf_data_collection_functions import (get_raw_data_per_rf, channel_wise_data_per_rf, store_raw_data_as_json, 
-                                          store_channelwise_data_as_json, store_raw_data_as_mat)
+from params import ADAPTIVE_REPORT_BATCHING, REPORT_BATCH_MAX
+from params import REPORT_BATCH_TARGET_LATENCY, REPORT_BATCH_INTERVAL
+from params import REPORT_BATCH_MIN_RESTART_INTERVAL
+from params import TAG_FILTER_SENSORS
+from params import READER_SITE, READER_TUNING_FILE
+from params import PAIRING_MAX_AGE_MS, PAIRING_LINEAR
+from params import STREAM_ENABLED, STREAM_GROUP, STREAM_PORT, STREAM_INTERVAL
+
+from tag_filter_functions import sensor_filter_masks, matches_filter, apply_select_filters
+from phase_calculation_functions import fold_phase_difference
+from classification_functions import threshold_edges, classify
+from SessionExporter import SessionExporter, ExportHandle
 
 try:
     from sllurp.version import __version__ as sllurp_version
@@ -28,6 +47,8 @@ host = IMPINJ_HOST_IP
 store_data = STORE_DATA
 epc_to_save = SENSORS[SENSOR_DEF]["EPC"][0]
 epc_to_save_diff = SENSORS[SENSOR_DEF]["EPC"][1]
+# only the tags of the configured sensors are singulated by the reader
+tag_filter_mask_default = sensor_filter_masks(TAG_FILTER_SENSORS)
 data_dir = DATA_DIR
 
 class AntennaReader():
@@ -36,8 +57,31 @@ class AntennaReader():
         self.reader_start_time = None
         self.total_tags_seen = 0
         self.recently_updated_tag_keys = set()
-        self.tags_db = {}
-        self.tags_db_lock = threading.Lock()
+        self.tags_db = TagStore()
+        # only serializes the report callbacks, readers use tags_db snapshots
+        self.report_lock = threading.Lock()
+        self.report_parser = ReportParser()
+        # report_every_n_tags follows the measured report handling load
+        self.batch_controller = ReportBatchController(
+            2, max_n=REPORT_BATCH_MAX, target_latency=REPORT_BATCH_TARGET_LATENCY,
+            interval=REPORT_BATCH_INTERVAL,
+            min_change_interval=REPORT_BATCH_MIN_RESTART_INTERVAL)
+        self.inventory_args = {}
+        self.tag_filter_mask = tag_filter_mask_default
+        # inventory settings selected by the autotuner for this site, if any
+        self.tuned_config = load_reader_tuning(READER_TUNING_FILE, READER_SITE)
+        self.rospec_lock = threading.Lock()
+        # consumers (plot, recorder, classifier...) subscribe to the topics of
+        # the bus instead of hooking into tag_report_cb
+        self.event_bus = EventBus()
+        self.phase_pairer = PhasePairer(PAIRING_MAX_AGE_MS, PAIRING_LINEAR)
+        self.stream_publisher = None
+        self.exporter = SessionExporter()
+        self.export_handle = None
+        # set while the reader reports a running ROSpec
+        self.inventory_running = threading.Event()
+        self.sensor_labels, self.sensor_edges = threshold_edges(
+            SENSORS[SENSOR_DEF]["classification"])
         self.speed_counter = ReadSpeedCounter(6)
         self.history_enabled = True
         self.isConnected = False # initially
@@ -75,7 +119,8 @@ class AntennaReader():
                 tag_population=2,
                 start_inventory=False,
                 # disconnect_when_done=True,
-                # tag_filter_mask=args.tag_filter_mask
+                # the Selects are set on the ROSpec, see below
+                tag_filter_mask=None,
                 tag_content_selector={
                     "EnableROSpecID": False,
                     "EnableSpecIndex": False,
@@ -114,6 +159,14 @@ class AntennaReader():
 
             config = LLRPReaderConfig(factory_args)
             self.reader = LLRPReaderClient(host, IMPINJ_HOST_PORT, config)
+            # sllurp only encodes EPC prefix masks, the Selects of tag_filter_mask
+            # (shared EPC suffixes) are set on every ROSpec it builds
+            build_rospec = self.reader.llrp.getROSpec
+            self.reader.llrp.getROSpec = lambda force_new=False: apply_select_filters(
+                build_rospec(force_new), self.tag_filter_mask)
+            if not self.tag_filter_mask:
+                logger.warning("No tag filter: the EPCs of %s share no digits, every tag "
+                               "in the field is inventoried", TAG_FILTER_SENSORS)
             self.reader.add_tag_report_callback(self.tag_report_cb)
             # self.reader.add_state_callback(LLRPReaderState.STATE_CONNECTED,
             #                                self.onConnection)
@@ -121,13 +174,15 @@ class AntennaReader():
             try:
                 self.reader.connect()
                 self.isConnected = True
+                self.start_streaming()
             except Exception:
                 logger.warning("%s Destination Host Unreachable", host)
 
     def disconnect(self):
         """close connection with the reader
         """
-        tags_db = self.tags_db
+        self.stop_streaming()
+        tags_db = self.get_tags_db_copy()
 
         key_1 = (epc_to_save, 1)
         prev_info_1 = tags_db.get(key_1, {})
@@ -137,31 +192,6 @@ class AntennaReader():
         prev_info_2 = tags_db.get(key_2, {})
         prev_history_2 = prev_info_2.get('history', TagHistory(key_2))
 
-        raw_rf1_data = get_raw_data_per_rf(prev_history_1)
-        raw_rf2_data = get_raw_data_per_rf(prev_history_2)
-
-        print(len(raw_rf1_data['channels']))
-        print(len(raw_rf2_data['channels']))
-        print("total:",len(raw_rf1_data['channels']) + len(raw_rf2_data['channels']))
-
-        raw_data = []
-        raw_data.append(raw_rf1_data)
-        raw_data.append(raw_rf2_data)
-
-        channel_data_1 = channel_wise_data_per_rf(prev_history_1)
-        channel_data_2 = channel_wise_data_per_rf(prev_history_2)
-
-        channel_wise_data = []
-        channel_wise_data.append(channel_data_1)
-        channel_wise_data.append(channel_data_2)
-
-        if (store_data):
-            store_raw_data_as_mat(raw_data, self.fname)
-            store_raw_data_as_json(raw_data, self.fname)
-            store_channelwise_data_as_json(channel_wise_data, self.fname)
-        else:
-            print("Not storing data")
-
         if self.reader is not None:
             logger.info("disconnecting...")
             self.reader.join(0.1)
@@ -174,6 +204,19 @@ class AntennaReader():
                 logger.exception("Error during disconnect. Ignoring...")
                 pass
 
+        print(len(prev_history_1.channels))
+        print(len(prev_history_2.channels))
+        print("total:",len(prev_history_1.channels) + len(prev_history_2.channels))
+
+        # the files are written in the background from a snapshot of the
+        # histories, the returned handle tells when they are
+        if (store_data):
+            self.export_handle = self.exporter.export(prev_history_1, prev_history_2, self.fname)
+        else:
+            print("Not storing data")
+            self.export_handle = ExportHandle([])
+        return self.export_handle
+
     def check_connection_state(self):
         if self.isConnected and self.reader and not self.reader.is_alive():
             self.disconnect()
@@ -185,9 +228,15 @@ class AntennaReader():
     def startInventory(self, duration=None, report_every_n_tags=None,
                        antennas=None, tx_power=None, tari=None, session=None,
                        mode_identifier=None, tag_population=None,
-                       tag_filter_mask=None):
+                       tag_filter_mask=None, impinj_search_mode=None):
         """ask to the reader to start an inventory
         """
+        # kept to re-apply the same inventory with another report batching
+        self.inventory_args = dict(antennas=antennas, tx_power=tx_power, tari=tari,
+                                   session=session, mode_identifier=mode_identifier,
+                                   tag_population=tag_population,
+                                   tag_filter_mask=tag_filter_mask,
+                                   impinj_search_mode=impinj_search_mode)
         if self.isConnected and self.check_connection_state():
             logger.info("inventoring...")
             # r_param_fn = self.readerParam.param
@@ -195,24 +244,29 @@ class AntennaReader():
             #     duration = r_param_fn("time").value()
             duration = 0.1
             if report_every_n_tags is None:
-                report_every_n_tags = 2
+                report_every_n_tags = self.batch_controller.n
+            self.batch_controller.n = report_every_n_tags
             if antennas is None:
                 antennas = (1,)
+            tuned = self.tuned_config
             if tx_power is None:
                 tx_power = {
-                    1: 0
+                    antenna: tuned.get('tx_power', 0) for antenna in antennas
                 }
             if tari is None:
-                tari = 0
+                tari = tuned.get('tari', 0)
             if session is None:
-                session = 2
+                session = tuned.get('session', 2)
             if mode_identifier is None:
-                mode_identifier = 1
+                mode_identifier = tuned.get('mode_identifier', 1)
             if tag_population is None:
-                tag_population = 2
+                tag_population = tuned.get('tag_population', 2)
+            if impinj_search_mode is None:
+                impinj_search_mode = tuned.get('impinj_search_mode', 2)
             if tag_filter_mask is None:
-                tag_filter_mask = []
-                # print(tag_filter_mask)
+                tag_filter_mask = tag_filter_mask_default
+            logger.info("tag_filter_mask=%s", tag_filter_mask)
+            self.tag_filter_mask = tag_filter_mask
 
             factory_args = dict(
                 duration=None,
@@ -223,7 +277,7 @@ class AntennaReader():
                 session=session,
                 mode_identifier=mode_identifier,
                 tag_population=tag_population,
-                tag_filter_mask=tag_filter_mask,
+                tag_filter_mask=None,
                 start_inventory=False,
                 tag_content_selector={
                     "EnableROSpecID": False,
@@ -254,7 +308,7 @@ class AntennaReader():
             # impinj_ext_fn = r_param_fn('impinj_extensions').param
             # if impinj_ext_fn('enabled').value():
             # search_mode = impinj_ext_fn('search_mode').value()
-            factory_args['impinj_search_mode'] = 2
+            factory_args['impinj_search_mode'] = impinj_search_mode
 
             factory_args['impinj_tag_content_selector'] = {
                 'EnableRFPhaseAngle': True,
@@ -287,102 +341,124 @@ class AntennaReader():
                                "stopPolitely : %s" % str(exc))
             self.reader.join(0.1)
 
-            unique_tags = len({x[0] for x in self.get_tags_db_copy().keys()})
+            seen_epcs = {x[0] for x in self.get_tags_db_copy().keys()}
+            unique_tags = len(seen_epcs)
+            # a reader applying the filter never reports other tags
+            unfiltered = [epc for epc in seen_epcs
+                          if not matches_filter(epc, self.tag_filter_mask)]
+            if unfiltered:
+                logger.warning("%d tags outside tag_filter_mask %s were reported",
+                               len(unfiltered), self.tag_filter_mask)
             msg = '%d tags seen (%d uniques) | PAUSED' % (
                 self.total_tags_seen, unique_tags)
             
+    def update_report_batching(self, n_tags, report_start):
+        """accounts a handled report and re-applies the inventory if the
+        report batching has to change
+        """
+        if not ADAPTIVE_REPORT_BATCHING:
+            return
+        self.batch_controller.record_cost(monotonic() - report_start)
+        report_every_n_tags = self.batch_controller.record_report(n_tags)
+        if report_every_n_tags is not None:
+            logger.info("report batching: load %.2f, %.0f reads/s -> report_every_n_tags=%d",
+                        self.batch_controller.last_load,
+                        self.batch_controller.last_read_rate, report_every_n_tags)
+            # never restart the inventory from the reader callback thread
+            threading.Thread(target=self.apply_report_batching,
+                             args=(report_every_n_tags,), daemon=True).start()
+
+    def apply_report_batching(self, report_every_n_tags):
+        """restarts the inventory with the same settings and another
+        report_every_n_tags, the tags are not read from the stop to the
+        restart (see REPORT_BATCH_MIN_RESTART_INTERVAL)
+        """
+        with self.rospec_lock:
+            if not self.isConnected:
+                return
+            restart_start = monotonic()
+            self.stopInventory()
+            self.startInventory(report_every_n_tags=report_every_n_tags,
+                                **self.inventory_args)
+            logger.info("report batching: inventory restarted in %.3f s",
+                        monotonic() - restart_start)
+
     def tag_report_cb(self, reader, tags):
         """sllurp tag report callback, it emits a signal in order to perform
         the report parsing on the QT loop to avoid GUI freezing
         """
-        with self.tags_db_lock:
+        report_start = monotonic()
+        with self.report_lock:
 
             history_enabled = self.history_enabled
             tags_db = self.tags_db
-            start_time = self.reader_start_time
-            if start_time is None:
-                start_time = 0
-
-            new_tag_seen_count = 0
-            updated_tag_keys = set()
 
             #logger.info('%s tag_filter_mask=<%s>', str(tags),
             #            str(self.reader.llrp.config.tag_filter_mask))
             #logger.info('Full: %s', pprint.pformat(tags))
 
-            # parsing each tag in the report
-            for tag in tags:
-                # get epc ID. (EPC covers EPC-96 and EPCData)
-                epc = tag["EPC"].decode("utf-8").upper()
-                ant_id = tag["AntennaID"]
-                # Convert to milliseconds
-                if start_time:
-                    new_first_seen_tstamp = \
-                        (tag.get('FirstSeenTimestampUTC', start_time)
-                        - start_time) // 1000
-                else:
-                    # ROSpec start was missed, or data was cleared
-                    # mid-inventory
-                    new_first_seen_tstamp = 0
-                    start_time = tag.get('FirstSeenTimestampUTC', 0)
-                    self.reader_start_time = start_time
-
-                last_seen_tstamp = (tag.get('LastSeenTimestampUTC', start_time)
-                                    - start_time) // 1000
+            # parse the whole report in one pass into a typed batch
+            batch, self.reader_start_time = self.report_parser.parse(
+                tags, self.reader_start_time)
+
+            new_tag_seen_count = int(batch['seen_count'].sum())
+            updated_tag_keys = set()
+
+            # update each tag once with all of its reads of the report
+            for tag_id, ant_id, reads in self.report_parser.group_by_tag(batch):
+                epc = self.report_parser.epcs[tag_id]
                 key = (epc, ant_id)
-                # print(key)
                 prev_info = tags_db.get(key, {})
                 prev_history = prev_info.get('history', TagHistory(key))
-
-                seen_count_new = tag.get('TagSeenCount', 1)
-                seen_count = prev_info.get('seen_count', 0) + seen_count_new
-
-                channel_idx_new = tag.get('ChannelIndex', 0)
-                channel_idx_old = prev_info.get('channel_index', 0)
-
-                # PeakRSSI highest value
-                peakrssi_new = tag.get('PeakRSSI', -120)
-                peakrssi_best = max(peakrssi_new, prev_info.get('rssi', -120))
-
-                first_seen_tstamp = prev_info.get('first_seen',
-                                                new_first_seen_tstamp)
-
-                new_info = {
-                    'epc': epc,
-                    'antenna_id': ant_id,
-                    'history': prev_history,
-                    'rssi': peakrssi_best,
-                    'channel_index': channel_idx_old or channel_idx_new,
-                    'seen_count': seen_count,
-                    'first_seen': first_seen_tstamp,
-                    'last_seen': last_seen_tstamp,
-                    'last_rssi': peakrssi_new,
-                    'last_channel_index': channel_idx_new
-                }
-
-                # Add Impinj specific data if available
-                phase = tag.get('ImpinjRFPhaseAngle')
-                if phase is not None:
-                    new_info['impinj_phase'] = phase
-                doppler_freq = tag.get('ImpinjRFDopplerFrequency')
-                if doppler_freq is not None:
-                    new_info['impinj_doppler'] = doppler_freq
-
-                tags_db[key] = new_info
+                tags_db[key] = self.report_parser.tag_info(epc, ant_id, prev_info,
+                                                           prev_history, reads)
 
                 if history_enabled:
-                    prev_history.add_data(new_first_seen_tstamp,
-                                        peakrssi_new,
-                                        channel_idx_new,
-                                        phase,
-                                        doppler_freq)
-
+                    prev_history.add_batch(reads)
 
-                new_tag_seen_count += seen_count_new
                 updated_tag_keys.add(key)
 
             self.total_tags_seen += new_tag_seen_count
 
+            # published under the report lock to keep the reports in order
+            self.publish_report(batch)
+
+        self.update_report_batching(len(batch), report_start)
+
+    def publish_report(self, batch):
+        """publishes a report and the values derived from it on the event bus,
+        each derived topic is only computed if it has subscribers
+        """
+        bus = self.event_bus
+        bus.publish(RAW_READS, batch)
+
+        phased = batch[batch['phase'] >= 0]
+        if bus.has_subscribers(CHANNEL_PHASE):
+            channel_phase = np.empty(len(phased), dtype=CHANNEL_PHASE.dtype)
+            channel_phase['tag_id'] = phased['tag_id']
+            channel_phase['channel'] = phased['channel']
+            channel_phase['time'] = phased['first_seen']
+            channel_phase['phase'] = phased['phase'] * DEGREES_PER_COUNT
+            bus.publish(CHANNEL_PHASE, channel_phase)
+
+        if not (bus.has_subscribers(DIFF_PHASE) or bus.has_subscribers(CLASSIFICATION)):
+            return
+
+        id_1, id_2 = self.report_parser.tag_ids((epc_to_save, epc_to_save_diff))
+        sensor_reads = phased[np.isin(phased['tag_id'], (id_1, id_2))]
+        estimates = self.phase_pairer.update((sensor_reads['tag_id'] == id_2).astype(int),
+                                             sensor_reads['channel'],
+                                             sensor_reads['first_seen'],
+                                             sensor_reads['phase'])
+        paired = ~np.isnan(estimates)
+        diff_phase = diff_phase_payload(sensor_reads[paired],
+                                        fold_phase_difference(estimates[paired]))
+        bus.publish(DIFF_PHASE, diff_phase)
+
+        if bus.has_subscribers(CLASSIFICATION):
+            categories = classify(np.abs(diff_phase['diff_phase']), self.sensor_edges)
+            bus.publish(CLASSIFICATION, classification_payload(diff_phase, categories))
+
     def reader_event_cb(self, reader, events):
         timestamp_event = events.get('UTCTimestamp', {})
         timestamp_us = timestamp_event.get('Microseconds', 0)
@@ -397,24 +473,37 @@ class AntennaReader():
             event_type = rospec_event.get('EventType')
             if event_type == 'Start_of_ROSpec' and not self.reader_start_time:
                 self.reader_start_time = timestamp_us
+            if event_type == 'Start_of_ROSpec':
+                self.inventory_running.set()
+            elif event_type == 'End_of_ROSpec':
+                self.inventory_running.clear()
+
+    def start_streaming(self):
+        if STREAM_ENABLED and self.stream_publisher is None:
+            self.stream_publisher = StreamPublisher(self.event_bus, STREAM_GROUP,
+                                                    STREAM_PORT, STREAM_INTERVAL)
+            self.stream_publisher.start()
+
+    def stop_streaming(self):
+        if self.stream_publisher is not None:
+            self.stream_publisher.stop()
+            logger.info("stream: %d packets sent", self.stream_publisher.sent_packets)
+            self.stream_publisher = None
 
     def clear_tags_db(self):
-        with self.tags_db_lock:
-            self.tags_db = {}
+        self.tags_db.clear()
+        self.phase_pairer.reset()
 
     def get_tags_db_copy(self):
         """Freeze the value of the tags db for display
 
-        Warning: This is not a deep copy of the db, and except the tag key list
-        itself, it will still be "reference" to inner tag info and history.
-        This should be crash-free acceptable even if maybe not always
-        perfectly consistent as tags info are updated atomically by
-        tag_report_cb.
-        The goal of the lock and copy is mainly to avoid unexecpected issues
-        with the "clear_tags" operation at the wrong time.
+        Returns an immutable snapshot of the tags db. Tag infos are replaced,
+        never mutated, by tag_report_cb so the snapshot is consistent at its
+        epoch; the histories it references are still live objects.
+        Taking a snapshot only briefly locks the shards that changed since the
+        previous one, it never waits on a whole report being processed.
         """
-        with self.tags_db_lock:
-            return self.tags_db.copy()
+        return self.tags_db.snapshot().tags
 
     def parseInventoryReport(self, updated_tag_keys):
         """Function called each time the reader reports seeing tags,
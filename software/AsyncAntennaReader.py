@@ -0,0 +1,124 @@
+import asyncio
+import logging as logger
+
+from AntennaReader import AntennaReader
+from EventBus import RAW_READS
+
+class AsyncAntennaReader:
+    """asyncio facade of AntennaReader.
+
+    The blocking AntennaReader calls run in the default executor, and the
+    payloads published on the reader event bus by the sllurp thread are
+    handed over to the event loop with call_soon_threadsafe, so several
+    readers and other I/O can share one event loop:
+
+        async with AsyncAntennaReader(fname) as reader:
+            await reader.start()
+            async for batch in reader.reads():
+                ...
+    """
+
+    def __init__(self, fname, reader=None):
+        self.reader = reader if reader is not None else AntennaReader(fname)
+        self._subscriptions = []
+        # RAW_READS subscription taken by start(), for the next reads()
+        self._pending = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def connect(self):
+        await self._run(self.reader.connect)
+        if not self.reader.isConnected:
+            raise ConnectionError("Could not connect to the reader")
+
+    async def disconnect(self, wait_export=True):
+        """stops the reads() iterators and disconnects, then waits for the
+        session files to be written unless wait_export is False. Returns the
+        ExportHandle of the session files.
+        """
+        for subscription in list(self._subscriptions):
+            subscription.close()
+        if self._pending is not None:
+            self._subscriptions.remove(self._pending[0])
+            self._pending = None
+        export = await self._run(self.reader.disconnect)
+        if wait_export:
+            await self._run(export.wait)
+        return export
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
+
+    async def start(self, timeout=5.0, **inventory_args):
+        """starts an inventory and returns once the reader reports the ROSpec
+        as started, raises TimeoutError if it does not within timeout seconds
+        """
+        # subscribed before the inventory starts, so that the reads() iterator
+        # created after start() returns also gets the first reports
+        if self._pending is None:
+            self._pending = self._subscribe(RAW_READS, 64)
+        self.reader.inventory_running.clear()
+        await self._run(lambda: self.reader.startInventory(**inventory_args))
+        started = await self._run(self.reader.inventory_running.wait, timeout)
+        if not started:
+            raise TimeoutError("The reader did not start the inventory")
+
+    async def stop(self):
+        await self._run(self.reader.stopInventory)
+
+    def _subscribe(self, topic, maxsize):
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+
+        def notify():
+            # called from the reader thread, under its report lock
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                # the loop is closed, nothing will iterate the subscription
+                if not subscription.closed:
+                    subscription.close()
+
+        subscription = self.reader.event_bus.subscribe(topic, maxsize, on_push=notify)
+        self._subscriptions.append(subscription)
+        return (subscription, ready)
+
+    def reads(self, topic=RAW_READS, maxsize=64):
+        """Returns an async iterator of the payloads published on a topic of
+        the reader event bus (the parsed reports by default) until the reader
+        is disconnected. The topic is subscribed when reads() is called, and
+        the first RAW_READS iterator after start() gets the reports published
+        since the inventory started.
+
+        Like any Subscription, if the loop does not keep up the oldest
+        payloads are dropped, the reader thread never waits for the loop.
+        """
+        if topic.name == RAW_READS.name and self._pending is not None:
+            subscription, ready = self._pending
+            self._pending = None
+        else:
+            subscription, ready = self._subscribe(topic, maxsize)
+        return self._iterate(subscription, ready)
+
+    async def _iterate(self, subscription, ready):
+        try:
+            while True:
+                ready.clear()
+                payload = subscription.get(timeout=0)
+                if payload is not None:
+                    yield payload
+                elif subscription.closed:
+                    return
+                else:
+                    await ready.wait()
+        finally:
+            if subscription.dropped_count:
+                logger.warning("%s: %d payloads dropped", subscription.topic.name,
+                               subscription.dropped_count)
+            subscription.close()
+            self._subscriptions.remove(subscription)
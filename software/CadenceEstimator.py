@@ -0,0 +1,94 @@
+import numpy as np
+
+class CadenceEstimator:
+    """Dominant frequency of a fixed-rate signal, with a sliding DFT.
+
+    The DFT of the last `window` seconds is kept for the bins between
+    `min_freq` and `max_freq` only, and updated by the samples entering and
+    leaving the window: O(bins) per sample instead of an FFT of the window
+    on every estimate. The bins are recomputed from the window once per
+    window length, so rounding errors never accumulate.
+    """
+
+    def __init__(self, rate, window=20.0, min_freq=0.1, max_freq=5.0):
+        self.rate = rate
+        self.size = int(round(window * rate))
+        resolution = rate / self.size
+        first = max(1, int(np.ceil(min_freq / resolution)))
+        last = min(self.size // 2, int(np.floor(max_freq / resolution)))
+        self.bins = np.arange(first, last + 1)
+        self.freqs = self.bins * resolution
+        self.twiddles = np.exp(2j * np.pi * self.bins / self.size)
+        self.reset()
+
+    def reset(self):
+        self.buffer = np.zeros(self.size)   # ring of the window samples
+        self.index = 0
+        self.count = 0
+        self.since_refresh = 0
+        self.spectrum = np.zeros(len(self.bins), dtype=np.complex128)
+
+    @property
+    def ready(self):
+        return self.count >= self.size
+
+    def update(self, samples):
+        """Adds consecutive samples of the signal, nan marking a gap: the
+        samples on either side of a gap are not consecutive, so the window
+        restarts after it
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        gaps = np.flatnonzero(np.isnan(samples))
+        if len(gaps):
+            self.reset()
+            samples = samples[gaps[-1] + 1:]
+        # a batch longer than the window only leaves its last window of samples
+        if len(samples) > self.size:
+            self.count += len(samples) - self.size
+            samples = samples[-self.size:]
+        n = len(samples)
+        if not n:
+            return
+
+        slots = (self.index + np.arange(n)) % self.size
+        deltas = samples - self.buffer[slots]
+        # X_k <- (X_k + x_new - x_old) * w_k for each sample, all at once:
+        # X_k w_k^n + sum_i delta_i w_k^(n - i)
+        powers = self.twiddles[None, :] ** np.arange(n, 0, -1)[:, None]
+        self.spectrum = self.spectrum * self.twiddles ** n + deltas @ powers
+
+        self.buffer[slots] = samples
+        self.index = (self.index + n) % self.size
+        self.count += n
+        self.since_refresh += n
+        if self.since_refresh >= self.size:
+            self._refresh()
+
+    def _refresh(self):
+        # exact DFT of the window, oldest sample first, as the recursion keeps it
+        window = np.roll(self.buffer, -self.index)
+        phases = np.exp(-2j * np.pi * np.outer(np.arange(self.size), self.bins) / self.size)
+        self.spectrum = window @ phases
+        self.since_refresh = 0
+
+    def amplitudes(self):
+        """Amplitude of the sinusoid of each bin frequency (self.freqs)
+        """
+        return 2 * np.abs(self.spectrum) / self.size
+
+    def estimate(self):
+        """Returns the (frequency in Hz, amplitude) of the strongest bin,
+        refined by parabolic interpolation, (nan, nan) until a whole window
+        was seen
+        """
+        if not self.ready or not len(self.bins):
+            return (np.nan, np.nan)
+        amplitudes = self.amplitudes()
+        k = int(np.argmax(amplitudes))
+        offset = 0.0
+        if 0 < k < len(amplitudes) - 1:
+            left, center, right = amplitudes[k - 1:k + 2]
+            denominator = left - 2 * center + right
+            if denominator:
+                offset = 0.5 * (left - right) / denominator
+        return (float(self.freqs[k] + offset * self.rate / self.size), float(amplitudes[k]))
@@ -0,0 +1,171 @@
+import threading
+import logging as logger
+from collections import deque, namedtuple
+import numpy as np
+
+from ReportParser import REPORT_DTYPE
+
+Topic = namedtuple('Topic', ['name', 'dtype'])
+
+# Every payload published on a topic is a structured array of its dtype
+RAW_READS = Topic('raw_reads', REPORT_DTYPE)
+CHANNEL_PHASE = Topic('channel_phase', np.dtype([
+    ('tag_id', np.int32),       # interned EPC, see ReportParser.epcs
+    ('channel', np.int32),
+    ('time', np.int64),         # ms since reader start
+    ('phase', np.float64),      # degrees
+]))
+DIFF_PHASE = Topic('diff_phase', np.dtype([
+    ('channel', np.int32),
+    ('time', np.int64),
+    ('diff_phase', np.float64), # folded tag 1 minus tag 2, degrees
+]))
+CLASSIFICATION = Topic('classification', np.dtype([
+    ('time', np.int64),
+    ('diff_phase', np.float64),
+    ('category', np.int32),     # index in the sensor labels, len(labels) if unclassified
+]))
+
+CADENCE = Topic('cadence', np.dtype([
+    ('time', np.int64),
+    ('frequency', np.float64),  # dominant frequency of the differential phase, Hz
+    ('amplitude', np.float64),  # degrees
+]))
+
+TOPICS = (RAW_READS, CHANNEL_PHASE, DIFF_PHASE, CLASSIFICATION, CADENCE)
+
+def diff_phase_payload(reads, diff_phases):
+    """Builds a DIFF_PHASE payload from the paired reads of a batch and their
+    folded differential phases
+    """
+    payload = np.empty(len(reads), dtype=DIFF_PHASE.dtype)
+    payload['channel'] = reads['channel']
+    payload['time'] = reads['first_seen']
+    payload['diff_phase'] = diff_phases
+    return payload
+
+def classification_payload(diff_phase, categories):
+    """Builds a CLASSIFICATION payload from a DIFF_PHASE payload and the
+    category of each of its values
+    """
+    payload = np.empty(len(diff_phase), dtype=CLASSIFICATION.dtype)
+    payload['time'] = diff_phase['time']
+    payload['diff_phase'] = diff_phase['diff_phase']
+    payload['category'] = categories
+    return payload
+
+class Subscription:
+    """Queue of the payloads of a topic for one subscriber.
+
+    The queue is bounded: when a subscriber does not keep up its oldest
+    payloads are dropped (and counted), the publisher and the other
+    subscribers never wait for it.
+    """
+
+    def __init__(self, bus, topic, maxsize=64, on_push=None):
+        self.bus = bus
+        self.topic = topic
+        # called from the publisher thread after each push and on close
+        self.on_push = on_push
+        self._payloads = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.closed = False
+        self.received_count = 0
+        self.dropped_count = 0
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def _push(self, payload):
+        with self._cond:
+            if len(self._payloads) == self._payloads.maxlen:
+                self.dropped_count += 1
+            self._payloads.append(payload)
+            self.received_count += 1
+            self._cond.notify_all()
+        self._notify()
+
+    def _notify(self):
+        # a failing callback must not abort the publisher, nor the other
+        # subscribers of the topic
+        if self.on_push is None:
+            return
+        try:
+            self.on_push()
+        except Exception:
+            logger.exception("%s: on_push callback failed", self.topic.name)
+
+    def get(self, timeout=None):
+        """Returns the oldest payload, or None if none came within timeout
+        seconds or the subscription is closed
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._payloads or self.closed, timeout):
+                return None
+            if not self._payloads:
+                return None
+            return self._payloads.popleft()
+
+    def drain(self):
+        """Returns all the queued payloads concatenated, an empty array if none
+        """
+        with self._cond:
+            payloads = list(self._payloads)
+            self._payloads.clear()
+        if not payloads:
+            return np.empty(0, dtype=self.topic.dtype)
+        return np.concatenate(payloads)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._notify()
+
+    def __iter__(self):
+        while True:
+            payload = self.get()
+            if payload is None:
+                return
+            yield payload
+
+class EventBus:
+    """In-process publish/subscribe of the reads and the values derived from
+    them.
+
+    Each stage publishes its payload once, every subscriber of the topic gets
+    the same (read-only) array in its own Subscription queue. Stages can check
+    has_subscribers to skip computing a topic nobody listens to.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {topic.name: () for topic in TOPICS}
+
+    def subscribe(self, topic, maxsize=64, on_push=None):
+        subscription = Subscription(self, topic, maxsize, on_push)
+        with self._lock:
+            self._subscriptions[topic.name] += (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            name = subscription.topic.name
+            self._subscriptions[name] = tuple(
+                s for s in self._subscriptions[name] if s is not subscription)
+
+    def has_subscribers(self, topic):
+        return len(self._subscriptions[topic.name]) > 0
+
+    def publish(self, topic, payload):
+        if payload.dtype != topic.dtype:
+            raise TypeError("%s payloads must be of dtype %s, got %s"
+                            % (topic.name, topic.dtype, payload.dtype))
+        subscriptions = self._subscriptions[topic.name]
+        if not subscriptions:
+            return
+        # subscribers share the payload, none of them may modify it
+        payload.flags.writeable = False
+        for subscription in subscriptions:
+            subscription._push(payload)
@@ -3,21 +3,51 @@
 
 import threading
 import logging as logger
+from time import monotonic
 import numpy as np
 import pyqtgraph as pg
 from PyQt5 import QtWidgets
 
 from ReadSpeedCounter import ReadSpeedCounter
 from TagHistory import TagHistory
+from TagStore import TagStore
+from ReportParser import ReportParser
+from ReportBatchController import ReportBatchController
+from ReaderAutotuner import load_reader_tuning
+from PhasePairer import PhasePairer
+from RollingStats import CircularWindow, Ewma, MultipathRejector
+from HampelFilter import HampelFilter
+from PhaseFusion import PhaseFusion
+from CadenceEstimator import CadenceEstimator
+from Resampler import Resampler
+from ReportQueue import ReportQueue
+from EventBus import EventBus, RAW_READS, DIFF_PHASE, CLASSIFICATION, CADENCE
+from EventBus import diff_phase_payload, classification_payload
+from StreamPublisher import StreamPublisher
 
 from params import IMPINJ_HOST_IP, IMPINJ_HOST_PORT
 from params import DATA_DIR, STORE_DATA
 from params import SENSORS, SENSOR_DEF
 from params import DEFAULT_ANTENNA_LIST
-
-from phase_calculation_functions import phase_resolution, phase_difference, clean_phase_difference
-from rf_data_collection_functions import (get_raw_data_per_rf, channel_wise_data_per_rf, store_raw_data_as_json, 
-                                          store_channelwise_data_as_json, store_raw_data_as_mat)
+from params import ADAPTIVE_REPORT_BATCHING, REPORT_BATCH_MAX
+from params import REPORT_BATCH_TARGET_LATENCY, REPORT_BATCH_INTERVAL
+from params import REPORT_BATCH_MIN_RESTART_INTERVAL
+from params import TAG_FILTER_SENSORS
+from params import READER_SITE, READER_TUNING_FILE
+from params import PAIRING_MAX_AGE_MS, PAIRING_LINEAR
+from params import STREAM_ENABLED, STREAM_GROUP, STREAM_PORT, STREAM_INTERVAL
+from params import REPORT_QUEUE_SIZE, REPORT_QUEUE_POLICY
+from params import MULTIPATH_WINDOW, MULTIPATH_STD_THRESHOLD, LIVE_SMOOTHING_ALPHA
+from params import HAMPEL_WINDOW, HAMPEL_K, HAMPEL_REPLACE
+from params import LIVE_ESTIMATOR, PHASE_FUSION_PROCESS_NOISE, PHASE_FUSION_MEASUREMENT_NOISE
+from params import RESAMPLE_RATE, RESAMPLE_METHOD, RESAMPLE_MAX_GAP
+from params import CADENCE_WINDOW, CADENCE_MIN_FREQ, CADENCE_MAX_FREQ
+
+from phase_calculation_functions import fold_phase_difference
+from tag_filter_functions import sensor_filter_masks, matches_filter, apply_select_filters
+from classification_functions import threshold_edges, classify
+from SessionExporter import SessionExporter, ExportHandle
+from rf_data_collection_functions import real_time_phase_separation
 
 try:
     from sllurp.version import __version__ as sllurp_version
@@ -31,6 +61,8 @@ logger.basicConfig(level=logger.INFO)
 host = IMPINJ_HOST_IP
 epc_to_save = SENSORS[SENSOR_DEF]["EPC"][0]
 epc_to_save_diff = SENSORS[SENSOR_DEF]["EPC"][1]
+# only the tags of the configured sensors are singulated by the reader
+tag_filter_mask_default = sensor_filter_masks(TAG_FILTER_SENSORS)
 store_data = STORE_DATA
 data_dir = DATA_DIR
 
@@ -44,8 +76,20 @@ class Gui(QtWidgets.QMainWindow):
         self.reader_start_time = None
         self.total_tags_seen = 0
         self.recently_updated_tag_keys = set()
-        self.tags_db = {}
-        self.tags_db_lock = threading.Lock()
+        self.tags_db = TagStore()
+        # only serializes the report callbacks, readers use tags_db snapshots
+        self.report_lock = threading.Lock()
+        self.report_parser = ReportParser()
+        # report_every_n_tags follows the measured report handling load
+        self.batch_controller = ReportBatchController(
+            1, max_n=REPORT_BATCH_MAX, target_latency=REPORT_BATCH_TARGET_LATENCY,
+            interval=REPORT_BATCH_INTERVAL,
+            min_change_interval=REPORT_BATCH_MIN_RESTART_INTERVAL)
+        self.inventory_args = {}
+        self.tag_filter_mask = tag_filter_mask_default
+        # inventory settings selected by the autotuner for this site, if any
+        self.tuned_config = load_reader_tuning(READER_TUNING_FILE, READER_SITE)
+        self.rospec_lock = threading.Lock()
         self.speed_counter = ReadSpeedCounter(6)
         self.history_enabled = True
         self.isConnected = False
@@ -57,14 +101,15 @@ class Gui(QtWidgets.QMainWindow):
         self.graphWidget = pg.PlotWidget()
         self.setCentralWidget(self.graphWidget)
 
-        n_data_pts = 100
-        self.x = list(range(n_data_pts))  # 1000 time points
-        self.y = [0]*n_data_pts
+        # last plotted reports, at their time since the reader start (s)
+        self.n_data_pts = 100
+        self.x = []
+        self.y = []
 
         self.graphWidget.setBackground('w')
         styles = {'color':'k', 'font-size':'20px'}
         self.graphWidget.setLabel('left', 'Phase (°)', **styles)
-        self.graphWidget.setLabel('bottom', 'Tag Reads', **styles)
+        self.graphWidget.setLabel('bottom', 'Time (s)', **styles)
 
         pen = pg.mkPen(color=(255, 0, 0), width = 5)
         self.data_line =  self.graphWidget.plot(self.x, self.y, pen=pen)
@@ -78,11 +123,35 @@ class Gui(QtWidgets.QMainWindow):
         self.curr_channel_count = np.zeros(50)
         
 
-        self.vec_size = 20
-        self.rolling_idx = 0
-        self.diff_phase_arr = np.zeros(self.vec_size)
-        self.array_populated = False
-        self.std_threshold = 1000
+        self.vec_size = MULTIPATH_WINDOW
+        self.std_threshold = MULTIPATH_STD_THRESHOLD
+        # multipath rejection per channel, and over the phase of the last reports,
+        # both modulo 180 degrees as the phase is folded around the Impinj pi jumps
+        self.multipath_rejector = MultipathRejector(self.vec_size, self.std_threshold)
+        self.diff_phase_stats = CircularWindow(self.vec_size)
+        self.plot_smoother = Ewma(LIVE_SMOOTHING_ALPHA)
+        self.hampel_filter = HampelFilter(HAMPEL_WINDOW, HAMPEL_K, HAMPEL_REPLACE)
+        self.phase_fusion = PhaseFusion(PHASE_FUSION_PROCESS_NOISE, PHASE_FUSION_MEASUREMENT_NOISE)
+        self.live_phase_std = np.nan
+        self.resampler = Resampler(RESAMPLE_RATE, RESAMPLE_METHOD, RESAMPLE_MAX_GAP)
+        self.cadence_estimator = CadenceEstimator(RESAMPLE_RATE, CADENCE_WINDOW,
+                                                  CADENCE_MIN_FREQ, CADENCE_MAX_FREQ)
+        self.cadence = (np.nan, np.nan)
+
+        self.phase_pairer = PhasePairer(PAIRING_MAX_AGE_MS, PAIRING_LINEAR)
+        self.event_bus = EventBus()
+        self.sensor_labels, self.sensor_edges = threshold_edges(
+            SENSORS[SENSOR_DEF]["classification"])
+        self.stream_publisher = None
+        self.exporter = SessionExporter()
+        self.export_handle = None
+
+        # reports are processed on their own thread, behind a bounded queue
+        self.report_queue = ReportQueue(REPORT_QUEUE_SIZE, REPORT_QUEUE_POLICY)
+        # its backlog and shed reads tell the batching that processing lags
+        self.batch_controller.queue = self.report_queue
+        self.processing_thread = None
+        self.processing_stop = threading.Event()
 
     def connect(self):
         """open connection with the reader through LLRP protocol
@@ -107,7 +176,8 @@ class Gui(QtWidgets.QMainWindow):
                 tag_population=3,
                 start_inventory=False,
                 # disconnect_when_done=True,
-                # tag_filter_mask=args.tag_filter_mask
+                # the Selects are set on the ROSpec, see below
+                tag_filter_mask=None,
                 tag_content_selector={
                     "EnableROSpecID": False,
                     "EnableSpecIndex": False,
@@ -146,6 +216,14 @@ class Gui(QtWidgets.QMainWindow):
 
             config = LLRPReaderConfig(factory_args)
             self.reader = LLRPReaderClient(host, IMPINJ_HOST_PORT, config)
+            # sllurp only encodes EPC prefix masks, the Selects of tag_filter_mask
+            # (shared EPC suffixes) are set on every ROSpec it builds
+            build_rospec = self.reader.llrp.getROSpec
+            self.reader.llrp.getROSpec = lambda force_new=False: apply_select_filters(
+                build_rospec(force_new), self.tag_filter_mask)
+            if not self.tag_filter_mask:
+                logger.warning("No tag filter: the EPCs of %s share no digits, every tag "
+                               "in the field is inventoried", TAG_FILTER_SENSORS)
             self.reader.add_tag_report_callback(self.tag_report_cb)
             # self.reader.add_state_callback(LLRPReaderState.STATE_CONNECTED,
             #                                self.onConnection)
@@ -153,6 +231,8 @@ class Gui(QtWidgets.QMainWindow):
             try:
                 self.reader.connect()
                 self.isConnected = True
+                self.start_processing()
+                self.start_streaming()
             except Exception:
                 logger.warning("%s Destination Host Unreachable", host)
 
@@ -160,7 +240,10 @@ class Gui(QtWidgets.QMainWindow):
         """
         close connection with the reader and store all available data collected so far
         """
-        tags_db = self.tags_db
+        self.stop_processing()
+        self.stop_streaming()
+
+        tags_db = self.get_tags_db_copy()
 
         key_1 = (epc_to_save, 1)
         prev_info_1 = tags_db.get(key_1, {})
@@ -170,28 +253,6 @@ class Gui(QtWidgets.QMainWindow):
         prev_info_2 = tags_db.get(key_2, {})
         prev_history_2 = prev_info_2.get('history', TagHistory(key_2))
 
-        raw_rf1_data = get_raw_data_per_rf(prev_history_1)
-        raw_rf2_data = get_raw_data_per_rf(prev_history_2)
-
-        raw_data = []
-        raw_data.append(raw_rf1_data)
-        raw_data.append(raw_rf2_data)
-
-        channel_data_1 = channel_wise_data_per_rf(prev_history_1)
-        channel_data_2 = channel_wise_data_per_rf(prev_history_2)
-
-        channel_wise_data = []
-        channel_wise_data.append(channel_data_1)
-        channel_wise_data.append(channel_data_2)
-
-        if (store_data):
-            store_raw_data_as_mat(raw_data, self.fname)
-            store_raw_data_as_json(raw_data, self.fname)
-            store_channelwise_data_as_json(channel_wise_data, self.fname)
-        else:
-            print("Not storing data")
-        
-
         if self.reader is not None:
             logger.info("disconnecting...")
             self.reader.join(0.1)
@@ -204,6 +265,15 @@ class Gui(QtWidgets.QMainWindow):
                 logger.exception("Error during disconnect. Ignoring...")
                 pass
 
+        # the files are written in the background from a snapshot of the
+        # histories, the returned handle tells when they are
+        if (store_data):
+            self.export_handle = self.exporter.export(prev_history_1, prev_history_2, self.fname)
+        else:
+            print("Not storing data")
+            self.export_handle = ExportHandle([])
+        return self.export_handle
+
     def check_connection_state(self):
         if self.isConnected and self.reader and not self.reader.is_alive():
             self.disconnect()
@@ -215,9 +285,15 @@ class Gui(QtWidgets.QMainWindow):
     def startInventory(self, duration=None, report_every_n_tags=None,
                        antennas=None, tx_power=None, tari=None, session=None,
                        mode_identifier=None, tag_population=None,
-                       tag_filter_mask=None):
+                       tag_filter_mask=None, impinj_search_mode=None):
         """ask to the reader to start an inventory
         """
+        # kept to re-apply the same inventory with another report batching
+        self.inventory_args = dict(antennas=antennas, tx_power=tx_power, tari=tari,
+                                   session=session, mode_identifier=mode_identifier,
+                                   tag_population=tag_population,
+                                   tag_filter_mask=tag_filter_mask,
+                                   impinj_search_mode=impinj_search_mode)
         if self.isConnected and self.check_connection_state():
             logger.info("inventoring...")
             # r_param_fn = self.readerParam.param
@@ -225,24 +301,29 @@ class Gui(QtWidgets.QMainWindow):
             #     duration = r_param_fn("time").value()
             duration = 0.1
             if report_every_n_tags is None:
-                report_every_n_tags = 1
+                report_every_n_tags = self.batch_controller.n
+            self.batch_controller.n = report_every_n_tags
             if antennas is None:
                 antennas = (1,)
+            tuned = self.tuned_config
             if tx_power is None:
                 tx_power = {
-                    1: 0
+                    antenna: tuned.get('tx_power', 0) for antenna in antennas
                 }
             if tari is None:
-                tari = 0
+                tari = tuned.get('tari', 0)
             if session is None:
-                session = 2
+                session = tuned.get('session', 2)
             if mode_identifier is None:
-                mode_identifier = 1
+                mode_identifier = tuned.get('mode_identifier', 1)
             if tag_population is None:
-                tag_population = 3
+                tag_population = tuned.get('tag_population', 3)
+            if impinj_search_mode is None:
+                impinj_search_mode = tuned.get('impinj_search_mode', 2)
             if tag_filter_mask is None:
-                tag_filter_mask = []
-                # print(tag_filter_mask)
+                tag_filter_mask = tag_filter_mask_default
+            logger.info("tag_filter_mask=%s", tag_filter_mask)
+            self.tag_filter_mask = tag_filter_mask
 
             factory_args = dict(
                 duration=None,
@@ -253,7 +334,7 @@ class Gui(QtWidgets.QMainWindow):
                 session=session,
                 mode_identifier=mode_identifier,
                 tag_population=tag_population,
-                tag_filter_mask=tag_filter_mask,
+                tag_filter_mask=None,
                 start_inventory=False,
                 tag_content_selector={
                     "EnableROSpecID": False,
@@ -284,7 +365,7 @@ class Gui(QtWidgets.QMainWindow):
             # impinj_ext_fn = r_param_fn('impinj_extensions').param
             # if impinj_ext_fn('enabled').value():
             # search_mode = impinj_ext_fn('search_mode').value()
-            factory_args['impinj_search_mode'] = 2
+            factory_args['impinj_search_mode'] = impinj_search_mode
 
             factory_args['impinj_tag_content_selector'] = {
                 'EnableRFPhaseAngle': True,
@@ -320,25 +401,58 @@ class Gui(QtWidgets.QMainWindow):
                                "stopPolitely : %s" % str(exc))
             self.reader.join(0.1)
 
-            unique_tags = len({x[0] for x in self.get_tags_db_copy().keys()})
+            seen_epcs = {x[0] for x in self.get_tags_db_copy().keys()}
+            unique_tags = len(seen_epcs)
+            # a reader applying the filter never reports other tags
+            unfiltered = [epc for epc in seen_epcs
+                          if not matches_filter(epc, self.tag_filter_mask)]
+            if unfiltered:
+                logger.warning("%d tags outside tag_filter_mask %s were reported",
+                               len(unfiltered), self.tag_filter_mask)
             msg = '%d tags seen (%d uniques) | PAUSED' % (
                 self.total_tags_seen, unique_tags)
             # self.update_status(msg)
 
+    def update_report_batching(self, n_tags, report_start):
+        """accounts a handled report and re-applies the inventory if the
+        report batching has to change
+        """
+        if not ADAPTIVE_REPORT_BATCHING:
+            return
+        self.batch_controller.record_cost(monotonic() - report_start)
+        report_every_n_tags = self.batch_controller.record_report(n_tags)
+        if report_every_n_tags is not None:
+            logger.info("report batching: load %.2f, %.0f reads/s -> report_every_n_tags=%d",
+                        self.batch_controller.last_load,
+                        self.batch_controller.last_read_rate, report_every_n_tags)
+            # never restart the inventory from the reader callback thread
+            threading.Thread(target=self.apply_report_batching,
+                             args=(report_every_n_tags,), daemon=True).start()
+
+    def apply_report_batching(self, report_every_n_tags):
+        """restarts the inventory with the same settings and another
+        report_every_n_tags, the tags are not read from the stop to the
+        restart (see REPORT_BATCH_MIN_RESTART_INTERVAL)
+        """
+        with self.rospec_lock:
+            if not self.isConnected:
+                return
+            restart_start = monotonic()
+            self.stopInventory()
+            self.startInventory(report_every_n_tags=report_every_n_tags,
+                                **self.inventory_args)
+            logger.info("report batching: inventory restarted in %.3f s",
+                        monotonic() - restart_start)
+
     def tag_report_cb(self, reader, tags):
         """sllurp tag report callback, it emits a signal in order to perform
         the report parsing on the QT loop to avoid GUI freezing
         """
-        with self.tags_db_lock:
+        report_start = monotonic()
+        with self.report_lock:
 
             history_enabled = self.history_enabled
             tags_db = self.tags_db
-            start_time = self.reader_start_time
-            if start_time is None:
-                start_time = 0
-
-            new_tag_seen_count = 0
-            updated_tag_keys = set()
 
             #logger.info('%s tag_filter_mask=<%s>', str(tags),
             #            str(self.reader.llrp.config.tag_filter_mask))
@@ -346,7 +460,6 @@ class Gui(QtWidgets.QMainWindow):
 
             epc1 = epc_to_save
             epc2 = epc_to_save_diff
-            time_diff=False
 
             # epc1 = 'E28011606000020EA5BAA803'
             # epc2 = 'E28011606000020EA5BA6CF3'
@@ -358,99 +471,26 @@ class Gui(QtWidgets.QMainWindow):
             channel_1 = -1
             channel_2 = -1
 
-            # parsing each tag in the report
-            for tag in tags:
-                # get epc ID. (EPC covers EPC-96 and EPCData)
-                epc = tag["EPC"].decode("utf-8").upper()
-                ant_id = tag["AntennaID"]
-                # Convert to milliseconds
-                if start_time:
-                    new_first_seen_tstamp = \
-                        (tag.get('FirstSeenTimestampUTC', start_time)
-                        - start_time) // 1000
-                else:
-                    # ROSpec start was missed, or data was cleared
-                    # mid-inventory
-                    new_first_seen_tstamp = 0
-                    start_time = tag.get('FirstSeenTimestampUTC', 0)
-                    self.reader_start_time = start_time
-
-                last_seen_tstamp = (tag.get('LastSeenTimestampUTC', start_time)
-                                    - start_time) // 1000
+            # parse the whole report in one pass into a typed batch
+            batch, self.reader_start_time = self.report_parser.parse(
+                tags, self.reader_start_time)
+
+            new_tag_seen_count = int(batch['seen_count'].sum())
+            updated_tag_keys = set()
+
+            # update each tag once with all of its reads of the report
+            for tag_id, ant_id, reads in self.report_parser.group_by_tag(batch):
+                epc = self.report_parser.epcs[tag_id]
                 key = (epc, ant_id)
-                # print(key)
                 prev_info = tags_db.get(key, {})
                 prev_history = prev_info.get('history', TagHistory(key))
-
-                seen_count_new = tag.get('TagSeenCount', 1)
-                seen_count = prev_info.get('seen_count', 0) + seen_count_new
-
-                channel_idx_new = tag.get('ChannelIndex', 0)
-                channel_idx_old = prev_info.get('channel_index', 0)
-
-                # PeakRSSI highest value
-                peakrssi_new = tag.get('PeakRSSI', -120)
-                peakrssi_best = max(peakrssi_new, prev_info.get('rssi', -120))
-
-                first_seen_tstamp = prev_info.get('first_seen',
-                                                new_first_seen_tstamp)
-
-                new_info = {
-                    'epc': epc,
-                    'antenna_id': ant_id,
-                    'history': prev_history,
-                    'rssi': peakrssi_best,
-                    'channel_index': channel_idx_old or channel_idx_new,
-                    'seen_count': seen_count,
-                    'first_seen': first_seen_tstamp,
-                    'last_seen': last_seen_tstamp,
-                    'last_rssi': peakrssi_new,
-                    'last_channel_index': channel_idx_new
-                }
-
-                # Add Impinj specific data if available
-                phase = tag.get('ImpinjRFPhaseAngle')
-                if phase is not None:
-                    new_info['impinj_phase'] = phase
-                doppler_freq = tag.get('ImpinjRFDopplerFrequency')
-                if doppler_freq is not None:
-                    new_info['impinj_doppler'] = doppler_freq
-
-                tags_db[key] = new_info
+                tags_db[key] = self.report_parser.tag_info(epc, ant_id, prev_info,
+                                                           prev_history, reads)
 
                 if history_enabled:
-                    phase_degree, self_diff_phase = prev_history.add_data(new_first_seen_tstamp,
-                                                                        peakrssi_new,
-                                                                        channel_idx_new,
-                                                                        phase,
-                                                                        doppler_freq)
-                
-                # *********************************************************************************************************************
-
-                key_1 = (epc_to_save, 1)
-                prev_info_1 = tags_db.get(key_1, {})
-                prev_history_1 = prev_info_1.get('history', TagHistory(key_1))
-
-                key_2 = (epc_to_save_diff, 1)
-                prev_info_2 = tags_db.get(key_2, {})
-                prev_history_2 = prev_info_2.get('history', TagHistory(key_2))
-
-                real_time = True
-
-                channel_data_1 = channel_wise_data_per_rf(prev_history_1, real_time)
-                channel_data_2 = channel_wise_data_per_rf(prev_history_2, real_time)
-
-                channel_wise_data = []
-                channel_wise_data.append(channel_data_1)
-                channel_wise_data.append(channel_data_2)
-
-                channel_wise_warped_phases = phase_resolution(channel_wise_data)
+                    phase_degree, self_diff_phase = prev_history.add_batch(reads)
 
-                phase_diff = phase_difference(channel_wise_warped_phases)
-
-                cleaned_phase_diff = clean_phase_difference(phase_diff)
-
-                phase_separation = [diff for sublist in cleaned_phase_diff.values() for diff in sublist]
+                channel_idx_new = int(reads['channel'][-1])
 
                 if(epc==epc1):
                     tag1_detected = True
@@ -466,80 +506,169 @@ class Gui(QtWidgets.QMainWindow):
                     channel_2 = channel_idx_new
                     self.ref_phase = self_diff_phase
 
-                new_tag_seen_count += seen_count_new
                 updated_tag_keys.add(key)
 
-            # Collecting
-            # Time differential
-            add_to_plot = False
-            if(time_diff):
-                diff_phase = self.curr_phase
+            self.total_tags_seen += new_tag_seen_count
+
+        self.update_report_batching(len(batch), report_start)
+
+        self.event_bus.publish(RAW_READS, batch)
+
+        # hand the report over to the processing thread, the queue policy
+        # decides what to do if processing is falling behind
+        self.report_queue.put(batch)
+
+        # self.inventoryReportReceived.emit(updated_tag_keys)
+
+    def processing_loop(self):
+        """processing thread, consumes the reports queued by tag_report_cb
+        """
+        while not self.processing_stop.is_set():
+            batch = self.report_queue.get(timeout=0.1)
+            if batch is not None:
+                process_start = monotonic()
+                self.process_report(batch)
+                self.batch_controller.record_processing(monotonic() - process_start)
+
+    def start_processing(self):
+        if self.processing_thread is None:
+            self.report_queue.open()
+            self.processing_stop.clear()
+            self.processing_thread = threading.Thread(target=self.processing_loop,
+                                                      daemon=True)
+            self.processing_thread.start()
+
+    def stop_processing(self):
+        if self.processing_thread is not None:
+            # the reader may still report until it is disconnected
+            self.report_queue.close()
+            self.processing_stop.set()
+            self.processing_thread.join()
+            self.processing_thread = None
+            logger.info("report queue: %s", self.report_queue.stats())
+
+    def process_report(self, batch):
+        """computes the differential phase of a report and plots it
+        """
+        # sllurp also reports empty tag lists
+        if not len(batch):
+            return
+        # time of the report (ms since reader start), its last read
+        time = int(batch['first_seen'][-1])
+        tags_db = self.tags_db
+
+        epc1 = epc_to_save
+        epc2 = epc_to_save_diff
+        time_diff=False
+
+        # *********************************************************************************************************************
+        # DTW over the real-time window, once per report now that every
+        # history holds the reads of the whole report
+
+        key_1 = (epc_to_save, 1)
+        prev_info_1 = tags_db.get(key_1, {})
+        prev_history_1 = prev_info_1.get('history', TagHistory(key_1))
+
+        key_2 = (epc_to_save_diff, 1)
+        prev_info_2 = tags_db.get(key_2, {})
+        prev_history_2 = prev_info_2.get('history', TagHistory(key_2))
+
+        # the fused estimate does not need the window
+        if LIVE_ESTIMATOR == "dtw":
+            phase_separation = real_time_phase_separation(prev_history_1, prev_history_2)
+
+        # Collecting
+        # Time differential
+        add_to_plot = False
+        if(time_diff):
+            diff_phase = self.curr_phase
+            add_to_plot = True
+        # RFID differential
+        else:
+            # every read of either tag is paired with the per-channel
+            # phase model of the other tag
+            id_1, id_2 = self.report_parser.tag_ids((epc1, epc2))
+            sensor_reads = batch[np.isin(batch['tag_id'], (id_1, id_2))
+                                 & (batch['phase'] >= 0)]
+            estimates = self.phase_pairer.update((sensor_reads['tag_id'] == id_2).astype(int),
+                                                 sensor_reads['channel'],
+                                                 sensor_reads['first_seen'],
+                                                 sensor_reads['phase'])
+            paired = ~np.isnan(estimates)
+            # fold each estimate before averaging the report
+            estimates = fold_phase_difference(estimates[paired])
+            paired_reads = sensor_reads[paired]
+            estimates, outliers = self.hampel_filter.update(paired_reads['channel'], estimates)
+            # leave out the channels currently suffering from multipath
+            keep = self.multipath_rejector.update(paired_reads['channel'], estimates)
+            if not self.hampel_filter.replace:
+                keep &= ~outliers
+            estimates = estimates[keep]
+            self.publish_diff_phase(paired_reads[keep], estimates)
+            # absolute, as the DTW phase separation and the classification
+            self.phase_fusion.update(paired_reads['channel'][keep],
+                                     paired_reads['first_seen'][keep], np.abs(estimates))
+            # the gaps of the resampled phase (nan) restart the cadence window
+            _, samples, _ = self.resampler.update(paired_reads['first_seen'][keep],
+                                                  np.abs(estimates))
+            self.update_cadence(samples, time)
+            if(len(estimates)):
+                diff_phase = np.mean(estimates) # useful data
                 add_to_plot = True
-            # RFID differential
-            else:
-                # Problem 1: reduced throughput because it assumes tag1+tag2
-                # count number of 
-                if(tag1_detected and self.ref_phase!=-1):
-                    # 
-                    diff_phase = self.curr_phase - self.ref_phase # useful data
-                    add_to_plot = True
-                # else
-                # do counts 
-
-            # Processing Data
-            if(add_to_plot):
-                # Cleaning Data (0-360)
-                if(np.abs(diff_phase)>300):
-                    diff_phase = diff_phase - np.sign(diff_phase)*360
-                # Impinj induced changes (0-180)
-                if(np.abs(diff_phase)>150):
-                    diff_phase = diff_phase - np.sign(diff_phase)*180
-
-                do_dtw = True
-                dtw_mean_phase = np.mean(phase_separation)
-                # if do_dtw:
-                #     print("dtw_mean_phase: ", dtw_mean_phase)
-                # else: 
-                #     print("diff_phase: ", diff_phase)
-
-                # Reject multipath v0
-                if(self.array_populated):
-                    self.rolling_idx=(self.rolling_idx+1)%self.vec_size
-                    self.diff_phase_arr[self.rolling_idx] = diff_phase # add new phase
-
-                    if(np.std(self.diff_phase_arr)<self.std_threshold): # if combined std dev is <3 degree
-                        avg_phase = np.mean(self.diff_phase_arr) # report average phase of past vec_size values
-
-                        # QT Code Add to plot: useful data
-                        self.x = self.x[1:]  # Remove the first y element.
-                        self.x.append(self.x[-1] + 1)  # Add a new value 1 higher than the last.
-                        self.y = self.y[1:]  # Remove the first
-                        if do_dtw:
-                            self.y.append(dtw_mean_phase)  # Add dtw'ed phase diff mean
-                        else:
-                            self.y.append(avg_phase)  # Add a new random value.
-                        self.data_line.setData(self.x, self.y)  # Update the data.
 
-                    else:
-                        if not do_dtw:
-                            print("Multipath!")
-                        # should you reset the array?
-                        # any other way of avoiding?
-                        # Roll back the rolling idx
-                else:
-                    self.rolling_idx=(self.rolling_idx+1)%self.vec_size # update rolling index
+        # Processing Data
+        if(add_to_plot):
+            # Cleaning Data (0-360)
+            if(np.abs(diff_phase)>300):
+                diff_phase = diff_phase - np.sign(diff_phase)*360
+            # Impinj induced changes (0-180)
+            if(np.abs(diff_phase)>150):
+                diff_phase = diff_phase - np.sign(diff_phase)*180
+
+            do_dtw = True
+            if LIVE_ESTIMATOR == "dtw":
+                live_phase = np.mean(phase_separation)
+            else:
+                live_phase, self.live_phase_std = self.phase_fusion.estimate(time)
+            # if do_dtw:
+            #     print("live_phase: ", live_phase)
+            # else: 
+            #     print("diff_phase: ", diff_phase)
+
+            # Reject multipath v1: spread of the phase of the last vec_size reports
+            self.diff_phase_stats.append(diff_phase)
+            if(self.diff_phase_stats.full):
+                if(self.diff_phase_stats.std()<self.std_threshold):
+                    avg_phase = self.diff_phase_stats.mean # average phase of past vec_size values
+
+                    # QT Code Add to plot: useful data
+                    self.x.append(time / 1000)  # Add the time of the report
                     if do_dtw:
-                        self.diff_phase_arr[self.rolling_idx] = dtw_mean_phase # add new dtw'ed phase diff to the array
+                        self.y.append(self.plot_smoother.update(live_phase))  # Add the live phase estimate
                     else:
-                        self.diff_phase_arr[self.rolling_idx] = diff_phase # add new diff_phase to the array
-                    if(self.rolling_idx==self.vec_size-1): # if my roilling index reaches size
-                        self.array_populated=True # set flag to true
-
+                        self.y.append(self.plot_smoother.update(avg_phase))
+                    del self.x[:-self.n_data_pts]  # Keep the last n_data_pts
+                    del self.y[:-self.n_data_pts]
+                    self.data_line.setData(self.x, self.y)  # Update the data.
 
-            self.total_tags_seen += new_tag_seen_count
+                else:
+                    if not do_dtw:
+                        print("Multipath!")
 
+    def update_cadence(self, samples, time):
+        """updates the dominant frequency with the new samples of the resampled
+        differential phase, up to the report time (ms)
+        """
+        if not len(samples):
+            return
+        self.cadence_estimator.update(samples)
+        self.cadence = self.cadence_estimator.estimate()
 
-        # self.inventoryReportReceived.emit(updated_tag_keys)
+        if self.event_bus.has_subscribers(CADENCE) and self.cadence_estimator.ready:
+            payload = np.empty(1, dtype=CADENCE.dtype)
+            payload['time'] = time
+            payload['frequency'], payload['amplitude'] = self.cadence
+            self.event_bus.publish(CADENCE, payload)
 
     def reader_event_cb(self, reader, events):
         timestamp_event = events.get('UTCTimestamp', {})
@@ -556,23 +685,52 @@ class Gui(QtWidgets.QMainWindow):
             if event_type == 'Start_of_ROSpec' and not self.reader_start_time:
                 self.reader_start_time = timestamp_us
 
+    def publish_diff_phase(self, reads, estimates):
+        """publishes the folded differential phase estimates of a report, and
+        their classification, on the event bus
+        """
+        bus = self.event_bus
+        if not (bus.has_subscribers(DIFF_PHASE) or bus.has_subscribers(CLASSIFICATION)):
+            return
+        diff_phase = diff_phase_payload(reads, estimates)
+        bus.publish(DIFF_PHASE, diff_phase)
+        if bus.has_subscribers(CLASSIFICATION):
+            categories = classify(np.abs(estimates), self.sensor_edges)
+            bus.publish(CLASSIFICATION, classification_payload(diff_phase, categories))
+
+    def start_streaming(self):
+        if STREAM_ENABLED and self.stream_publisher is None:
+            self.stream_publisher = StreamPublisher(self.event_bus, STREAM_GROUP,
+                                                    STREAM_PORT, STREAM_INTERVAL)
+            self.stream_publisher.start()
+
+    def stop_streaming(self):
+        if self.stream_publisher is not None:
+            self.stream_publisher.stop()
+            logger.info("stream: %d packets sent", self.stream_publisher.sent_packets)
+            self.stream_publisher = None
+
     def clear_tags_db(self):
-        with self.tags_db_lock:
-            self.tags_db = {}
+        self.tags_db.clear()
+        self.phase_pairer.reset()
+        self.multipath_rejector.reset()
+        self.diff_phase_stats.reset()
+        self.plot_smoother.reset()
+        self.hampel_filter.reset()
+        self.phase_fusion.reset()
+        self.resampler.reset()
+        self.cadence_estimator.reset()
 
     def get_tags_db_copy(self):
         """Freeze the value of the tags db for display
 
-        Warning: This is not a deep copy of the db, and except the tag key list
-        itself, it will still be "reference" to inner tag info and history.
-        This should be crash-free acceptable even if maybe not always
-        perfectly consistent as tags info are updated atomically by
-        tag_report_cb.
-        The goal of the lock and copy is mainly to avoid unexecpected issues
-        with the "clear_tags" operation at the wrong time.
+        Returns an immutable snapshot of the tags db. Tag infos are replaced,
+        never mutated, by tag_report_cb so the snapshot is consistent at its
+        epoch; the histories it references are still live objects.
+        Taking a snapshot only briefly locks the shards that changed since the
+        previous one, it never waits on a whole report being processed.
         """
-        with self.tags_db_lock:
-            return self.tags_db.copy()
+        return self.tags_db.snapshot().tags
 
     def parseInventoryReport(self, updated_tag_keys):
         """Function called each time the reader reports seeing tags,
@@ -0,0 +1,49 @@
+import numpy as np
+
+from RollingStats import RollingMedian
+
+# MAD to standard deviation of a normal distribution
+MAD_SCALE = 1.4826
+
+class HampelFilter:
+    """Streaming per channel Hampel filter.
+
+    A value is an outlier when it is more than k scaled MADs away from the
+    median of the `window` values its channel had before it. Outliers are
+    flagged, and replaced by that median if `replace`. Each channel keeps a
+    RollingMedian of its last values, so testing a value is a bisection in
+    a sorted window instead of sorting it.
+    """
+
+    def __init__(self, window=7, k=3.0, replace=True, n_channels=50, min_values=3):
+        self.window = window
+        self.k = k
+        self.replace = replace
+        self.min_values = min_values
+        self.channels = [RollingMedian(window) for _ in range(n_channels)]
+        self.outlier_count = 0
+
+    def update(self, channels, values):
+        """Filters a batch of values (in read order), returns the
+        (values, outliers) tuple of the filtered values and the outlier mask
+        """
+        values = np.array(values, dtype=np.float64)
+        outliers = np.zeros(len(values), dtype=bool)
+        for i, (channel, value) in enumerate(zip(np.asarray(channels).tolist(),
+                                                 values.tolist())):
+            stats = self.channels[channel - 1]
+            if len(stats.sorted) >= self.min_values:
+                median = stats.median()
+                if abs(value - median) > self.k * MAD_SCALE * stats.mad():
+                    outliers[i] = True
+                    if self.replace:
+                        values[i] = median
+            # the raw values enter the window, so a lasting change is followed
+            stats.append(value)
+        self.outlier_count += int(np.count_nonzero(outliers))
+        return (values, outliers)
+
+    def reset(self):
+        for stats in self.channels:
+            stats.reset()
+        self.outlier_count = 0
@@ -0,0 +1,125 @@
+from time import monotonic
+import numpy as np
+import pyqtgraph as pg
+from PyQt5 import QtWidgets, QtCore
+
+from EventBus import RAW_READS, DIFF_PHASE, CADENCE
+
+class Series:
+    """Growing x/y arrays, preallocated and doubled when full so appending is
+    amortized O(1) and plotting only passes views of the filled part
+    """
+
+    def __init__(self, capacity=4096):
+        self.x = np.empty(capacity)
+        self.y = np.empty(capacity)
+        self.size = 0
+
+    def append(self, x, y):
+        n = len(x)
+        if self.size + n > len(self.x):
+            capacity = max(2 * len(self.x), self.size + n)
+            self.x = np.resize(self.x, capacity)
+            self.y = np.resize(self.y, capacity)
+        self.x[self.size:self.size + n] = x
+        self.y[self.size:self.size + n] = y
+        self.size += n
+
+    def data(self):
+        return (self.x[:self.size], self.y[:self.size])
+
+class LiveView(QtWidgets.QWidget):
+    """Live view of a session: differential phase per channel, RSSI and read
+    rate per sensor tag, against time since reader start.
+
+    The view subscribes to an EventBus and redraws every `interval` ms from
+    the payloads queued since the previous frame. Curves use clip-to-view and
+    peak downsampling, so a frame only costs the visible points at screen
+    resolution however long the session grows.
+    """
+
+    def __init__(self, bus, report_parser, epcs, interval=100, *args, **kwargs):
+        super(LiveView, self).__init__(*args, **kwargs)
+        self.report_parser = report_parser
+        self.epcs = epcs
+        self.reads = bus.subscribe(RAW_READS, maxsize=1024)
+        self.diff_phases = bus.subscribe(DIFF_PHASE, maxsize=1024)
+        self.cadence = bus.subscribe(CADENCE, maxsize=16)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        self.plots = pg.GraphicsLayoutWidget()
+        self.plots.setBackground('w')
+        layout.addWidget(self.plots)
+
+        self.phase_plot = self._add_plot(0, 'Differential phase (°)')
+        self.rssi_plot = self._add_plot(1, 'RSSI (dBm)')
+        self.rate_plot = self._add_plot(2, 'Reads/s')
+        self.rate_plot.setLabel('bottom', 'Time (s)')
+        self.rssi_plot.setXLink(self.phase_plot)
+        self.rate_plot.setXLink(self.phase_plot)
+
+        # one curve per channel, created on its first value
+        self.channel_series = {}
+        self.channel_curves = {}
+        self.tag_colors = [(255, 0, 0), (0, 0, 255)]
+        self.rssi_series = [Series() for _ in epcs]
+        self.rssi_curves = [self._add_curve(self.rssi_plot, color) for color in self.tag_colors]
+        self.rate_series = [Series() for _ in epcs]
+        self.rate_curves = [self._add_curve(self.rate_plot, color, symbol=False)
+                            for color in self.tag_colors]
+        self.rate_counts = np.zeros(len(epcs))
+        self.rate_start = monotonic()
+
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.update_view)
+        self.timer.start(interval)
+
+    def _add_plot(self, row, label):
+        plot = self.plots.addPlot(row=row, col=0)
+        plot.setLabel('left', label)
+        plot.showGrid(x=True, y=True)
+        plot.setClipToView(True)
+        plot.setDownsampling(auto=True, mode='peak')
+        return plot
+
+    def _add_curve(self, plot, color, symbol=True):
+        curve = plot.plot(pen=None if symbol else pg.mkPen(color=color, width=2),
+                          symbol='o' if symbol else None, symbolSize=3,
+                          symbolPen=None, symbolBrush=color)
+        curve.setSkipFiniteCheck(True)
+        return curve
+
+    def update_view(self):
+        cadence = self.cadence.drain()
+        if len(cadence):
+            self.phase_plot.setTitle("Cadence: %.2f Hz, %.1f°" % (cadence['frequency'][-1],
+                                                                  cadence['amplitude'][-1]))
+
+        diff_phase = self.diff_phases.drain()
+        for channel in np.unique(diff_phase['channel']).tolist():
+            values = diff_phase[diff_phase['channel'] == channel]
+            if channel not in self.channel_series:
+                self.channel_series[channel] = Series()
+                color = pg.intColor(channel - 1, hues=50)
+                self.channel_curves[channel] = self._add_curve(self.phase_plot, color)
+            self.channel_series[channel].append(values['time'] / 1000, values['diff_phase'])
+            self.channel_curves[channel].setData(*self.channel_series[channel].data())
+
+        reads = self.reads.drain()
+        tag_ids = self.report_parser.tag_ids(self.epcs)
+        for tag, tag_id in enumerate(tag_ids):
+            tag_reads = reads[reads['tag_id'] == tag_id]
+            self.rate_counts[tag] += len(tag_reads)
+            if len(tag_reads):
+                self.rssi_series[tag].append(tag_reads['first_seen'] / 1000, tag_reads['rssi'])
+                self.rssi_curves[tag].setData(*self.rssi_series[tag].data())
+
+        # read rate over about a second
+        elapsed = monotonic() - self.rate_start
+        if elapsed >= 1 and len(reads):
+            now = reads['first_seen'][-1] / 1000
+            for tag in range(len(self.epcs)):
+                self.rate_series[tag].append([now], [self.rate_counts[tag] / elapsed])
+                self.rate_curves[tag].setData(*self.rate_series[tag].data())
+            self.rate_counts[:] = 0
+            self.rate_start = monotonic()
@@ -0,0 +1,66 @@
+import numpy as np
+
+class PhaseFusion:
+    """Per channel recursive (scalar Kalman) estimate of the differential
+    phase, fused over channels.
+
+    Each channel keeps a random walk state: its variance grows by
+    `process_noise` deg^2 per second between reads, and a read updates it in
+    O(1) with a measurement noise learned from the channel's own innovations.
+    The fused estimate weights each channel by the inverse of its variance
+    grown up to the fusion time, so channels read often, recently and with
+    little noise dominate, and stale channels fade out.
+    """
+
+    def __init__(self, process_noise=25.0, measurement_noise=100.0, noise_alpha=0.05,
+                 min_noise=1.0, n_channels=50):
+        self.process_noise = process_noise / 1000   # deg^2 per ms
+        self.measurement_noise = measurement_noise
+        self.noise_alpha = noise_alpha
+        self.min_noise = min_noise
+        self.n_channels = n_channels
+        self.reset()
+
+    def reset(self):
+        self.x = np.zeros(self.n_channels)             # estimate (deg)
+        self.p = np.full(self.n_channels, np.inf)      # estimate variance (deg^2)
+        self.r = np.full(self.n_channels, float(self.measurement_noise))
+        self.times = np.zeros(self.n_channels)         # last read time (ms)
+        self.counts = np.zeros(self.n_channels, dtype=np.int64)
+
+    def update(self, channels, times, values):
+        """Adds reads (channel, time in ms, differential phase in degrees),
+        in read order
+        """
+        x, p, r, last_times = self.x, self.p, self.r, self.times
+        for channel, time, value in zip(np.asarray(channels).tolist(),
+                                        np.asarray(times).tolist(),
+                                        np.asarray(values).tolist()):
+            c = channel - 1
+            if self.counts[c] == 0:
+                x[c] = value
+                p[c] = r[c]
+            else:
+                # predict, then correct
+                prior = p[c] + self.process_noise * max(time - last_times[c], 0)
+                innovation = value - x[c]
+                gain = prior / (prior + r[c])
+                x[c] += gain * innovation
+                p[c] = (1 - gain) * prior
+                r[c] += self.noise_alpha * (innovation * innovation - r[c])
+                r[c] = max(r[c], self.min_noise)
+            last_times[c] = time
+            self.counts[c] += 1
+
+    def estimate(self, time):
+        """Returns the (estimate, std) of the differential phase fused over
+        the channels at a time (ms), (nan, nan) before any read
+        """
+        seen = self.counts > 0
+        if not np.any(seen):
+            return (np.nan, np.nan)
+        ages = np.maximum(time - self.times[seen], 0)
+        variances = self.p[seen] + self.process_noise * ages
+        weights = 1 / variances
+        total = weights.sum()
+        return (float(np.dot(weights, self.x[seen]) / total), float(np.sqrt(1 / total)))
@@ -0,0 +1,67 @@
+import numpy as np
+
+DEGREES_PER_COUNT = 360 / 4096
+
+class PhasePairer:
+    """Produces a differential phase estimate on every read of either tag
+    of a sensor.
+
+    For each tag and channel it keeps a model of the tag's recent phase:
+    the last value and its read time, plus, with `linear`, the slope
+    between the last two reads of the channel. When a tag is read, its
+    phase is paired with the model of the other tag on the same channel,
+    extrapolated to the read time, as long as that model is not older than
+    `max_age` ms. Reads of the reference tag therefore produce estimates
+    too, instead of only the reads of the sensing tag.
+
+    Estimates are tag 1 minus tag 2, in degrees, nan when the other tag
+    has no fresh enough phase on the channel.
+    """
+
+    def __init__(self, max_age=500, linear=False, n_channels=50):
+        self.max_age = max_age
+        self.linear = linear
+        self.times = np.full((2, n_channels), np.nan)
+        self.phases = np.zeros((2, n_channels))
+        self.slopes = np.zeros((2, n_channels))
+        self.paired_count = 0
+        self.stale_count = 0
+
+    def reset(self):
+        self.times[:] = np.nan
+        self.phases[:] = 0
+        self.slopes[:] = 0
+
+    def update(self, tags, channels, times, phases):
+        """Feeds reads in report order.
+
+        tags are 0 for the sensing tag and 1 for the reference tag, channels
+        are 1-based channel indexes, times are in ms and phases are raw 12-bit
+        ImpinjRFPhaseAngle counts. Returns the estimate of each read.
+        """
+        estimates = np.full(len(tags), np.nan)
+        phases_deg = np.asarray(phases, dtype=np.float64) * DEGREES_PER_COUNT
+        for i, (tag, channel, time, phase) in enumerate(zip(
+                np.asarray(tags).tolist(), np.asarray(channels).tolist(),
+                np.asarray(times).tolist(), phases_deg.tolist())):
+            c = channel - 1
+            if self.linear and not np.isnan(self.times[tag, c]):
+                dt = time - self.times[tag, c]
+                if dt > 0:
+                    # phase steps are only meaningful modulo 180 (Impinj pi jumps)
+                    step = (phase - self.phases[tag, c] + 90) % 180 - 90
+                    self.slopes[tag, c] = step / dt
+            self.times[tag, c] = time
+            self.phases[tag, c] = phase
+
+            other = 1 - tag
+            age = time - self.times[other, c]
+            if not abs(age) <= self.max_age:
+                # also covers a channel never read by the other tag (nan)
+                self.stale_count += 1
+                continue
+            other_phase = self.phases[other, c] + self.slopes[other, c] * age
+            estimates[i] = phase - other_phase if tag == 0 else other_phase - phase
+            self.paired_count += 1
+
+        return estimates
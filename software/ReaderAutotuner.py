@@ -0,0 +1,149 @@
+import os
+import json
+import datetime
+import logging as logger
+from time import sleep
+
+import numpy as np
+
+from PhasePairer import PhasePairer
+
+def load_reader_tuning(path, site):
+    """Returns the inventory settings tuned for a site, {} if it was never tuned
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f).get(site, {}).get('config', {})
+
+def save_reader_tuning(path, site, config, metrics):
+    """Stores the tuned inventory settings of a site, next to the ones of the
+    other sites
+    """
+    tunings = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            tunings = json.load(f)
+    tunings[site] = {
+        'config': config,
+        'metrics': metrics,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(tunings, f, indent=4)
+    os.replace(tmp_path, path)
+
+def inventory_kwargs(config, antennas=(1,)):
+    """Converts a tuned config into startInventory keyword arguments, the
+    tx_power power table index being applied to every antenna
+    """
+    kwargs = dict(config)
+    if 'tx_power' in kwargs:
+        kwargs['tx_power'] = {antenna: kwargs['tx_power'] for antenna in antennas}
+    return kwargs
+
+def pair_metrics(history_1, history_2, dwell, max_age):
+    """Measures the pair read rate and phase stability of the two tags of a
+    sensor from their histories.
+
+    Every read of either tag is paired with the other tag's last read on the
+    same channel (see PhasePairer). The pair read rate is the number of
+    paired reads per second, the phase stability the median over channels of
+    the circular standard deviation of the differential phase, in degrees,
+    modulo 180 to ignore the Impinj pi jumps.
+    """
+    with history_1.data_lock, history_2.data_lock:
+        times = np.array(history_1.times + history_2.times, dtype=np.float64)
+        channels = np.array(history_1.channels + history_2.channels, dtype=np.int64)
+        phases = np.array(history_1.phase_counts + history_2.phase_counts, dtype=np.float64)
+        tags = np.repeat([0, 1], [len(history_1.times), len(history_2.times)])
+
+    order = np.argsort(times, kind='stable')
+    estimates = PhasePairer(max_age).update(tags[order], channels[order],
+                                            times[order], phases[order])
+    paired = ~np.isnan(estimates)
+    pair_rate = float(np.count_nonzero(paired) / dwell)
+
+    stds = []
+    paired_channels = channels[order][paired]
+    doubled = np.deg2rad(estimates[paired]) * 2
+    for channel in np.unique(paired_channels):
+        angles = doubled[paired_channels == channel]
+        if len(angles) < 2:
+            continue
+        r = min(np.abs(np.mean(np.exp(1j * angles))), 1.0)
+        stds.append(np.rad2deg(np.sqrt(-2 * np.log(max(r, 1e-12)))) / 2)
+    phase_std = float(np.median(stds)) if stds else float('inf')
+
+    return {'pair_rate': pair_rate, 'phase_std': phase_std,
+            'reads': int(len(times))}
+
+class ReaderAutotuner:
+    """Sweeps inventory settings on a connected AntennaReader (or Gui) and
+    selects the ones giving the best pair read rate for a sensor.
+
+    The search space maps startInventory arguments to the values to try. It
+    is swept one argument at a time, the others being kept at the best
+    values found so far, so the number of dwells is the sum, not the
+    product, of the number of values. A configuration is preferred when its
+    phase stability is within max_phase_std, then by pair read rate.
+    """
+
+    def __init__(self, reader, epcs, dwell=5.0, max_phase_std=20,
+                 max_age=500, antennas=(1,)):
+        self.reader = reader
+        self.epcs = epcs
+        self.dwell = dwell
+        self.max_phase_std = max_phase_std
+        self.max_age = max_age
+        self.antennas = antennas
+        self.results = []
+
+    def measure(self, config):
+        """Runs an inventory of dwell seconds with config and returns its metrics
+        """
+        self.reader.clear_tags_db()
+        self.reader.startInventory(antennas=self.antennas,
+                                   **inventory_kwargs(config, self.antennas))
+        sleep(self.dwell)
+        self.reader.stopInventory()
+
+        tags_db = self.reader.get_tags_db_copy()
+        histories = [tags_db[(epc, self.antennas[0])]['history']
+                     if (epc, self.antennas[0]) in tags_db else None
+                     for epc in self.epcs]
+        if None in histories:
+            metrics = {'pair_rate': 0.0, 'phase_std': float('inf'), 'reads': 0}
+        else:
+            metrics = pair_metrics(histories[0], histories[1], self.dwell, self.max_age)
+        logger.info("autotune %s: %.1f pairs/s, phase std %.1f deg",
+                    config, metrics['pair_rate'], metrics['phase_std'])
+        self.results.append((dict(config), metrics))
+        return metrics
+
+    def score(self, metrics):
+        return (metrics['phase_std'] <= self.max_phase_std,
+                metrics['pair_rate'], -metrics['phase_std'])
+
+    def tune(self, search_space, base_config=None):
+        """Returns the (config, metrics) of the best configuration found
+        """
+        best_config = dict(base_config or {})
+        for name, values in search_space.items():
+            best_config.setdefault(name, values[0])
+        best_metrics = self.measure(best_config)
+
+        for name, values in search_space.items():
+            for value in values:
+                if value == best_config[name]:
+                    continue
+                config = dict(best_config, **{name: value})
+                metrics = self.measure(config)
+                if self.score(metrics) > self.score(best_metrics):
+                    best_config, best_metrics = config, metrics
+
+        logger.info("autotune selected %s (%.1f pairs/s, phase std %.1f deg)",
+                    best_config, best_metrics['pair_rate'], best_metrics['phase_std'])
+        return (best_config, best_metrics)
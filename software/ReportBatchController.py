@@ -0,0 +1,104 @@
+import threading
+from time import monotonic
+
+class ReportBatchController:
+    """Adapts report_every_n_tags to the measured load.
+
+    The reader classes report every tag report (record_report), the time
+    the reader callback spends handling it (record_cost) and, when reports
+    are processed on their own thread, the time spent processing them
+    (record_processing). Every `interval` seconds the controller looks at
+    the busiest of the two threads in that window and, if a ReportQueue is
+    attached (`queue`), at its backlog: a queue that shed reports or is more
+    than `high_load` full counts as overloaded. Above `high_load` it doubles
+    the batching to amortize the per-message overhead, below `low_load` it
+    halves it to get the latency back. The batching is always capped so
+    that, at the measured read rate, a report is not held for more than
+    `target_latency` seconds.
+
+    Applying a new batching restarts the inventory, which loses the reads
+    of the restart, so it changes at most once every `min_change_interval`
+    seconds.
+    """
+
+    def __init__(self, report_every_n_tags=1, min_n=1, max_n=32,
+                 target_latency=0.1, interval=2.0, low_load=0.1, high_load=0.5,
+                 min_change_interval=30.0, queue=None):
+        self.n = report_every_n_tags
+        self.min_n = min_n
+        self.max_n = max_n
+        self.target_latency = target_latency
+        self.interval = interval
+        self.low_load = low_load
+        self.high_load = high_load
+        self.min_change_interval = min_change_interval
+        self.queue = queue
+
+        self._lock = threading.Lock()
+        self._window_start = monotonic()
+        self._last_change = self._window_start
+        self._busy = 0.0
+        self._processing = 0.0
+        self._tags = 0
+        self._reports = 0
+        self._shed_reads = 0
+        self.last_load = 0.0
+        self.last_read_rate = 0.0
+
+    def record_cost(self, seconds):
+        with self._lock:
+            self._busy += seconds
+
+    def record_processing(self, seconds):
+        with self._lock:
+            self._processing += seconds
+
+    def _queue_load(self):
+        # fill of the queue, or full load if it shed reads in the window
+        stats = self.queue.stats()
+        shed_reads = stats['shed_reads'] - self._shed_reads
+        self._shed_reads = stats['shed_reads']
+        if shed_reads > 0:
+            return 1.0
+        return stats['queued_batches'] / self.queue.maxsize
+
+    def record_report(self, n_tags):
+        """Accounts a tag report, returns the new report_every_n_tags when it
+        should change, None otherwise.
+        """
+        with self._lock:
+            self._tags += n_tags
+            self._reports += 1
+            now = monotonic()
+            elapsed = now - self._window_start
+            if elapsed < self.interval:
+                return None
+
+            load = max(self._busy, self._processing) / elapsed
+            if self.queue is not None:
+                load = max(load, self._queue_load())
+            read_rate = self._tags / elapsed
+            self.last_load = load
+            self.last_read_rate = read_rate
+            self._window_start = now
+            self._busy = 0.0
+            self._processing = 0.0
+            self._tags = 0
+            self._reports = 0
+
+            if now - self._last_change < self.min_change_interval:
+                return None
+
+            n = self.n
+            if load > self.high_load:
+                n = n * 2
+            elif load < self.low_load:
+                n = n // 2
+            latency_cap = int(read_rate * self.target_latency)
+            n = max(self.min_n, min(n, self.max_n, max(latency_cap, self.min_n)))
+
+            if n == self.n:
+                return None
+            self.n = n
+            self._last_change = now
+            return n
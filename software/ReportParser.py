@@ -0,0 +1,119 @@
+import numpy as np
+
+REPORT_DTYPE = np.dtype([
+    ('tag_id', np.int32),       # interned EPC, see ReportParser.epcs
+    ('antenna_id', np.int32),
+    ('first_seen', np.int64),   # ms since reader start
+    ('last_seen', np.int64),    # ms since reader start
+    ('seen_count', np.int32),
+    ('channel', np.int32),
+    ('rssi', np.int32),
+    ('phase', np.int32),        # raw 12-bit ImpinjRFPhaseAngle, -1 if not reported
+    ('doppler', np.float64),    # ImpinjRFDopplerFrequency, nan if not reported
+])
+
+MISSING_TIMESTAMP = -1
+
+class ReportParser:
+    """Converts sllurp tag reports into REPORT_DTYPE structured arrays.
+
+    A report is read in a single pass into a typed batch; the EPC bytes are
+    interned to a small integer id so the utf-8 decode and upper() happen
+    once per distinct tag instead of once per read.
+    """
+
+    def __init__(self):
+        self.epcs = []
+        self._epc_ids = {}
+        self._ids_by_epc = {}
+
+    def epc_id(self, raw_epc):
+        tag_id = self._epc_ids.get(raw_epc)
+        if tag_id is None:
+            tag_id = len(self.epcs)
+            epc = raw_epc.decode("utf-8").upper()
+            self.epcs.append(epc)
+            self._epc_ids[raw_epc] = tag_id
+            self._ids_by_epc[epc] = tag_id
+        return tag_id
+
+    def tag_ids(self, epcs):
+        """Returns the ids of EPC strings, -1 for the ones never seen yet
+        """
+        return [self._ids_by_epc.get(epc, -1) for epc in epcs]
+
+    def parse(self, tags, start_time):
+        """Parses a report.
+
+        start_time is the reader start timestamp in us (None or 0 if unknown,
+        it is then taken from the first tag of the report).
+        Returns the (batch, start_time) tuple.
+        """
+        rows = [(self.epc_id(tag["EPC"]),
+                 tag["AntennaID"],
+                 tag.get('FirstSeenTimestampUTC', MISSING_TIMESTAMP),
+                 tag.get('LastSeenTimestampUTC', MISSING_TIMESTAMP),
+                 tag.get('TagSeenCount', 1),
+                 tag.get('ChannelIndex', 0),
+                 tag.get('PeakRSSI', -120),
+                 tag.get('ImpinjRFPhaseAngle', -1),
+                 tag.get('ImpinjRFDopplerFrequency', np.nan))
+                for tag in tags]
+        batch = np.array(rows, dtype=REPORT_DTYPE)
+
+        if not start_time:
+            # ROSpec start was missed, or data was cleared mid-inventory
+            start_time = 0
+            if len(batch) and batch['first_seen'][0] != MISSING_TIMESTAMP:
+                start_time = int(batch['first_seen'][0])
+
+        # Convert to milliseconds, a missing timestamp defaults to start_time
+        for field in ('first_seen', 'last_seen'):
+            stamps = batch[field]
+            batch[field] = np.where(stamps == MISSING_TIMESTAMP, 0,
+                                    (stamps - start_time) // 1000)
+
+        return (batch, start_time)
+
+    @staticmethod
+    def group_by_tag(batch):
+        """Yields (tag_id, antenna_id, reads) for every (tag, antenna) of a
+        batch, the reads of a group keeping their report order.
+        """
+        if not len(batch):
+            return
+        keys = batch['tag_id'].astype(np.int64) << 32 | batch['antenna_id'].astype(np.int64)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        bounds = np.flatnonzero(np.diff(sorted_keys)) + 1
+        for group in np.split(order, bounds):
+            reads = batch[group]
+            yield (int(reads['tag_id'][0]), int(reads['antenna_id'][0]), reads)
+
+    @staticmethod
+    def tag_info(epc, antenna_id, prev_info, history, reads):
+        """Builds the tags db info of a tag from its previous info and its
+        reads of the current report (as yielded by group_by_tag).
+        """
+        last = reads[-1]
+        new_info = {
+            'epc': epc,
+            'antenna_id': antenna_id,
+            'history': history,
+            # PeakRSSI highest value
+            'rssi': max(int(reads['rssi'].max()), prev_info.get('rssi', -120)),
+            'channel_index': prev_info.get('channel_index', 0) or int(reads['channel'][0]),
+            'seen_count': prev_info.get('seen_count', 0) + int(reads['seen_count'].sum()),
+            'first_seen': prev_info.get('first_seen', int(reads['first_seen'][0])),
+            'last_seen': int(last['last_seen']),
+            'last_rssi': int(last['rssi']),
+            'last_channel_index': int(last['channel'])
+        }
+
+        # Add Impinj specific data if available
+        if last['phase'] >= 0:
+            new_info['impinj_phase'] = int(last['phase'])
+        if not np.isnan(last['doppler']):
+            new_info['impinj_doppler'] = float(last['doppler'])
+
+        return new_info
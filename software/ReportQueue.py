@@ -0,0 +1,133 @@
+import threading
+from collections import deque
+import numpy as np
+
+# What put() does when the queue is full
+BLOCK = "block"                 # wait for the consumer (lossless)
+DROP_OLDEST = "drop_oldest"     # shed the oldest queued batch
+DECIMATE = "decimate"           # merge the backlog, keep the last read per tag and channel
+LATEST_ONLY = "latest"          # only ever keep the most recent batch
+
+POLICIES = (BLOCK, DROP_OLDEST, DECIMATE, LATEST_ONLY)
+
+class ReportQueue:
+    """Bounded queue of ReportParser batches between the ingest path (the
+    reader callback) and a processing thread.
+
+    When processing falls behind, the configured policy decides whether the
+    reader callback waits or what gets shed, so an overload degrades the
+    processed data instead of stalling the LLRP connection. Everything shed
+    is accounted in the counters returned by stats(). Once closed, the queue
+    sheds every batch put, so the reader callback never waits for a consumer
+    that is gone.
+    """
+
+    def __init__(self, maxsize=8, policy=BLOCK):
+        if policy not in POLICIES:
+            raise ValueError("Unknown report queue policy: %s" % policy)
+        self.policy = policy
+        self.maxsize = 1 if policy == LATEST_ONLY else maxsize
+        self._batches = deque()
+        self._cond = threading.Condition()
+        self.closed = False
+
+        self.put_batches = 0
+        self.put_reads = 0
+        self.processed_batches = 0
+        self.shed_batches = 0
+        self.shed_reads = 0
+        self.blocked_count = 0
+
+    def __len__(self):
+        return len(self._batches)
+
+    def _is_full(self):
+        return len(self._batches) >= self.maxsize
+
+    def put(self, batch, timeout=None):
+        """Queues a batch, applying the policy if the queue is full.
+
+        With BLOCK, waits at most timeout seconds (forever if None) and sheds
+        the new batch if the queue is still full or gets closed.
+        """
+        with self._cond:
+            self.put_batches += 1
+            self.put_reads += len(batch)
+
+            if self.closed:
+                self._shed(batch)
+                return
+            if self._is_full():
+                if self.policy == BLOCK:
+                    self.blocked_count += 1
+                    self._cond.wait_for(lambda: self.closed or not self._is_full(), timeout)
+                    if self.closed or self._is_full():
+                        self._shed(batch)
+                        return
+                elif self.policy == DECIMATE:
+                    backlog = np.concatenate(list(self._batches) + [batch])
+                    merged = decimate(backlog)
+                    self.shed_batches += len(self._batches)
+                    self.shed_reads += len(backlog) - len(merged)
+                    self._batches.clear()
+                    batch = merged
+                else:
+                    while self._is_full():
+                        self._shed(self._batches.popleft())
+
+            self._batches.append(batch)
+            self._cond.notify_all()
+
+    def _shed(self, batch):
+        self.shed_batches += 1
+        self.shed_reads += len(batch)
+
+    def get(self, timeout=None):
+        """Returns the oldest batch, or None if none came within timeout seconds
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._batches) > 0, timeout):
+                return None
+            batch = self._batches.popleft()
+            self.processed_batches += 1
+            self._cond.notify_all()
+            return batch
+
+    def close(self):
+        """Sheds the queued batches and the ones put from now on, and wakes
+        up a blocked put
+        """
+        with self._cond:
+            self.closed = True
+            while self._batches:
+                self._shed(self._batches.popleft())
+            self._cond.notify_all()
+
+    def open(self):
+        with self._cond:
+            self.closed = False
+
+    def stats(self):
+        with self._cond:
+            return {
+                'policy': self.policy,
+                'queued_batches': len(self._batches),
+                'put_batches': self.put_batches,
+                'put_reads': self.put_reads,
+                'processed_batches': self.processed_batches,
+                'shed_batches': self.shed_batches,
+                'shed_reads': self.shed_reads,
+                'blocked_count': self.blocked_count,
+            }
+
+def decimate(batch):
+    """Keeps the last read of every (tag, antenna, channel) of a batch, in
+    their original order.
+    """
+    keys = (batch['tag_id'].astype(np.int64) << 32
+            | batch['antenna_id'].astype(np.int64) << 8
+            | batch['channel'].astype(np.int64))
+    # first occurrence in the reversed batch is the last read of each key
+    _, reversed_idx = np.unique(keys[::-1], return_index=True)
+    last_idx = np.sort(len(batch) - 1 - reversed_idx)
+    return batch[last_idx]
@@ -0,0 +1,69 @@
+import numpy as np
+
+METHODS = ("linear", "hold")
+
+class Resampler:
+    """Streaming resampler of irregular samples onto a fixed rate time grid.
+
+    The reads of a tag pair arrive irregularly and hop across channels, the
+    resampler turns their values into one sample every 1/`rate` seconds,
+    interpolated linearly between the samples around each grid time or
+    holding the last one ("hold"). A grid time is emitted once a sample at
+    or after it was seen, so the output never changes afterwards, and the
+    last sample is kept to interpolate across batches. Grid times between
+    samples more than `max_gap` ms apart are gaps: their value is nan.
+    """
+
+    def __init__(self, rate, method="linear", max_gap=1000):
+        if method not in METHODS:
+            raise ValueError("Unknown resampling method: %s" % method)
+        self.rate = rate
+        self.step = 1000 / rate   # ms
+        self.method = method
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        self.last_value = np.nan
+        # index of the next grid time, grid times are multiples of the step
+        self.next_index = None
+
+    def update(self, times, values):
+        """Adds samples (time in ms, value), returns the (times, values, gaps)
+        arrays of the grid times they complete, gaps marking the grid times
+        without samples around them (nan values)
+        """
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        order = np.argsort(times, kind='stable')
+        times, values = times[order], values[order]
+        if self.last_time is not None:
+            # samples older than the last one come too late for their grid times
+            late = times < self.last_time
+            times = np.concatenate(([self.last_time], times[~late]))
+            values = np.concatenate(([self.last_value], values[~late]))
+        if not len(times):
+            return (np.empty(0), np.empty(0), np.empty(0, dtype=bool))
+
+        if self.next_index is None:
+            self.next_index = int(np.ceil(times[0] / self.step))
+        last_index = int(np.floor(times[-1] / self.step))
+        grid = np.arange(self.next_index, last_index + 1) * self.step
+
+        # samples at or before and at or after each grid time
+        before = np.searchsorted(times, grid, side='right') - 1
+        after = np.searchsorted(times, grid, side='left')
+        if self.method == "linear":
+            samples = np.interp(grid, times, values)
+        else:
+            samples = values[before]
+        gaps = np.zeros(len(grid), dtype=bool)
+        if self.max_gap is not None:
+            gaps = times[after] - times[before] > self.max_gap
+            samples[gaps] = np.nan
+
+        self.next_index = max(self.next_index, last_index + 1)
+        self.last_time = times[-1]
+        self.last_value = values[-1]
+        return (grid, samples, gaps)
@@ -0,0 +1,204 @@
+import math
+from bisect import bisect_left, insort
+from collections import deque
+import numpy as np
+
+class CircularWindow:
+    """Circular mean and standard deviation of the last `size` angles, in
+    degrees modulo `period`, updated in O(1) per value from the rolling sum
+    of their unit vectors.
+
+    With a period of 180 degrees, values folded into (-150, 150] around the
+    Impinj pi jumps are compared modulo 180, so a stable differential phase
+    near the fold point, flipping between +149 and -149, has a spread of 2
+    degrees instead of 149.
+    """
+
+    def __init__(self, size, period=180.0):
+        self.size = size
+        self.period = period
+        self.values = np.zeros(size)
+        self.vectors = np.zeros(size, dtype=np.complex128)
+        self.count = 0
+        self.index = 0
+        self._sum = 0j
+
+    @property
+    def full(self):
+        return self.count == self.size
+
+    def append(self, value):
+        value = float(value)
+        vector = complex(np.exp(2j * math.pi * value / self.period))
+        if self.count < self.size:
+            self.count += 1
+        else:
+            self._sum -= self.vectors[self.index]
+        self._sum += vector
+        self.values[self.index] = value
+        self.vectors[self.index] = vector
+        self.index = (self.index + 1) % self.size
+        # rounding errors of the running sum never accumulate past a window
+        if self.index == 0:
+            self._sum = complex(self.vectors.sum())
+
+    def extend(self, values):
+        for value in np.asarray(values, dtype=np.float64).tolist():
+            self.append(value)
+
+    @property
+    def mean(self):
+        """circular mean, in the period around the last value
+        """
+        if not self.count:
+            return math.nan
+        mean = math.degrees(math.atan2(self._sum.imag, self._sum.real)) * self.period / 360
+        last = self.values[self.index - 1]
+        return mean + self.period * round((last - mean) / self.period)
+
+    def std(self):
+        if not self.count:
+            return math.nan
+        r = min(abs(self._sum) / self.count, 1.0)
+        return math.sqrt(-2 * math.log(max(r, 1e-12))) * self.period / (2 * math.pi)
+
+    def reset(self):
+        self.count = 0
+        self.index = 0
+        self._sum = 0j
+        self.vectors[:] = 0
+
+class RollingMedian:
+    """Median and median absolute deviation (MAD) of the last `size` values.
+
+    The window is also kept sorted, so adding a value is a bisection and
+    the median an index. The MAD is the k-th smallest distance to the
+    median, found by bisection over the two sorted runs of distances on
+    either side of the median instead of sorting the distances.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.window = deque()
+        self.sorted = []
+
+    @property
+    def full(self):
+        return len(self.window) == self.size
+
+    def append(self, value):
+        value = float(value)
+        if len(self.window) == self.size:
+            old = self.window.popleft()
+            del self.sorted[bisect_left(self.sorted, old)]
+        self.window.append(value)
+        insort(self.sorted, value)
+
+    def extend(self, values):
+        for value in np.asarray(values, dtype=np.float64).tolist():
+            self.append(value)
+
+    def median(self):
+        n = len(self.sorted)
+        if not n:
+            return math.nan
+        if n % 2:
+            return self.sorted[n // 2]
+        return (self.sorted[n // 2 - 1] + self.sorted[n // 2]) / 2
+
+    def _kth_distance(self, center, k):
+        # distances below the center, nearest first, and above it
+        values = self.sorted
+        split = bisect_left(values, center)
+        below = lambda i: center - values[split - 1 - i]
+        above = lambda i: values[split + i] - center
+        n_below, n_above = split, len(values) - split
+
+        # bisection on the number of distances taken from below
+        lo, hi = max(0, k + 1 - n_above), min(k + 1, n_below)
+        while lo < hi:
+            i = (lo + hi) // 2
+            if below(i) < above(k - i):
+                lo = i + 1
+            else:
+                hi = i
+        i = lo
+        candidates = []
+        if i > 0:
+            candidates.append(below(i - 1))
+        if k + 1 - i > 0:
+            candidates.append(above(k - i))
+        return max(candidates)
+
+    def mad(self):
+        n = len(self.sorted)
+        if not n:
+            return math.nan
+        center = self.median()
+        if n % 2:
+            return self._kth_distance(center, n // 2)
+        return (self._kth_distance(center, n // 2 - 1) + self._kth_distance(center, n // 2)) / 2
+
+    def reset(self):
+        self.window.clear()
+        self.sorted.clear()
+
+class Ewma:
+    """Exponentially weighted moving mean and variance, alpha is the weight
+    of the newest value (1 follows the values without smoothing)
+    """
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.mean = math.nan
+        self.var = 0.0
+
+    def update(self, value):
+        if math.isnan(self.mean):
+            self.mean = float(value)
+        else:
+            delta = value - self.mean
+            self.mean += self.alpha * delta
+            self.var = (1 - self.alpha) * (self.var + self.alpha * delta * delta)
+        return self.mean
+
+    def reset(self):
+        self.mean = math.nan
+        self.var = 0.0
+
+class MultipathRejector:
+    """Per channel rolling circular standard deviation of the differential
+    phase, modulo `period` degrees.
+
+    A channel whose last `window` values spread more than `std_threshold`
+    degrees is considered to suffer from multipath, and its values are
+    rejected until it settles again.
+    """
+
+    def __init__(self, window, std_threshold, period=180.0):
+        self.window = window
+        self.std_threshold = std_threshold
+        self.period = period
+        self.channels = {}
+        self.rejected_count = 0
+
+    def update(self, channels, values):
+        """Adds the values of a batch, returns the mask of the values to keep
+        """
+        channels = np.asarray(channels)
+        values = np.asarray(values, dtype=np.float64)
+        keep = np.ones(len(values), dtype=bool)
+        for channel in np.unique(channels).tolist():
+            stats = self.channels.get(channel)
+            if stats is None:
+                stats = self.channels[channel] = CircularWindow(self.window, self.period)
+            in_channel = channels == channel
+            stats.extend(values[in_channel])
+            if stats.full and stats.std() >= self.std_threshold:
+                keep[in_channel] = False
+        self.rejected_count += int(np.count_nonzero(~keep))
+        return keep
+
+    def reset(self):
+        self.channels.clear()
+        self.rejected_count = 0
@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+import logging as logger
+
+from rf_data_collection_functions import (get_raw_data_per_rf, channel_wise_data_per_rf, store_raw_data_as_json,
+                                          store_channelwise_data_as_json, store_raw_data_as_mat,
+                                          store_raw_data_as_compact, get_date_string)
+from params import STORE_COMPACT
+
+class ExportHandle:
+    """Completion handle of the export of a session, one future per format
+    """
+
+    def __init__(self, futures):
+        self.futures = futures
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+    def wait(self, timeout=None):
+        """Waits for every format to be written, re-raises the first error.
+        Returns False if the export is still running after timeout seconds.
+        """
+        _, not_done = wait(self.futures, timeout)
+        if not_done:
+            return False
+        for future in self.futures:
+            future.result()
+        return True
+
+class SessionExporter:
+    """Writes the data of a session (.mat, raw json, channel-wise json and,
+    if STORE_COMPACT, the compact .rfs file) in a pool of writer threads.
+
+    export() takes a snapshot of both tag histories and returns right away,
+    each format is then serialized concurrently from that snapshot under the
+    same date string, so the reader can be disconnected, or a new session
+    started, while the files are written.
+    """
+
+    def __init__(self, max_workers=4):
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="export")
+
+    def export(self, history_1, history_2, fname):
+        snapshots = [history_1.snapshot(), history_2.snapshot()]
+        date_string = get_date_string()
+
+        # only references the snapshot lists, the writers serialize them
+        raw_data = [get_raw_data_per_rf(snapshot) for snapshot in snapshots]
+
+        futures = [
+            self.pool.submit(store_raw_data_as_mat, raw_data, fname, date_string),
+            self.pool.submit(store_raw_data_as_json, raw_data, fname, date_string),
+            self.pool.submit(self._store_channelwise, snapshots, fname, date_string),
+        ]
+        if STORE_COMPACT:
+            futures.append(self.pool.submit(store_raw_data_as_compact, snapshots, fname,
+                                            date_string))
+        for future in futures:
+            future.add_done_callback(self._log_error)
+        return ExportHandle(futures)
+
+    @staticmethod
+    def _store_channelwise(snapshots, fname, date_string):
+        channel_wise_data = [channel_wise_data_per_rf(snapshot) for snapshot in snapshots]
+        store_channelwise_data_as_json(channel_wise_data, fname, date_string)
+
+    @staticmethod
+    def _log_error(future):
+        if future.exception() is not None:
+            logger.error("export failed: %s", future.exception())
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait)
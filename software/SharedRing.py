@@ -0,0 +1,104 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+# total number of records ever written, and the number of records claimed by
+# the write in progress (equal to written between writes)
+HEADER_DTYPE = np.dtype([('written', np.int64), ('reserved', np.int64)])
+
+class SharedRing:
+    """Single writer, multiple readers ring buffer of structured records in
+    a multiprocessing.shared_memory block.
+
+    The writer never waits: each reader keeps its own cursor (a count of
+    records) and, when it falls more than `capacity` records behind, skips
+    the overwritten records and is told how many it lost. A ring is created
+    by its writer and attached by name, or passed as a Process argument, by
+    the readers.
+
+    Like a seqlock, the writer publishes the records it is about to write
+    (`reserved`) before copying them and the written count after, so a
+    reader checks for overwritten slots against the reserved count.
+    """
+
+    def __init__(self, dtype, capacity, name=None, create=False, readonly=False):
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.readonly = readonly
+        size = HEADER_DTYPE.itemsize + self.dtype.itemsize * capacity
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self.created = create
+        self._map()
+        if create:
+            self._header['written'] = 0
+            self._header['reserved'] = 0
+
+    def _map(self):
+        buf = self.shm.buf
+        self._header = np.ndarray((), dtype=HEADER_DTYPE, buffer=buf)
+        self._records = np.ndarray((self.capacity,), dtype=self.dtype, buffer=buf,
+                                   offset=HEADER_DTYPE.itemsize)
+        if self.readonly:
+            self._header.flags.writeable = False
+            self._records.flags.writeable = False
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def written(self):
+        return int(self._header['written'])
+
+    @property
+    def reserved(self):
+        return int(self._header['reserved'])
+
+    def __getstate__(self):
+        # processes started with spawn attach to the ring by name
+        return (self.dtype, self.capacity, self.shm.name, self.readonly)
+
+    def __setstate__(self, state):
+        dtype, capacity, name, readonly = state
+        self.__init__(dtype, capacity, name, readonly=readonly)
+
+    def write(self, records):
+        """Appends records, overwriting the oldest ones
+        """
+        records = np.asarray(records, dtype=self.dtype)
+        n_records = len(records)
+        # only the last capacity records can be kept
+        skipped = max(0, n_records - self.capacity)
+        written = self.written
+        # claim the slots before overwriting them
+        self._header['reserved'] = written + n_records
+        idx = (written + np.arange(skipped, n_records)) % self.capacity
+        self._records[idx] = records[skipped:]
+        # publish the records only once they are fully written
+        self._header['written'] = written + n_records
+
+    def read(self, cursor, max_records=None):
+        """Returns the (records, cursor, lost) of the records written since
+        cursor (0 for the oldest available record)
+        """
+        written = self.written
+        # slots claimed by a write in progress may already be overwritten
+        lost = max(0, self.reserved - self.capacity - cursor)
+        cursor += lost
+        end = written if max_records is None else min(written, cursor + max_records)
+        records = self._records[np.arange(cursor, end) % self.capacity]
+
+        # records overwritten, or being overwritten, while copying them are
+        # dropped too
+        overrun = max(0, self.reserved - self.capacity - cursor)
+        if overrun:
+            records = records[overrun:]
+            lost += overrun
+            cursor += overrun
+        return (records, cursor + len(records), lost)
+
+    def close(self):
+        self._header = None
+        self._records = None
+        self.shm.close()
+        if self.created:
+            self.shm.unlink()
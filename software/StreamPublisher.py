@@ -0,0 +1,108 @@
+import socket
+import struct
+import threading
+import logging as logger
+import numpy as np
+
+from EventBus import DIFF_PHASE, CLASSIFICATION
+
+MAGIC = b'ZTS'
+VERSION = 1
+# magic, version, topic id, sequence number, number of samples
+HEADER = struct.Struct('<3sBBIH')
+MAX_DATAGRAM = 1400
+
+# Compact little-endian wire format of each streamed topic, times are ms since
+# reader start
+WIRE_DTYPES = {
+    DIFF_PHASE.name: np.dtype([('channel', '<u1'), ('time', '<u4'),
+                               ('diff_phase', '<f4')]),
+    CLASSIFICATION.name: np.dtype([('time', '<u4'), ('diff_phase', '<f4'),
+                                   ('category', '<u1')]),
+}
+TOPIC_IDS = {DIFF_PHASE.name: 1, CLASSIFICATION.name: 2}
+TOPICS_BY_ID = {1: DIFF_PHASE, 2: CLASSIFICATION}
+
+def encode_packets(topic, payload, first_seq):
+    """Encodes a payload into datagrams of at most MAX_DATAGRAM bytes, each
+    with its own sequence number from first_seq on
+    """
+    wire = payload.astype(WIRE_DTYPES[topic.name])
+    per_packet = (MAX_DATAGRAM - HEADER.size) // wire.itemsize
+    packets = []
+    for start in range(0, len(wire), per_packet):
+        chunk = wire[start:start + per_packet]
+        header = HEADER.pack(MAGIC, VERSION, TOPIC_IDS[topic.name],
+                             (first_seq + len(packets)) & 0xFFFFFFFF, len(chunk))
+        packets.append(header + chunk.tobytes())
+    return packets
+
+def decode_packet(packet):
+    """Returns the (topic, sequence number, payload) of a datagram, the
+    payload being in the topic dtype
+    """
+    magic, version, topic_id, seq, count = HEADER.unpack_from(packet)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a differential phase stream packet")
+    topic = TOPICS_BY_ID[topic_id]
+    wire = np.frombuffer(packet, dtype=WIRE_DTYPES[topic.name],
+                         count=count, offset=HEADER.size)
+    return (topic, seq, wire.astype(topic.dtype))
+
+class StreamPublisher:
+    """Streams the differential phase and classification topics of an
+    EventBus over UDP.
+
+    Every `interval` seconds the samples published since the previous send
+    are batched into datagrams; with a multicast group address any number of
+    subscribers on the network (or on the same host) receive them. Datagrams
+    carry a sequence number so subscribers can detect losses.
+    """
+
+    def __init__(self, bus, group="239.255.42.99", port=5600, interval=0.05, ttl=1):
+        self.address = (group, port)
+        self.interval = interval
+        self.subscriptions = [bus.subscribe(DIFF_PHASE, maxsize=256),
+                              bus.subscribe(CLASSIFICATION, maxsize=256)]
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        self.seq = 0
+        self.sent_packets = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.flush()
+        for subscription in self.subscriptions:
+            subscription.close()
+        self.sock.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """sends everything published since the last flush
+        """
+        for subscription in self.subscriptions:
+            payload = subscription.drain()
+            if not len(payload):
+                continue
+            for packet in encode_packets(subscription.topic, payload, self.seq):
+                try:
+                    self.sock.sendto(packet, self.address)
+                except OSError as exc:
+                    logger.warning("stream: send error ignored: %s", str(exc))
+                self.seq += 1
+                self.sent_packets += 1
@@ -2,139 +2,233 @@ import math
 import threading
 import numpy as np
 
+RADIANS_PER_COUNT = (math.pi * 2) / 4096
+
 class TagHistory:
+    """Reads of a tag, stored once as reported (time, RSSI, channel, raw phase
+    count, doppler).
+
+    The other representations (phases in radians, unwrapped phases_degrees,
+    cumulative diffs and shift corrected corrects, in radians and degrees) are
+    derived on demand with column(), vectorized over the requested window.
+    The last window of each column is memoized, so a window sliding forward
+    only computes its new reads.
+    """
+
+    # derived columns, the degree columns are computed from the radian ones
+    DERIVED_COLUMNS = ('phases', 'phases_degrees', 'diffs', 'diffs_degrees',
+                       'corrects', 'corrects_degrees')
+    # columns whose values depend on every previous read
+    CUMULATIVE_COLUMNS = ('diffs', 'diffs_degrees', 'corrects', 'corrects_degrees')
+
+    DATA_BY_ID = {
+        0: 'phases_degrees',
+        1: 'corrects_degrees',
+        2: 'dopplers',
+        3: 'rssis',
+        4: 'diffs_degrees'
+    }
 
     def __init__(self, name):
         self.name = name
         self.times = []
-        self.phases = []
-        self.phases_degrees = []
-        self.corrects = []
-        self.corrects_degrees = []
-        self.diffs = [0, 0]
-        self.diffs_degrees = [0, 0]
-        self.dopplers = []
         self.rssis = []
         self.channels = []
+        self.phase_counts = []
+        self.dopplers = []
         self.channel_start_phase = -np.ones(50)
 
-        self.shift = 0
-        self.last_size = 0
-        self.last_channel = None
+        # column: (start, stop, read-only values, carry at stop)
+        self._memo = {}
+        self.data_lock = threading.RLock()
 
-        self.data_by_id = {
-            0: self.phases_degrees,
-            1: self.corrects_degrees,
-            2: self.dopplers,
-            3: self.rssis,
-            4: self.diffs_degrees
-        }
-
-        self.data_lock = threading.Lock()
+    def snapshot(self):
+        """Returns a copy of the history, taken under its lock, that later
+        reads do not modify
+        """
+        with self.data_lock:
+            snapshot = TagHistory(self.name)
+            for attr in ('times', 'rssis', 'channels', 'phase_counts', 'dopplers'):
+                getattr(snapshot, attr)[:] = getattr(self, attr)
+            snapshot.channel_start_phase = self.channel_start_phase.copy()
+        return snapshot
 
     def add_data(self, data_time, rssi=-120, channel=1, phase=None,
                  doppler=None):
         with self.data_lock:
-            self.times.append(data_time)
-            self.rssis.append(rssi)
-
-            self.channels.append(channel)
-
-            if phase is None:
-                # What for default value?
-                phase = 0
-            
-
-            self.phases.append(phase * ((math.pi * 2) / 4096))
-            if(self.channel_start_phase[channel-1]!=-1):
-                # correct for phase jumps
-                curr_phase = phase * ((math.pi * 2) / 4096)
-                diff = (curr_phase-self.channel_start_phase[channel-1])
-                # First check if diff > 6
-                if diff > 5.8:
-                    curr_phase -= 2*math.pi
-                elif diff < -5.8:
-                    curr_phase += 2*math.pi
-
-                # calc diff again
-                diff = (curr_phase-self.channel_start_phase[channel-1])
-                # Now check if diff > 3 (most probab its pi jump)
-                if diff > 2.5:
-                    curr_phase -= math.pi
-                elif diff < -2.5:
-                    curr_phase += math.pi
-
-                self_diff_phase = curr_phase -self.channel_start_phase[channel-1] 
-                self.phases_degrees.append(curr_phase*180/math.pi)
-            else:
-                curr_phase = phase * ((math.pi * 2) / 4096)
-                self.phases_degrees.append(curr_phase*180/math.pi)
-                self.channel_start_phase[channel-1] = curr_phase
-                self_diff_phase = -1
-
-            if doppler is None:
-                # What for default value?
-                doppler = 0
-            self.dopplers.append(doppler)
-
-            # Useless if not impinj, but let it for a first version 
-            self.phase_diff()
-
-            return curr_phase*180/math.pi, self_diff_phase*180/math.pi
-
-    def remove_shift(self, sine):
-        if self.last_channel is None:
-            # print(self.channels)
-            if(len(self.channels)>0):
-                self.last_channel = self.channels[0]
-            else:
-                return
-        times_len = len(self.times)
-        missed = times_len - self.last_size
-        if missed:
-            for i in range(times_len - missed, times_len):
-                if self.channels[i] != self.last_channel:
-                    self.shift = self.phases[i] - self.corrects[-1]
-                    curr_corrected_phase = (self.phases[i] - self.shift) % (math.pi * 2)
-                    self.corrects.append(curr_corrected_phase)
-                    self.corrects_degrees.append(curr_corrected_phase*180/math.pi)
-                    self.last_channel = self.channels[i]
-                else:
-                    curr_corrected_phase =(self.phases[i] - self.shift) % (math.pi * 2)
-                    self.corrects.append(curr_corrected_phase)
-                    self.corrects_degrees.append(curr_corrected_phase*180/math.pi)
-            self.last_size = times_len
-
-    def remove_shift_dummy(self):
-        DEFAULT_VALUE = 0
-        times_len = len(self.times)
-        missed = times_len - self.last_size
-        if missed:
-            self.corrects += [DEFAULT_VALUE for _ in range(missed)]
-            self.last_size = times_len
-
-    def phase_diff(self):
-        if len(self.times) > 2:
-            if self.channels[-1] != self.channels[-2]:
-                # make smarter
-                curr_diff = self.diffs[-1];
-                self.diffs.append(curr_diff)
-                self.diffs_degrees.append(curr_diff*180/math.pi)
+            return self._add_reads([data_time], [rssi], [channel],
+                                   [0 if phase is None else phase],
+                                   [0 if doppler is None else doppler])
+
+    def add_batch(self, reads):
+        """Adds the reads of a ReportParser batch holding reads of this tag only,
+        under a single lock acquisition. Returns the result of the last add_data.
+        """
+        if not len(reads):
+            return None
+        # unreported phases and dopplers default to 0
+        phase_counts = np.where(reads['phase'] < 0, 0, reads['phase'])
+        dopplers = np.nan_to_num(reads['doppler'], nan=0.0)
+        with self.data_lock:
+            return self._add_reads(reads['first_seen'].tolist(), reads['rssi'].tolist(),
+                                   reads['channel'].tolist(), phase_counts.tolist(),
+                                   dopplers.tolist())
+
+    def _add_reads(self, times, rssis, channels, phase_counts, dopplers):
+        self.times.extend(times)
+        self.rssis.extend(rssis)
+        self.channels.extend(channels)
+        self.phase_counts.extend(phase_counts)
+        self.dopplers.extend(dopplers)
+
+        # the first phase of each channel is the reference its later phases
+        # are unwrapped against
+        first_read = False
+        for channel in set(channels):
+            if self.channel_start_phase[channel-1] == -1:
+                first = channels.index(channel)
+                self.channel_start_phase[channel-1] = phase_counts[first] * RADIANS_PER_COUNT
+                first_read = first_read or first == len(channels) - 1
+
+        # phase and self phase difference of the last read, in degrees
+        channel = channels[-1]
+        curr_phase = self._unwrap(np.array(phase_counts[-1:]), np.array(channels[-1:]))[0]
+        if first_read:
+            self_diff_phase = -1
+        else:
+            self_diff_phase = curr_phase - self.channel_start_phase[channel-1]
+        return curr_phase*180/math.pi, self_diff_phase*180/math.pi
+
+    def _unwrap(self, phase_counts, channels):
+        # corrects the 2 pi and pi jumps of the phases relative to the first
+        # phase of their channel
+        phases = phase_counts * RADIANS_PER_COUNT
+        start_phases = self.channel_start_phase[channels - 1]
+        diff = phases - start_phases
+        phases = np.where(diff > 5.8, phases - 2*math.pi,
+                          np.where(diff < -5.8, phases + 2*math.pi, phases))
+        diff = phases - start_phases
+        return np.where(diff > 2.5, phases - math.pi,
+                        np.where(diff < -2.5, phases + math.pi, phases))
+
+    def _column_length(self, name):
+        # diffs start with two zeros, whatever the number of reads
+        if name.startswith('diffs'):
+            return max(len(self.times), 2)
+        return len(self.times)
+
+    def column(self, name, start=None, stop=None):
+        """Returns the values of a column over reads[start:stop] as a read-only
+        ndarray. Derived columns are computed for the window only, extending
+        the memoized window when it overlaps the start of the requested one.
+        """
+        if name not in self.DERIVED_COLUMNS:
+            with self.data_lock:
+                return np.array(getattr(self, name)[start:stop])
+
+        with self.data_lock:
+            start, stop, _ = slice(start, stop).indices(self._column_length(name))
+            stop = max(start, stop)
+            memo = self._memo.get(name)
+            if memo is not None and memo[0] <= start <= memo[1]:
+                memo_start, memo_stop, values, carry = memo
+                if stop <= memo_stop:
+                    return values[start - memo_start:stop - memo_start]
+                new_values, carry = self._compute(name, memo_stop, stop, carry)
+                values = np.concatenate((values[start - memo_start:], new_values))
             else:
-                diff = self.phases[-1] - self.phases[-2]
-                
-                # First check if diff > 6
-                if diff > 6:
-                    diff -= math.pi * 2
-                elif diff < -6:
-                    diff += math.pi * 2
-
-                # First check if diff > 3 (most probab its pi jump)
-                if diff > 3:
-                    diff -= math.pi
-                elif diff < -3:
-                    diff += math.pi
-
-                curr_diff = (self.diffs[-1] + diff)
-                self.diffs.append(curr_diff)
-                self.diffs_degrees.append(curr_diff*180/math.pi)
\ No newline at end of file
+                # cumulative columns are computed from the first read
+                begin = 0 if name in self.CUMULATIVE_COLUMNS else start
+                values, carry = self._compute(name, begin, stop, None)
+                values = values[start - begin:]
+
+            values.flags.writeable = False
+            self._memo[name] = (start, stop, values, carry)
+            return values
+
+    def _compute(self, name, begin, end, carry):
+        # values of reads[begin:end] and the carry to compute the next reads,
+        # given the carry of reads[:begin] (None for begin 0)
+        if name in ('diffs_degrees', 'corrects_degrees'):
+            values, carry = self._compute(name[:-len('_degrees')], begin, end, carry)
+            return values*180/math.pi, carry
+        if name == 'diffs':
+            return self._compute_diffs(begin, end, carry)
+
+        phase_counts = np.array(self.phase_counts[begin:end], dtype=np.float64)
+        channels = np.array(self.channels[begin:end], dtype=np.int64)
+        if name == 'phases':
+            return phase_counts * RADIANS_PER_COUNT, None
+        if name == 'phases_degrees':
+            return self._unwrap(phase_counts, channels)*180/math.pi, None
+        return self._compute_corrects(phase_counts, channels, carry)
+
+    def _compute_diffs(self, begin, end, carry):
+        # cumulative phase difference between consecutive reads on the same
+        # channel, it holds its value over channel changes
+        values = np.zeros(end - begin)
+        first = max(begin, 2)
+        if end > first:
+            phases = np.array(self.phase_counts[first-1:end], dtype=np.float64) * RADIANS_PER_COUNT
+            channels = np.array(self.channels[first-1:end])
+            diff = np.diff(phases)
+
+            # First check if diff > 6
+            diff = np.where(diff > 6, diff - math.pi * 2,
+                            np.where(diff < -6, diff + math.pi * 2, diff))
+            # First check if diff > 3 (most probab its pi jump)
+            diff = np.where(diff > 3, diff - math.pi,
+                            np.where(diff < -3, diff + math.pi, diff))
+            diff[channels[1:] != channels[:-1]] = 0
+
+            values[first - begin:] = np.cumsum(
+                np.concatenate(([0.0 if carry is None else carry], diff)))[1:]
+        return values, (values[-1] if len(values) else carry)
+
+    def _compute_corrects(self, phase_counts, channels, carry):
+        # phases shifted at each channel change to continue from the last
+        # corrected phase, as (shift, last corrected phase, last channel)
+        values = np.empty(len(phase_counts))
+        if not len(values):
+            return values, carry
+        phases = phase_counts * RADIANS_PER_COUNT
+        shift, last_corrected, last_channel = (0, None, channels[0]) if carry is None else carry
+
+        previous = np.concatenate(([last_channel], channels[:-1]))
+        bounds = np.concatenate(([0], np.flatnonzero(channels != previous), [len(values)]))
+        bounds = np.unique(bounds)
+        for segment_start, segment_stop in zip(bounds[:-1], bounds[1:]):
+            if channels[segment_start] != previous[segment_start]:
+                shift = phases[segment_start] - last_corrected
+            values[segment_start:segment_stop] = (phases[segment_start:segment_stop] - shift) % (math.pi * 2)
+            last_corrected = values[segment_stop - 1]
+        return values, (shift, last_corrected, channels[-1])
+
+    def data_by_id(self, data_id, start=None, stop=None):
+        return self.column(self.DATA_BY_ID[data_id], start, stop)
+
+    # full columns as lists, as they used to be stored
+
+    @property
+    def phases(self):
+        return self.column('phases').tolist()
+
+    @property
+    def phases_degrees(self):
+        return self.column('phases_degrees').tolist()
+
+    @property
+    def diffs(self):
+        return self.column('diffs').tolist()
+
+    @property
+    def diffs_degrees(self):
+        return self.column('diffs_degrees').tolist()
+
+    @property
+    def corrects(self):
+        return self.column('corrects').tolist()
+
+    @property
+    def corrects_degrees(self):
+        return self.column('corrects_degrees').tolist()
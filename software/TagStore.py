@@ -0,0 +1,86 @@
+import threading
+from itertools import count
+from collections import namedtuple
+from types import MappingProxyType
+
+TagSnapshot = namedtuple('TagSnapshot', ['epoch', 'tags'])
+
+class TagStore:
+    """Tag database sharded by key, with one lock per shard.
+
+    Writers (the tag report callback) only lock the shard of the tag they
+    update. Every write stamps its shard with a new value of a global epoch
+    counter, so readers can take a snapshot by copying only the shards that
+    changed since the previous snapshot; unchanged shards and, if nothing
+    changed at all, the whole snapshot are reused as is.
+
+    Tag info dicts are replaced on every read and never mutated in place,
+    so a snapshot is a consistent view of every tag info at its epoch. The
+    `history` objects referenced by the infos are still shared, they
+    protect themselves with their own lock.
+    """
+
+    def __init__(self, n_shards=16):
+        self._n_shards = n_shards
+        self._shards = [{} for _ in range(n_shards)]
+        self._locks = [threading.Lock() for _ in range(n_shards)]
+        self._epochs = [0] * n_shards
+        self._epoch_counter = count(1)
+
+        self._snapshot_lock = threading.Lock()
+        self._shard_copies = [{} for _ in range(n_shards)]
+        self._copy_epochs = [0] * n_shards
+        self._snapshot = TagSnapshot(0, MappingProxyType({}))
+
+    def _shard_index(self, key):
+        return hash(key) % self._n_shards
+
+    def get(self, key, default=None):
+        return self._shards[self._shard_index(key)].get(key, default)
+
+    def __getitem__(self, key):
+        return self._shards[self._shard_index(key)][key]
+
+    def __setitem__(self, key, info):
+        idx = self._shard_index(key)
+        with self._locks[idx]:
+            self._shards[idx][key] = info
+            self._epochs[idx] = next(self._epoch_counter)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    @property
+    def epoch(self):
+        """epoch of the last write
+        """
+        return max(self._epochs)
+
+    def clear(self):
+        for idx in range(self._n_shards):
+            with self._locks[idx]:
+                self._shards[idx] = {}
+                self._epochs[idx] = next(self._epoch_counter)
+
+    def snapshot(self):
+        """Returns an immutable TagSnapshot(epoch, tags) of the whole store
+        """
+        with self._snapshot_lock:
+            # epochs are drawn before the shard is stamped, so a write can
+            # stamp its shard with an epoch below the max of the others:
+            # only a per shard comparison tells that nothing changed
+            if self._epochs == self._copy_epochs:
+                return self._snapshot
+
+            for idx in range(self._n_shards):
+                if self._epochs[idx] != self._copy_epochs[idx]:
+                    with self._locks[idx]:
+                        self._shard_copies[idx] = self._shards[idx].copy()
+                        self._copy_epochs[idx] = self._epochs[idx]
+
+            tags = {}
+            for shard_copy in self._shard_copies:
+                tags.update(shard_copy)
+            self._snapshot = TagSnapshot(max(self._copy_epochs), MappingProxyType(tags))
+
+            return self._snapshot
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+def threshold_edges(classification):
+    """
+        Converts a sensor classification config into category labels and threshold edges.
+
+        Parameters:
+        - classification (dict): A dictionary mapping each category to its upper phase threshold,
+        as in `SENSORS[sensor]["classification"]`.
+
+        Returns:
+        - labels (list): The category labels ordered by ascending threshold.
+        - edges (ndarray): The ascending thresholds.
+
+        Example:
+         threshold_edges({"saturated": 27, "moist": 55, "dry": 150})
+        (['saturated', 'moist', 'dry'], array([ 27.,  55., 150.]))
+    """
+    ordered = sorted(classification.items(), key=lambda item: item[1])
+    labels = [category for category, _ in ordered]
+    edges = np.array([threshold for _, threshold in ordered], dtype=np.float64)
+
+    return (labels, edges)
+
+def classify(phase_differences, edges):
+    """
+        Classifies phase differences against threshold edges.
+
+        Parameters:
+        - phase_differences (array-like): The phase differences to classify.
+        - edges (ndarray): The ascending thresholds as returned by `threshold_edges`.
+
+        Returns:
+        - categories (ndarray): The index of the category of each value.
+
+        Description:
+        - A value belongs to the first category whose threshold it is strictly lower than.
+        Values above the last threshold get the index `len(edges)`, meaning unclassified.
+
+        Example:
+         classify([10, 30, 200], np.array([27., 55., 150.]))
+        array([0, 1, 3])
+    """
+    return np.digitize(np.asarray(phase_differences, dtype=np.float64), edges)
+
+def compute_confusion_matrix(expected, predicted, n_categories):
+    """
+        Counts the confusion matrix of integer category labels.
+
+        Parameters:
+        - expected (ndarray): The true category index of each sample.
+        - predicted (ndarray): The predicted category index of each sample.
+        - n_categories (int): The number of categories.
+
+        Returns:
+        - matrix (ndarray): A (n_categories, n_categories) matrix, rows are the true categories
+        and columns the predicted ones.
+
+        Description:
+        - Unclassified samples (index `n_categories` or more) are left out, the counts are
+        computed with a single `np.bincount` over the flattened (true, predicted) pairs.
+    """
+    expected = np.asarray(expected, dtype=np.intp)
+    predicted = np.asarray(predicted, dtype=np.intp)
+    classified = predicted < n_categories
+    pairs = expected[classified] * n_categories + predicted[classified]
+
+    return np.bincount(pairs, minlength=n_categories * n_categories).reshape(n_categories, n_categories)
+
+def compute_percentage_matrix(matrix):
+    """
+        Normalizes each row of a confusion matrix into percentages.
+
+        Parameters:
+        - matrix (ndarray): A confusion matrix.
+
+        Returns:
+        - perc_matrix (ndarray): The matrix with each row summing to 100.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+
+    return matrix / matrix.sum(axis=1, keepdims=True) * 100
@@ -5,7 +5,11 @@ from sys import exit, argv
 from time import sleep
 
 from AntennaReader import AntennaReader
+from ReaderAutotuner import ReaderAutotuner, save_reader_tuning
 from params import STORE_DATA
+from params import SENSORS, SENSOR_DEF, PAIRING_MAX_AGE_MS
+from params import READER_SITE, READER_TUNING_FILE
+from params import AUTOTUNE_DWELL, AUTOTUNE_MAX_PHASE_STD, AUTOTUNE_SEARCH_SPACE
 
 # default time to collect data in seconds
 time_to_collect = 10
@@ -19,14 +23,17 @@ def main():
         # save file
     # continue looping
     # app = QApplication(argv)
-    num_args = len(argv)
+    # --autotune first selects the best reader settings for this site
+    autotune = "--autotune" in argv
+    args = [arg for arg in argv if arg != "--autotune"]
+    num_args = len(args)
     if(num_args<2):
         print("Please supply file name")
         exit(0)
-    fname = argv[1]
+    fname = args[1]
     try:
-        collection_time = argv[2]
-        data_time = argv[2]
+        collection_time = args[2]
+        data_time = args[2]
         if 's' in collection_time:
             collection_time = collection_time.replace('s','')
             collection_time = float(collection_time)
@@ -53,10 +60,20 @@ def main():
     sleep(1)
     dc.connect()
     sleep(1)
+    if autotune:
+        tuner = ReaderAutotuner(dc, SENSORS[SENSOR_DEF]["EPC"], AUTOTUNE_DWELL,
+                                AUTOTUNE_MAX_PHASE_STD, PAIRING_MAX_AGE_MS)
+        config, metrics = tuner.tune(AUTOTUNE_SEARCH_SPACE, dc.tuned_config)
+        save_reader_tuning(READER_TUNING_FILE, READER_SITE, config, metrics)
+        print(f"Tuned reader settings for site {READER_SITE}: {config}")
+        dc.tuned_config = config
+        dc.clear_tags_db()
     dc.startInventory()
     print(f"Collecting data for {collection_time} seconds")
     sleep(collection_time)
-    dc.disconnect()
+    export = dc.disconnect()
+    # the reader is already disconnected, only the files are still being written
+    export.wait()
     # exit(app.exec_())
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+from time import sleep
+from sys import exit, argv
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt5 import QtWidgets, QtCore
+
+from TagHistory import TagHistory
+from PhasePairer import PhasePairer
+from RollingStats import MultipathRejector
+from HampelFilter import HampelFilter
+from PhaseFusion import PhaseFusion
+from ReportParser import REPORT_DTYPE
+from SharedRing import SharedRing
+from EventBus import RAW_READS
+from phase_calculation_functions import fold_phase_difference
+from rf_data_collection_functions import real_time_phase_separation
+from params import STORE_DATA
+from params import SENSORS, SENSOR_DEF
+from params import PAIRING_MAX_AGE_MS, PAIRING_LINEAR
+from params import PIPELINE_READS_CAPACITY, PIPELINE_RESULTS_CAPACITY
+from params import MULTIPATH_WINDOW, MULTIPATH_STD_THRESHOLD
+from params import HAMPEL_WINDOW, HAMPEL_K, HAMPEL_REPLACE
+from params import LIVE_ESTIMATOR, PHASE_FUSION_PROCESS_NOISE, PHASE_FUSION_MEASUREMENT_NOISE
+
+epc_to_save = SENSORS[SENSOR_DEF]["EPC"][0]
+epc_to_save_diff = SENSORS[SENSOR_DEF]["EPC"][1]
+
+# One record per processed report, the values the real-time GUI plots
+RESULT_DTYPE = np.dtype([
+    ('time', np.int64),         # ms since reader start, last read of the report
+    ('diff_phase', np.float64), # mean paired differential phase
+    ('dtw_phase', np.float64),  # mean phase separation over the real-time window (LIVE_ESTIMATOR "dtw")
+    ('fused_phase', np.float64),# differential phase fused over channels (LIVE_ESTIMATOR "fusion")
+    ('fused_std', np.float64),  # and its standard deviation
+])
+# the field the GUI plots
+LIVE_FIELD = 'dtw_phase' if LIVE_ESTIMATOR == "dtw" else 'fused_phase'
+
+def reader_stage(fname, reads_ring, stop):
+    """reader process: runs the inventory, records the data as data_collection.py
+    does and writes the reads of the sensor tags (tag_id 0 for the sensing tag,
+    1 for the reference tag) to the reads ring
+    """
+    # imported here so the other processes never load sllurp
+    from AntennaReader import AntennaReader
+
+    reader = AntennaReader(fname)
+    subscription = reader.event_bus.subscribe(RAW_READS, maxsize=1024)
+    reader.connect()
+    reader.startInventory()
+    while not stop.is_set():
+        batch = subscription.get(timeout=0.1)
+        if batch is None:
+            continue
+        id_1, id_2 = reader.report_parser.tag_ids((epc_to_save, epc_to_save_diff))
+        sensor_reads = batch[np.isin(batch['tag_id'], (id_1, id_2))]
+        sensor_reads['tag_id'] = sensor_reads['tag_id'] == id_2
+        reads_ring.write(sensor_reads)
+    reader.disconnect().wait()
+
+def dsp_stage(reads_ring, results_ring, stop):
+    """DSP process: computes the differential phase of the reads of the reads
+    ring and writes a record per batch to the results ring
+    """
+    histories = [TagHistory((epc_to_save, 1)), TagHistory((epc_to_save_diff, 1))]
+    phase_pairer = PhasePairer(PAIRING_MAX_AGE_MS, PAIRING_LINEAR)
+    multipath_rejector = MultipathRejector(MULTIPATH_WINDOW, MULTIPATH_STD_THRESHOLD)
+    hampel_filter = HampelFilter(HAMPEL_WINDOW, HAMPEL_K, HAMPEL_REPLACE)
+    phase_fusion = PhaseFusion(PHASE_FUSION_PROCESS_NOISE, PHASE_FUSION_MEASUREMENT_NOISE)
+    cursor = 0
+    lost_reads = 0
+    while not stop.is_set():
+        reads, cursor, lost = reads_ring.read(cursor)
+        lost_reads += lost
+        if not len(reads):
+            sleep(0.01)
+            continue
+
+        for tag, history in enumerate(histories):
+            history.add_batch(reads[reads['tag_id'] == tag])
+
+        phased = reads[reads['phase'] >= 0]
+        estimates = phase_pairer.update(phased['tag_id'], phased['channel'],
+                                        phased['first_seen'], phased['phase'])
+        paired = ~np.isnan(estimates)
+        estimates = fold_phase_difference(estimates[paired])
+        channels = phased['channel'][paired]
+        estimates, outliers = hampel_filter.update(channels, estimates)
+        keep = multipath_rejector.update(channels, estimates)
+        if not hampel_filter.replace:
+            keep &= ~outliers
+        estimates = estimates[keep]
+        phase_fusion.update(channels[keep], phased['first_seen'][paired][keep],
+                            np.abs(estimates))
+
+        result = np.zeros(1, dtype=RESULT_DTYPE)
+        result['time'] = reads['first_seen'][-1]
+        result['diff_phase'] = np.mean(estimates) if len(estimates) else np.nan
+        result['dtw_phase'] = np.nan
+        if LIVE_ESTIMATOR == "dtw":
+            phase_separation = real_time_phase_separation(*histories)
+            if len(phase_separation):
+                result['dtw_phase'] = np.mean(phase_separation)
+        result['fused_phase'], result['fused_std'] = phase_fusion.estimate(int(result['time'][0]))
+        results_ring.write(result)
+
+    if lost_reads:
+        print(f"DSP fell behind, {lost_reads} reads lost")
+
+class PipelineGui(QtWidgets.QMainWindow):
+    """plots the results written by the DSP process, it only maps the results
+    ring read-only and never waits for the other processes
+    """
+
+    def __init__(self, results_ring, n_data_pts=100, *args, **kwargs):
+        super(PipelineGui, self).__init__(*args, **kwargs)
+        self.results_ring = results_ring
+        self.cursor = 0
+
+        self.graphWidget = pg.PlotWidget()
+        self.setCentralWidget(self.graphWidget)
+        self.graphWidget.setBackground('w')
+        styles = {'color':'k', 'font-size':'20px'}
+        self.graphWidget.setLabel('left', 'Phase (°)', **styles)
+        self.graphWidget.setLabel('bottom', 'Time (s)', **styles)
+        self.graphWidget.setYRange(0, SENSORS[SENSOR_DEF]["y_range"], padding=0)
+
+        # last results, at their time since the reader start (s)
+        self.n_data_pts = n_data_pts
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        pen = pg.mkPen(color=(255, 0, 0), width = 5)
+        self.data_line = self.graphWidget.plot(self.x, self.y, pen=pen)
+
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.update_plot)
+        self.timer.start(50)
+
+    def update_plot(self):
+        results, self.cursor, _ = self.results_ring.read(self.cursor)
+        if not len(results):
+            return
+        results = results[-self.n_data_pts:]
+        self.x = np.concatenate((self.x, results['time'] / 1000))[-self.n_data_pts:]
+        self.y = np.concatenate((self.y, results[LIVE_FIELD]))[-self.n_data_pts:]
+        self.data_line.setData(self.x, self.y)
+
+def main():
+    # Reader, DSP and GUI each run in their own process, connected by
+    # shared memory ring buffers: reader -> reads ring -> DSP -> results ring -> GUI
+    num_args = len(argv)
+    if(num_args<2):
+        print("Please supply file name")
+        exit(0)
+    fname = argv[1]
+    if STORE_DATA:
+        print("Saving to file: "+fname)
+    else:
+        print("Not storing data")
+
+    reads_ring = SharedRing(REPORT_DTYPE, PIPELINE_READS_CAPACITY, create=True)
+    results_ring = SharedRing(RESULT_DTYPE, PIPELINE_RESULTS_CAPACITY, create=True)
+    stop = multiprocessing.Event()
+    stages = [
+        multiprocessing.Process(target=reader_stage, args=(fname, reads_ring, stop)),
+        multiprocessing.Process(target=dsp_stage, args=(reads_ring, results_ring, stop)),
+    ]
+    for stage in stages:
+        stage.start()
+
+    app = QtWidgets.QApplication(argv)
+    gui = PipelineGui(SharedRing(RESULT_DTYPE, PIPELINE_RESULTS_CAPACITY,
+                                 results_ring.name, readonly=True))
+    gui.show()
+    app.exec_()
+
+    # the reader process stores the data on its way out
+    stop.set()
+    for stage in stages:
+        stage.join()
+    gui.results_ring.close()
+    reads_ring.close()
+    results_ring.close()
+
+if __name__ == "__main__":
+    main()
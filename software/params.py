@@ -63,6 +63,111 @@ SENSOR_DEF = "photo"
 # SENSOR_DEF = "stub"
 # SENSOR_DEF = "test"
 
+# Gen2 filtering: the reader only singulates the tags of TAG_FILTER_SENSORS, selected
+# by the longest run of EPC digits they all share (the suffix of a sensor pair), at
+# its bit address in the EPC bank. A single Select: the reader applies the default
+# Select/Unselect action of each filter in turn, so a second one would unselect the
+# tags of the first. Tags of other sensors sharing that run are singulated too. No
+# filtering (warned at connect time) if the EPCs share no digit, or for an empty list.
+TAG_FILTER_SENSORS = [SENSOR_DEF]
+
+# Alignment of the two tags of a sensor in the real-time GUI: "dtw" or "timestamp"
+# "timestamp" pairs reads by nearest read time on each channel, in O(n), within
+# ALIGNMENT_TOLERANCE_MS milliseconds
+ALIGNMENT_STRATEGY = "dtw"
+ALIGNMENT_TOLERANCE_MS = 200
+ALIGNMENT_INTERPOLATE = False
+
+# Pairing of the live differential phase in the GUI: each read of either tag is
+# paired with the other tag's last phase on the same channel (extrapolated with
+# the slope of its last two reads if PAIRING_LINEAR) when not older than
+# PAIRING_MAX_AGE_MS milliseconds
+PAIRING_MAX_AGE_MS = 500
+PAIRING_LINEAR = False
+
+# Bounded queue between the reader callback and the GUI processing thread, and
+# what to do when it is full: "block" (lossless, may delay the reader),
+# "drop_oldest", "decimate" (keep the last read per tag and channel) or
+# "latest" (only process the most recent report)
+REPORT_QUEUE_SIZE = 8
+REPORT_QUEUE_POLICY = "decimate"
+
+# Adaptive report_every_n_tags: every REPORT_BATCH_INTERVAL seconds the share of
+# time the reader callback and the processing thread spend handling reports,
+# and the backlog of the report queue, are measured, the batching is doubled
+# when the load is high and halved when it is low, without ever holding reads
+# for more than REPORT_BATCH_TARGET_LATENCY seconds (nor batching more than
+# REPORT_BATCH_MAX). A new batching restarts the inventory and the tags are
+# not read during the restart (a stop and a start ROSpec round trip, tens to
+# hundreds of ms), so it changes at most every REPORT_BATCH_MIN_RESTART_INTERVAL
+# seconds
+ADAPTIVE_REPORT_BATCHING = True
+REPORT_BATCH_MAX = 32
+REPORT_BATCH_TARGET_LATENCY = 0.1
+REPORT_BATCH_INTERVAL = 2.0
+REPORT_BATCH_MIN_RESTART_INTERVAL = 30.0
+
+# Streaming of the differential phase and classifications over UDP, to a multicast
+# group so any number of subscribers (see stream_subscriber.py) can listen, with
+# samples batched every STREAM_INTERVAL seconds
+STREAM_ENABLED = False
+STREAM_GROUP = "239.255.42.99"
+STREAM_PORT = 5600
+STREAM_INTERVAL = 0.05
+
+# Capacity, in records, of the shared memory ring buffers of the multiprocess
+# pipeline (multiprocess_phase_calculator.py): sensor reads between the reader
+# and DSP processes, and results between the DSP and GUI processes
+PIPELINE_READS_CAPACITY = 65536
+PIPELINE_RESULTS_CAPACITY = 4096
+
+# Live view of the real-time GUI: differential phase per channel, RSSI and read
+# rate per sensor tag over the whole session, redrawn every LIVE_VIEW_INTERVAL_MS
+LIVE_VIEW = True
+LIVE_VIEW_INTERVAL_MS = 100
+
+# Multipath rejection of the live differential phase: the reads of a channel are
+# ignored while its last MULTIPATH_WINDOW values spread more than
+# MULTIPATH_STD_THRESHOLD degrees (circular std modulo 180, the folded phase jumps
+# by 180), and so is a report while the phase of the last MULTIPATH_WINDOW reports
+# does. The plotted phase is smoothed by an EWMA
+# giving LIVE_SMOOTHING_ALPHA to the newest value (1 disables the smoothing).
+MULTIPATH_WINDOW = 20
+MULTIPATH_STD_THRESHOLD = 30
+LIVE_SMOOTHING_ALPHA = 0.5
+
+# Outlier rejection of the live differential phase, before it is averaged: a value
+# more than HAMPEL_K scaled MADs away from the median of the HAMPEL_WINDOW previous
+# values of its channel is an outlier, replaced by that median if HAMPEL_REPLACE
+# or dropped otherwise
+HAMPEL_WINDOW = 7
+HAMPEL_K = 3.0
+HAMPEL_REPLACE = True
+
+# Live phase plotted by the GUI: "fusion" fuses per channel recursive estimates of
+# the differential phase, updated on every read, weighted by their variance (which
+# grows by PHASE_FUSION_PROCESS_NOISE deg^2 per second without reads, starting from
+# a measurement noise of PHASE_FUSION_MEASUREMENT_NOISE deg^2), "dtw" averages the
+# aligned phase separation of the whole real-time window on every report
+LIVE_ESTIMATOR = "fusion"
+PHASE_FUSION_PROCESS_NOISE = 25.0
+PHASE_FUSION_MEASUREMENT_NOISE = 100.0
+
+# Uniform resampling of the live differential phase: the paired reads, irregular and
+# hopping across channels, are interpolated ("linear", or "hold" for the last value)
+# every 1/RESAMPLE_RATE seconds; grid times between reads more than RESAMPLE_MAX_GAP
+# ms apart are marked as gaps
+RESAMPLE_RATE = 20
+RESAMPLE_METHOD = "linear"
+RESAMPLE_MAX_GAP = 1000
+
+# Cadence of periodic stimuli: dominant frequency of the resampled live differential
+# phase, by a sliding DFT over its last CADENCE_WINDOW seconds between
+# CADENCE_MIN_FREQ and CADENCE_MAX_FREQ Hz
+CADENCE_WINDOW = 20.0
+CADENCE_MIN_FREQ = 0.1
+CADENCE_MAX_FREQ = 5.0
+
 IMPINJ_HOST_IP = "169.254.34.180"
 IMPINJ_HOST_PORT = 5084
 
@@ -71,6 +176,11 @@ directory = os.getcwd()
 data_dir = os.path.join(directory, "data")
 DATA_DIR = os.path.join(data_dir, "rf_data")
 STORE_DATA = True
+# Sessions are also stored in a compact binary file (raw phase counts, delta-coded
+# timestamps), block compressed with COMPACT_COMPRESSION: "none", "gzip" or "zstd"
+# (needs the `zstandard` package)
+STORE_COMPACT = True
+COMPACT_COMPRESSION = "gzip"
 
 GUI_APP_TITLE = 'SLLURP GUI - RFID inventory control'
 GUI_ICON_PATH = 'rfid.png'
@@ -121,6 +231,24 @@ IMPINJ_SEARCH_MODE_TITLES = OrderedDict(sorted({
     '6 - Dual Target Inventory with Reset': 6,
 }.items(), key=lambda x: x[1]))
 
+# Reader autotuning (data_collection.py --autotune): the values of each setting
+# are tried for AUTOTUNE_DWELL seconds, one setting at a time, and the settings
+# giving the best pair read rate of the sensor tags, with a differential phase
+# std under AUTOTUNE_MAX_PHASE_STD degrees, are stored for READER_SITE in
+# READER_TUNING_FILE. They are then the startInventory defaults on that site.
+READER_SITE = "default"
+READER_TUNING_FILE = os.path.join(DATA_DIR, "reader_tuning.json")
+AUTOTUNE_DWELL = 5.0
+AUTOTUNE_MAX_PHASE_STD = 20
+AUTOTUNE_SEARCH_SPACE = OrderedDict([
+    ('mode_identifier', [1, 0, 2, 3, 4, 5, 1002]),  # see READER_MODES_TITLES
+    ('session', [2, 1]),
+    ('tag_population', [2, 4, 16]),
+    ('impinj_search_mode', [2, 1, 3]),              # see IMPINJ_SEARCH_MODE_TITLES
+    ('tari', [0]),                                  # 0: mode default
+    ('tx_power', [0] + DEFAULT_POWER_TABLE[::3]),   # power table index, 0: max
+])
+
 readerSettingsParams = [
     {
         'name': 'time',
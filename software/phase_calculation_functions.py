@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import numpy as np
 from fastdtw import fastdtw
 
-def phase_resolution(phase_data):
+DTW_ALIGNMENT = "dtw"
+TIMESTAMP_ALIGNMENT = "timestamp"
+DEFAULT_TOLERANCE_MS = 200
+
+def phase_resolution(phase_data, strategy=DTW_ALIGNMENT, time_data=None,
+                     tolerance=DEFAULT_TOLERANCE_MS, interpolate=False):
     """
         Resolves phase data using dynamic time warping (DTW) matching for each channel.
 
         Parameters:
         - phase_data (list): A list of two lists representing phase data for two different sources.
+        - strategy (str): `DTW_ALIGNMENT` (default) or `TIMESTAMP_ALIGNMENT`.
+        - time_data (list): Channel-wise read timestamps (ms) of both sources, in the same layout
+        as `phase_data`. Required by `TIMESTAMP_ALIGNMENT`.
+        - tolerance (float): Maximum time gap (ms) between two paired samples for `TIMESTAMP_ALIGNMENT`.
+        - interpolate (bool): Interpolate the RF2 phase at the RF1 read times for `TIMESTAMP_ALIGNMENT`.
 
         Returns:
         - channel_wise_warped_phases (dict): A dictionary containing channel-wise warped phases.
@@ -23,15 +34,25 @@ def phase_resolution(phase_data):
         - If an exception occurs during the DTW matching process for a particular channel, it is
         caught and ignored, allowing the function to continue processing the remaining channels.
 
+        - With `TIMESTAMP_ALIGNMENT` the samples are paired by nearest read time instead, using
+        `timestamp_matching`, which runs in O(n) per channel. DTW is kept as the fallback when
+        no timestamps are available.
+
         Example:
          phase_data = [[1, 2, 3], [4, 5, 6]]
          phase_resolution(phase_data)
         {1: [warped_rf1_1, warped_rf2_1], 2: [warped_rf1_2, warped_rf2_2], 3: [warped_rf1_3, warped_rf2_3]}
     """
+    use_timestamps = strategy == TIMESTAMP_ALIGNMENT and time_data is not None
     channel_wise_warped_phases = {}
     for i in range(1, 51):
         try:
-            warped_rf1, warped_rf2 = dtw_matching(phase_data[0][i], phase_data[1][i])
+            if use_timestamps:
+                warped_rf1, warped_rf2 = timestamp_matching(time_data[0][i], phase_data[0][i],
+                                                            time_data[1][i], phase_data[1][i],
+                                                            tolerance, interpolate)
+            else:
+                warped_rf1, warped_rf2 = dtw_matching(phase_data[0][i], phase_data[1][i])
             channel_wise_warped_phases[i] = [warped_rf1, warped_rf2]
         except Exception as e:
             pass
@@ -78,6 +99,57 @@ def dtw_matching(sequence1, sequence2):
 
     return (warped_sequence1, warped_sequence2)
 
+def timestamp_matching(times1, sequence1, times2, sequence2, tolerance=DEFAULT_TOLERANCE_MS,
+                       interpolate=False):
+    """
+        Pairs two sequences by nearest read time.
+
+        Parameters:
+        - times1 (list): The read timestamps (ms, sorted) of sequence 1.
+        - sequence1 (list): The first sequence.
+        - times2 (list): The read timestamps (ms, sorted) of sequence 2.
+        - sequence2 (list): The second sequence.
+        - tolerance (float): Maximum time gap (ms) between two paired samples.
+        - interpolate (bool): Linearly interpolate sequence 2 at the times of sequence 1
+        instead of taking its nearest sample.
+
+        Returns:
+        - warped_sequence1 (list): The paired samples of sequence 1.
+        - warped_sequence2 (list): The paired samples of sequence 2.
+
+        Description:
+        - The `timestamp_matching` function is a cheap alternative to `dtw_matching` for tags
+        read on the same channel hop. Every sample of sequence 1 is paired with the sample of
+        sequence 2 closest in time, found with a single merge (`np.searchsorted`) over the sorted
+        timestamps. Samples with no counterpart within `tolerance` are dropped.
+
+        - The result has the same structure as `dtw_matching`, so it can be fed to
+        `phase_difference` unchanged.
+
+        Example:
+         timestamp_matching([0, 10, 20], [1, 2, 3], [1, 12, 60], [4, 5, 6], tolerance=5)
+        ([1.0, 2.0], [4.0, 5.0])
+    """
+    times1 = np.asarray(times1, dtype=np.float64)
+    times2 = np.asarray(times2, dtype=np.float64)
+    sequence1 = np.asarray(sequence1, dtype=np.float64)
+    sequence2 = np.asarray(sequence2, dtype=np.float64)
+    if not len(times1) or not len(times2):
+        return ([], [])
+
+    # nearest sample of sequence 2 for every sample of sequence 1
+    right = np.clip(np.searchsorted(times2, times1), 0, len(times2) - 1)
+    left = np.clip(right - 1, 0, len(times2) - 1)
+    nearest = np.where(np.abs(times2[left] - times1) <= np.abs(times2[right] - times1), left, right)
+    paired = np.abs(times2[nearest] - times1) <= tolerance
+
+    if interpolate:
+        matched2 = np.interp(times1, times2, sequence2)
+    else:
+        matched2 = sequence2[nearest]
+
+    return (sequence1[paired].tolist(), matched2[paired].tolist())
+
 def phase_difference(channel_wise_warped_phases):
     """
         Calculates the absolute phase difference between two warped RF1 and RF2 phases for each channel.
@@ -141,4 +213,25 @@ def clean_phase_difference(phase_difference):
                 phase_difference[channel][i] = abs(diff_list[i] - 360)
             elif (diff_list[i] > 135):
                 phase_difference[channel][i] = abs(diff_list[i] - 180)
-    return phase_difference
\ No newline at end of file
+    return phase_difference
+
+def fold_phase_difference(phase_differences):
+    """
+        Folds live differential phase estimates into the (-150, 150] degrees range.
+
+        Parameters:
+        - phase_differences (ndarray): Differential phase estimates in degrees, as returned by
+        `PhasePairer.update`.
+
+        Returns:
+        - folded (ndarray): The folded estimates.
+
+        Description:
+        - Estimates larger than 300 degrees in absolute value are brought back by 360 degrees
+        (phase wrap), then the ones larger than 150 degrees by 180 degrees (Impinj pi jumps),
+        as the real-time GUI does.
+    """
+    folded = np.asarray(phase_differences, dtype=np.float64)
+    folded = np.where(np.abs(folded) > 300, folded - np.sign(folded) * 360, folded)
+    folded = np.where(np.abs(folded) > 150, folded - np.sign(folded) * 180, folded)
+    return folded
@@ -6,7 +6,10 @@ from sys import exit, argv
 from PyQt5 import QtWidgets
 
 from Gui import Gui
+from LiveView import LiveView
 from params import STORE_DATA
+from params import SENSORS, SENSOR_DEF
+from params import LIVE_VIEW, LIVE_VIEW_INTERVAL_MS
 
 def main():
     # Add codes for arduino command
@@ -30,6 +33,10 @@ def main():
     # sleep(5)
     gui = Gui(fname)
     gui.show()
+    if LIVE_VIEW:
+        live_view = LiveView(gui.event_bus, gui.report_parser, SENSORS[SENSOR_DEF]["EPC"],
+                             LIVE_VIEW_INTERVAL_MS)
+        live_view.show()
     # app.exec_()
     sleep(1)
     gui.connect()
@@ -6,8 +6,13 @@ import scipy
 import os
 import json
 
-from params import DATA_DIR, STORE_DATA
+from params import DATA_DIR, STORE_DATA, COMPACT_COMPRESSION
 from params import SENSORS, SENSOR_DEF
+from params import ALIGNMENT_STRATEGY, ALIGNMENT_TOLERANCE_MS, ALIGNMENT_INTERPOLATE
+
+from phase_calculation_functions import phase_resolution, phase_difference, clean_phase_difference
+from phase_calculation_functions import TIMESTAMP_ALIGNMENT
+from session_encoding_functions import history_columns, encode_session, decode_raw_data
 
 data_dir = DATA_DIR
 store_data = STORE_DATA
@@ -51,11 +56,12 @@ def get_raw_data_per_rf(prev_history, real_time = False):
     """
     data_window = real_time_data_window * 35
     if (real_time):
-      diffs = prev_history.diffs_degrees[-data_window:]
+      # the derived columns are only computed over the window
+      diffs = prev_history.column('diffs_degrees', -data_window).tolist()
       rssis = prev_history.rssis[-data_window:]
       channels = prev_history.channels[-data_window:]
       timestamps = prev_history.times[-data_window:]
-      phases_degrees = prev_history.phases_degrees[-data_window:]
+      phases_degrees = prev_history.column('phases_degrees', -data_window).tolist()
     else:
       diffs = prev_history.diffs_degrees
       rssis = prev_history.rssis
@@ -114,19 +120,95 @@ def channel_wise_data_per_rf(prev_history, real_time = False):
 
     return rf_data
 
+def channel_wise_timestamps_per_rf(prev_history, real_time = False):
+    """
+    Organizes the read timestamps per RF into a channel-wise dictionary.
+
+    Parameters:
+    - prev_history (object): A previous history object containing data.
+    - real_time (boolean): Boolean that defines if real-time data is needed or all-time
+
+    Returns:
+    - rf_times (dict): A dictionary containing channel-wise timestamps per RF.
+
+    Description:
+    - Same layout as `channel_wise_data_per_rf`, with the timestamp of each read in place of
+      its phase, so both can be passed together to the timestamp alignment of `phase_resolution`.
+
+    Example:
+     prev_history = PreviousHistory()
+     channel_wise_timestamps_per_rf(prev_history)
+    {1: [timestamp_1, timestamp_2, ...],
+     2: [timestamp_3, timestamp_4, ...],
+     ...}
+    """
+
+    rf_times = {}
+
+    raw_data = get_raw_data_per_rf(prev_history, real_time)
+
+    channel_data = raw_data['channels']
+    time_data    = raw_data['timestamps']
+
+    for i in range(len(channel_data)):
+        try:
+            rf_times[channel_data[i]].append(time_data[i])
+        except:
+            rf_times[channel_data[i]] = [time_data[i]]
+
+    return rf_times
+
+def real_time_phase_separation(prev_history_1, prev_history_2):
+    """
+    Computes the channel-wise phase differences of the two tags of a sensor over the real-time window.
+
+    Parameters:
+    - prev_history_1 (object): The history of the sensing tag.
+    - prev_history_2 (object): The history of the reference tag.
+
+    Returns:
+    - phase_separation (list): The cleaned phase differences of all channels.
+
+    Description:
+    - The channel-wise phases of the real-time window of both tags are aligned with the
+      `ALIGNMENT_STRATEGY` of `params.py`, then differenced and cleaned. This is the value the
+      real-time GUI plots (its mean), whichever process computes it.
+    - The window of each tag is read under the lock of its history, so reads added meanwhile by the
+      report callback never mix into it; the alignment runs on these copies, without the locks.
+    """
+
+    channel_wise_data = []
+    channel_wise_times = [] if ALIGNMENT_STRATEGY == TIMESTAMP_ALIGNMENT else None
+    for history in (prev_history_1, prev_history_2):
+        with history.data_lock:
+            channel_wise_data.append(channel_wise_data_per_rf(history, True))
+            if channel_wise_times is not None:
+                channel_wise_times.append(channel_wise_timestamps_per_rf(history, True))
+
+    channel_wise_warped_phases = phase_resolution(channel_wise_data, ALIGNMENT_STRATEGY,
+                                                  channel_wise_times, ALIGNMENT_TOLERANCE_MS,
+                                                  ALIGNMENT_INTERPOLATE)
+
+    phase_diff = phase_difference(channel_wise_warped_phases)
+
+    cleaned_phase_diff = clean_phase_difference(phase_diff)
+
+    return [diff for sublist in cleaned_phase_diff.values() for diff in sublist]
+
 def get_date_string():
     now = datetime.datetime.now()
     date_string = now.strftime("%d%m%Y_%H%M%S")
 
     return date_string
 
-def store_raw_data_as_json(raw_data, fname):
+def store_raw_data_as_json(raw_data, fname, date_string=None):
     """
     Stores raw data as a JSON file.
 
     Parameters:
     - raw_data (dict): A dictionary containing the raw data.
     - fname (str): The base name for the JSON file.
+    - date_string (str): The timestamp of the filename, the current date if None.
 
     Returns:
     - None
@@ -158,7 +240,8 @@ def store_raw_data_as_json(raw_data, fname):
     (JSON file named "data_<date>_raw.json" is created with the raw data)
     """
 
-    date_string = get_date_string()
+    if date_string is None:
+        date_string = get_date_string()
 
     json_dir = os.path.join(data_dir, "json")
     raw_json_name = fname + "_" + date_string + "_raw" + ".json"
@@ -170,13 +253,14 @@ def store_raw_data_as_json(raw_data, fname):
     else:
         print("Raw data not captured")
 
-def store_channelwise_data_as_json(channel_wise_data, fname):
+def store_channelwise_data_as_json(channel_wise_data, fname, date_string=None):
     """
     Stores channel-wise data as a JSON file.
 
     Parameters:
     - channel_wise_data (list): A list containing channel-wise data.
     - fname (str): The base name for the JSON file.
+    - date_string (str): The timestamp of the filename, the current date if None.
 
     Returns:
     - None
@@ -206,7 +290,8 @@ def store_channelwise_data_as_json(channel_wise_data, fname):
     (JSON file named "data_<date>.json" is created with the channel-wise data)
     """
 
-    date_string = get_date_string()
+    if date_string is None:
+        date_string = get_date_string()
 
     json_dir = os.path.join(data_dir, "json")
     json_name = fname + "_" + date_string + ".json"
@@ -218,13 +303,14 @@ def store_channelwise_data_as_json(channel_wise_data, fname):
     else:
         print("Channelwise data not captured")
 
-def store_raw_data_as_mat(raw_data, fname):
+def store_raw_data_as_mat(raw_data, fname, date_string=None):
     """
     Stores raw data as a MATLAB .mat file.
 
     Parameters:
     - raw_data (list): A list containing raw data for each channel.
     - fname (str): The base name for the MATLAB .mat file.
+    - date_string (str): The timestamp of the filenames, the current date if None.
 
     Returns:
     - None
@@ -254,7 +340,8 @@ def store_raw_data_as_mat(raw_data, fname):
     (MATLAB .mat files named "data_<date>.mat" and "data_<date>_diff.mat" are created with the raw data)
     """
     
-    date_string = get_date_string()
+    if date_string is None:
+        date_string = get_date_string()
 
     mat_dir = os.path.join(data_dir, "matlab")
     base_mat_name = fname + "_" + date_string
@@ -267,4 +354,42 @@ def store_raw_data_as_mat(raw_data, fname):
     # For channel-2
     mat_name_diff = base_mat_name + "_diff" + ".mat"
     mat_path_diff = os.path.join(mat_dir, mat_name_diff)
-    scipy.io.savemat(mat_path_diff, mdict = raw_data[1])
\ No newline at end of file
+    scipy.io.savemat(mat_path_diff, mdict = raw_data[1])
+
+def store_raw_data_as_compact(histories, fname, date_string=None, compression=COMPACT_COMPRESSION):
+    """
+    Stores the raw reads of both RFs in a single compact binary file.
+
+    Parameters:
+    - histories (list): The TagHistory of each RF.
+    - fname (str): The base name of the file.
+    - date_string (str): The timestamp of the filename, the current date if None.
+    - compression (str): "none", "gzip" or "zstd", see `encode_session`.
+
+    Description:
+    - Only the raw reads are stored (uint16 phase counts, delta-coded timestamps, uint8
+      channels and int16 centi-dB RSSIs), `load_raw_data_from_compact` derives the same
+      raw data as `get_raw_data_per_rf` from them.
+
+    - The file is written to `<data_dir>/compact/<fname>_<date>.rfs`.
+    """
+
+    if date_string is None:
+        date_string = get_date_string()
+
+    compact_dir = os.path.join(data_dir, "compact")
+    os.makedirs(compact_dir, exist_ok=True)
+    compact_path = os.path.join(compact_dir, fname + "_" + date_string + ".rfs")
+
+    data = encode_session([history_columns(history) for history in histories], compression)
+    with open(compact_path, "wb") as compactfile:
+        compactfile.write(data)
+
+def load_raw_data_from_compact(compact_path):
+    """
+    Loads a compact session file as the list of the raw data of its RFs, the dictionaries
+    of `get_raw_data_per_rf`.
+    """
+
+    with open(compact_path, "rb") as compactfile:
+        return decode_raw_data(compactfile.read())
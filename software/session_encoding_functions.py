@@ -0,0 +1,166 @@
+import gzip
+import struct
+import numpy as np
+
+from TagHistory import TagHistory
+from ReportParser import REPORT_DTYPE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compact session file: a header followed by one block, optionally compressed,
+# holding the columns of each RF one after the other
+MAGIC = b'RFS'
+VERSION = 1
+# magic, version, compression, number of RFs
+HEADER = struct.Struct('<3sBBB')
+# reads, first timestamp (ms), dtype of the timestamp deltas
+RF_HEADER = struct.Struct('<Iqc')
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+# RSSI resolution of the stored values
+RSSI_SCALE = 100
+
+def _delta_dtype(deltas):
+    # narrowest signed type holding every delta
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if not len(deltas) or (deltas.min() >= info.min and deltas.max() <= info.max):
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def history_columns(history):
+    """
+    Returns the raw reads of a TagHistory as the columns of the compact encoding.
+
+    Returns:
+    - columns (dict): 'times' (int64 ms), 'channels' (uint8), 'phases' (uint16 raw
+      ImpinjRFPhaseAngle counts, 0 when not reported) and 'rssis' (int16 centi-dB).
+    """
+    with history.data_lock:
+        times = np.array(history.times, dtype=np.int64)
+        channels = np.array(history.channels, dtype=np.uint8)
+        phases = np.rint(np.array(history.phase_counts, dtype=np.float64))
+        rssis = np.rint(np.array(history.rssis, dtype=np.float64) * RSSI_SCALE)
+    return {'times': times, 'channels': channels,
+            'phases': phases.astype(np.uint16), 'rssis': rssis.astype(np.int16)}
+
+def encode_session(rf_columns, compression="gzip"):
+    """
+    Encodes the columns of the RFs of a session.
+
+    Parameters:
+    - rf_columns (list): One dictionary of columns per RF, see `history_columns`.
+    - compression (str): "none", "gzip" or "zstd" (needs the `zstandard` package).
+
+    Returns:
+    - data (bytes): The encoded session.
+
+    Description:
+    - Timestamps are stored as the first timestamp and the deltas between reads, in the
+      narrowest integer type holding them (usually one byte per read), channels as uint8,
+      phases as uint16 raw counts and RSSIs as int16 centi-dB, so a read takes about 6 bytes
+      before compression instead of about 100 in the raw JSON.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression: %s" % compression)
+    if compression == "zstd" and zstandard is None:
+        raise ImportError("zstd compression needs the `zstandard` package")
+
+    chunks = []
+    for columns in rf_columns:
+        times = np.asarray(columns['times'], dtype=np.int64)
+        deltas = np.diff(times)
+        delta_dtype = _delta_dtype(deltas)
+        first_time = int(times[0]) if len(times) else 0
+        chunks.append(RF_HEADER.pack(len(times), first_time, delta_dtype.char.encode()))
+        chunks.append(deltas.astype(delta_dtype.newbyteorder('<')).tobytes())
+        chunks.append(np.asarray(columns['channels'], dtype=np.uint8).tobytes())
+        chunks.append(np.asarray(columns['phases'], dtype='<u2').tobytes())
+        chunks.append(np.asarray(columns['rssis'], dtype='<i2').tobytes())
+    block = b''.join(chunks)
+
+    if compression == "gzip":
+        block = gzip.compress(block)
+    elif compression == "zstd":
+        block = zstandard.ZstdCompressor().compress(block)
+    header = HEADER.pack(MAGIC, VERSION, COMPRESSIONS.index(compression), len(rf_columns))
+    return header + block
+
+def decode_session(data):
+    """
+    Decodes an encoded session back into the columns of its RFs.
+
+    Returns:
+    - rf_columns (list): One dictionary of columns per RF, see `history_columns`.
+    """
+    magic, version, compression, n_rfs = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a version %d compact session" % VERSION)
+
+    block = data[HEADER.size:]
+    if COMPRESSIONS[compression] == "gzip":
+        block = gzip.decompress(block)
+    elif COMPRESSIONS[compression] == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression needs the `zstandard` package")
+        block = zstandard.ZstdDecompressor().decompress(block)
+
+    rf_columns = []
+    offset = 0
+    for _ in range(n_rfs):
+        n_reads, first_time, delta_char = RF_HEADER.unpack_from(block, offset)
+        offset += RF_HEADER.size
+        delta_dtype = np.dtype(delta_char.decode()).newbyteorder('<')
+        columns = {}
+        for name, dtype, count in (('deltas', delta_dtype, max(n_reads - 1, 0)),
+                                   ('channels', np.dtype(np.uint8), n_reads),
+                                   ('phases', np.dtype('<u2'), n_reads),
+                                   ('rssis', np.dtype('<i2'), n_reads)):
+            columns[name] = np.frombuffer(block, dtype, count, offset)
+            offset += dtype.itemsize * count
+
+        times = np.empty(n_reads, dtype=np.int64)
+        if n_reads:
+            times[0] = first_time
+            np.cumsum(columns.pop('deltas'), out=times[1:])
+            times[1:] += first_time
+        else:
+            columns.pop('deltas')
+        columns['times'] = times
+        rf_columns.append(columns)
+    return rf_columns
+
+def columns_history(columns, name=None):
+    """
+    Loads decoded columns into a TagHistory, which derives the unwrapped phases and
+    cumulative diffs exactly as it did while the session was recorded.
+    """
+    history = TagHistory(name)
+    reads = np.zeros(len(columns['times']), dtype=REPORT_DTYPE)
+    reads['first_seen'] = columns['times']
+    reads['channel'] = columns['channels']
+    reads['phase'] = columns['phases']
+    reads['doppler'] = np.nan
+    history.add_batch(reads)
+
+    rssis = columns['rssis'] / RSSI_SCALE
+    # RSSIs reported in whole dBm are decoded as ints, as they were stored
+    if np.all(rssis == np.round(rssis)):
+        rssis = rssis.astype(np.int64)
+    history.rssis[:] = rssis.tolist()
+    return history
+
+def decode_raw_data(data):
+    """
+    Decodes an encoded session into the raw data of its RFs, the dictionaries of
+    `get_raw_data_per_rf` ('timestamps', 'channels', 'diffs', 'rssis', 'raw_phases').
+    """
+    # imported here, rf_data_collection_functions stores the sessions with this module
+    from rf_data_collection_functions import get_raw_data_per_rf
+
+    return [get_raw_data_per_rf(columns_history(columns))
+            for columns in decode_session(data)]
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import socket
+import struct
+from sys import argv
+
+from StreamPublisher import decode_packet
+from params import STREAM_GROUP, STREAM_PORT
+from params import SENSORS, SENSOR_DEF
+from classification_functions import threshold_edges
+
+def main():
+    # reference subscriber of the stream of a collection process (STREAM_ENABLED)
+    group = argv[1] if len(argv) > 1 else STREAM_GROUP
+    port = int(argv[2]) if len(argv) > 2 else STREAM_PORT
+    labels, _ = threshold_edges(SENSORS[SENSOR_DEF]["classification"])
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('', port))
+    membership = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton('0.0.0.0'))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    print(f"Listening to {group}:{port}")
+
+    expected_seq = None
+    lost = 0
+    while True:
+        packet, _ = sock.recvfrom(65535)
+        topic, seq, payload = decode_packet(packet)
+        if expected_seq is not None and seq != expected_seq:
+            lost += (seq - expected_seq) & 0xFFFFFFFF
+            print(f"{lost} packets lost so far")
+        expected_seq = (seq + 1) & 0xFFFFFFFF
+
+        if topic.name == "diff_phase":
+            print(f"[{seq}] diff phase: {len(payload)} samples, "
+                  f"last {payload['diff_phase'][-1]:.1f} deg at {payload['time'][-1]} ms")
+        else:
+            category = payload['category'][-1]
+            label = labels[category] if category < len(labels) else "unclassified"
+            print(f"[{seq}] classification: {label}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from params import SENSORS
+
+# Bit address of the EPC in the EPC memory bank, after the CRC and PC words
+EPC_POINTER = 0x20
+# Bits per hex digit of an EPC
+BITS_PER_DIGIT = 4
+
+def shared_run(epcs):
+    """
+        Returns the longest run of hex digits all EPCs share at the same position.
+
+        Parameters:
+        - epcs (list): The hex EPCs.
+
+        Returns:
+        - (offset, run) (tuple): The offset of the run in hex digits from the start of
+        the EPCs and the run, (0, '') if they share no digit at the same position.
+
+        Example:
+         shared_run(["ECECFB63AC1F", "CECEFB63AC1F"])
+        (4, 'FB63AC1F')
+    """
+    epcs = [epc.upper() for epc in epcs]
+    if not epcs:
+        return (0, '')
+    best = (0, '')
+    start = 0
+    length = min(len(epc) for epc in epcs)
+    for i in range(length + 1):
+        if i == length or any(epc[i] != epcs[0][i] for epc in epcs[1:]):
+            if i - start > len(best[1]):
+                best = (start, epcs[0][start:i])
+            start = i + 1
+    return best
+
+def sensor_filter_masks(sensor_names):
+    """
+        Returns the Select masks singulating the tags of the given sensors.
+
+        Parameters:
+        - sensor_names (list): Keys of `SENSORS`.
+
+        Returns:
+        - masks (list): (pointer, mask) tuples, the bit address of the mask in the EPC
+        memory bank and the hex mask. A single mask, or an empty list if the EPCs share
+        no digit at the same position.
+
+        Description:
+        - The EPCs of the two tags of a sensor differ in their first bytes and share a
+        long suffix, so the mask is the longest run of digits they share, wherever it
+        is, addressed with a bit pointer.
+        - A single mask: the reader applies the default Select/Unselect action of each
+        filter in turn, so a tag matched by one mask would be unselected by the next.
+    """
+    epcs = [epc for name in sensor_names for epc in SENSORS[name]["EPC"]]
+    offset, run = shared_run(epcs)
+    if not run:
+        return []
+    return [(EPC_POINTER + offset * BITS_PER_DIGIT, run)]
+
+def select_masks(masks):
+    """
+        Normalizes filter masks to (pointer, mask) tuples, a plain hex string being an
+        EPC prefix.
+    """
+    return [(EPC_POINTER, mask.upper()) if isinstance(mask, str) else (mask[0], mask[1].upper())
+            for mask in masks or []]
+
+def apply_select_filters(rospec, masks):
+    """
+        Sets the C1G2 filters of a sllurp ROSpec to the Selects of the masks.
+
+        Parameters:
+        - rospec (dict): The ROSpec built by sllurp (`LLRPClient.getROSpec`).
+        - masks (list): (pointer, mask) tuples or EPC prefixes.
+
+        Returns:
+        - rospec (dict): The same ROSpec, updated in place.
+
+        Description:
+        - sllurp only encodes EPC prefix masks (`tag_filter_mask`), at the start of the
+        EPC. The Selects of the masks are set on the ROSpec it builds instead, with their
+        own bit pointer, which sllurp encodes as it is.
+    """
+    filters = [{'C1G2TagInventoryMask': {'MB': 1,   # EPC memory bank
+                                         'Pointer': pointer,
+                                         'TagMask': mask}}
+               for pointer, mask in select_masks(masks)]
+    for aispec in rospec['AISpec']:
+        for inventory_spec in aispec['InventoryParameterSpec']:
+            for antenna_config in inventory_spec['AntennaConfiguration']:
+                for command in antenna_config['C1G2InventoryCommand']:
+                    if filters:
+                        command['C1G2Filter'] = filters
+                    else:
+                        command.pop('C1G2Filter', None)
+    return rospec
+
+def matches_filter(epc, masks):
+    """
+        Tells whether a reader applying the filter masks may report a tag.
+        An empty mask list does not filter anything.
+    """
+    epc = epc.upper()
+    for pointer, mask in select_masks(masks):
+        start = (pointer - EPC_POINTER) // BITS_PER_DIGIT
+        if epc[start:start + len(mask)] == mask:
+            return True
+    return not masks